@@ -1,18 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.security import HTTPAuthorizationCredentials, OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 
-from ..database import get_db
+from ..database import get_async_db
+from ..middleware.auth import security
 from ..models import User, LearningRecord
 from ..config import settings
+from ..services.password_hasher import password_hasher, HasherSaturated
+from ..services.token_cache import revocation_sync, token_cache
+from ..services.user_stats import record_learning_event
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
@@ -33,12 +36,27 @@ class UserResponse(BaseModel):
     email: str
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    """在密码哈希进程池中校验 - 饱和时返回 503 并附带 Retry-After"""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HasherSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Service busy, please try again later.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    try:
+        return await password_hasher.hash(password)
+    except HasherSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Service busy, please try again later.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
 
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
@@ -54,11 +72,12 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 
 
 @router.post("/register", response_model=UserResponse)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # 检查用户是否已存在
-    db_user = db.query(User).filter(
+    result = await db.execute(select(User).filter(
         (User.username == user.username) | (User.email == user.email)
-    ).first()
+    ).limit(1))
+    db_user = result.scalars().first()
 
     if db_user:
         raise HTTPException(
@@ -67,7 +86,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
         )
 
     # 创建新用户
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = User(
         username=user.username,
         email=user.email,
@@ -75,17 +94,18 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     )
 
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
 
     return db_user
 
 
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     # 验证用户
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    result = await db.execute(select(User).filter(User.username == form_data.username).limit(1))
+    user = result.scalars().first()
+    if not user or not await verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
@@ -103,9 +123,30 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
             event_type="login",
             content="User logged in"
         )
-        db.add(record)
-        db.commit()
+        await record_learning_event(db, record)
+        await db.commit()
     except Exception as e:
         print(f"Failed to log login event: {e}")
 
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+@router.post("/logout")
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(security),
+                 db: AsyncSession = Depends(get_async_db)):
+    """
+    吊销当前 Token，之后携带它的请求返回 401 (直到 Token 本身过期)
+
+    本进程立即生效；其他 worker 在下一次同步吊销列表后 (JWT_REVOCATION_SYNC_INTERVAL 秒内) 生效。
+    """
+    try:
+        payload = token_cache.decode(credentials.credentials)
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+    token_cache.revoke(credentials.credentials, payload)
+    await revocation_sync.publish(db, credentials.credentials, payload)
+    await db.commit()
+    return {"status": "success"}
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, WebSocket, WebSocketDisconnect, Query
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from typing import List, Optional
 import httpx
 import json
@@ -10,17 +11,34 @@ import base64
 from datetime import datetime
 from pathlib import Path
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 import asyncio
-from openai import AsyncOpenAI
-from jose import JWTError, jwt
+from jose import JWTError
 
-from ..database import get_db, SessionLocal
+from ..database import get_async_db, get_async_read_db, keyset_before, AsyncSessionLocal, AsyncReadSessionLocal
 from ..middleware.auth import verify_token
 from ..middleware.simple_rate_limit import check_rate_limit
 from ..config import settings
-from ..models import ChatMessage, ChatSession, LearningRecord
+from ..models import ChatArchive, ChatMessage, ChatSession, LearningRecord
+from ..services.conversation_summary import conversation_summarizer, recent_messages
+from ..services.message_search import search_messages
+from ..services.metrics import sse_streams_active, websocket_connections_active
+from ..services.request_trace import RequestTrace, current_trace, trace_span
+from ..services.session_archiver import archived_messages, rehydrate_session
+from ..services.session_purger import session_purger
+from ..services.token_cache import token_cache
+from ..services.usage_quota import (
+    usage_ledger, enforce_quota, usage_tokens, quota_windows, QuotaExceeded, RESOURCES, TOKENS, TTS_CHARS
+)
+from ..services.user_stats import bump_user_stats, record_learning_event
+from ..services.request_coalescer import request_coalescer
+from ..services.llm_router import llm_router
+from ..services.model_routing import choose_model, prompt_size, model_route_stats
+from ..services.llm_scheduler import (
+    llm_scheduler, acquire_llm_slot, SchedulerSaturated, PRIORITY_CHAT, PRIORITY_VOICE
+)
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -62,6 +80,99 @@ class UploadResponse(BaseModel):
     file_id: str
     url: str
 
+
+async def load_history_and_summary(sess_id):
+    """
+    获取会话的滚动摘要和最近的历史消息
+
+    返回 (summary, history)，history 为按消息顺序正序排列的 {"role", "content"} 列表，
+    窗口与摘要边界使用同一个查询 (recent_messages)；多取 1 条是因为当前请求的用户消息已经先存入了数据库。
+    """
+    if not sess_id:
+        return None, []
+    async with AsyncReadSessionLocal() as db_local:
+        summary = await db_local.scalar(select(ChatSession.summary).filter(ChatSession.id == sess_id))
+        result = await db_local.execute(recent_messages(
+            sess_id, settings.HISTORY_WINDOW + 1, ChatMessage.role, ChatMessage.content
+        ))
+        history_msgs = result.all()
+    history = [{"role": m.role, "content": m.content or ""} for m in history_msgs[::-1]]
+    return summary, history
+
+
+async def save_session_and_message(sess_id, uid, title, msg_content, role, mode=None):
+    """
+    保存一条消息 (会话不存在时自动创建)
+
+    用户提问同时记录一条 question_asked 学习事件 (用于看板)，三者在同一个事务中提交。
+    使用独立的数据库会话，流式响应结束后也可以安全调用。
+    """
+    async with AsyncSessionLocal() as db_local:
+        try:
+            # 1. 检查或创建会话
+            sess = await db_local.get(ChatSession, sess_id)
+            if sess and sess.deleted_at is not None:
+                # 会话已被删除 (例如在另一个窗口中)，不再写入，否则消息会被清理任务删掉且提问数无法扣回
+                logger.info(f"Skip saving message to deleted session {sess_id}")
+                return
+            if not sess:
+                # 新会话：使用用户消息的前几个字作为标题
+                sess = ChatSession(id=sess_id, user_id=uid, title=title)
+                if mode:
+                    sess.mode = mode
+                db_local.add(sess)
+            else:
+                # 旧会话：更新最后活跃时间 (复用会话时不修改 mode)
+                sess.updated_at = datetime.utcnow()
+                if sess.archived_at is not None:
+                    # 已归档的会话继续对话：先把消息恢复出来，历史窗口和摘要才能读到
+                    await rehydrate_session(db_local, sess_id)
+
+            # 2. 保存消息记录
+            db_local.add(ChatMessage(session_id=sess_id, role=role, content=msg_content))
+
+            # 3. 如果是用户提问，记录学习事件 (这里为了看板数据丰富，我们记录所有提问)
+            if role == "user":
+                await record_learning_event(db_local, LearningRecord(
+                    user_id=uid,
+                    event_type="question_asked",
+                    content=msg_content[:200], # 只存前200字
+                    category=sess.mode or "casual" # 提问按会话模式分类统计
+                ))
+                await bump_user_stats(db_local, uid, questions=1)
+
+            await db_local.commit()
+        except Exception as e:
+            logger.error(f"DB Error: {e}")
+
+
+def build_context_messages(history, current_input):
+    """
+    将历史记录转换为 LLM 上下文消息
+
+    - 排除与当前输入重复的最后一条用户消息 (当前消息会单独构建)
+    - 截断过长的历史消息，保证 Prompt 大小有上界
+    """
+    if history and history[-1]["role"] == "user" and history[-1]["content"] == current_input:
+        history = history[:-1]
+    max_chars = settings.HISTORY_MESSAGE_MAX_CHARS
+    context = []
+    for msg in history[-settings.HISTORY_WINDOW:]:
+        if msg["role"] == "system":
+            continue
+        content = msg["content"]
+        if len(content) > max_chars:
+            content = content[:max_chars] + "……"
+        context.append({"role": msg["role"], "content": content})
+    return context
+
+
+def with_summary(system_prompt, summary):
+    """把会话滚动摘要注入 System Prompt"""
+    if not summary:
+        return system_prompt
+    return f"{system_prompt}\n[此前对话摘要]：以下是本次会话较早内容的摘要，请结合它理解上下文。\n{summary}\n"
+
 @router.post("/upload", response_model=UploadResponse)
 async def upload_file(
     file: UploadFile = File(...),
@@ -88,7 +199,6 @@ async def upload_file(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-from fastapi.concurrency import run_in_threadpool
 from ..services.aliyun_tts import AliyunTTSService
 from fastapi.responses import Response
 
@@ -98,19 +208,32 @@ class TTSRequest(BaseModel):
 @router.post("/tts")
 async def tts(request: TTSRequest, token: dict = Depends(verify_token)):
     """
-    文本转语音 (阿里云NLS)
+    文本转语音 (阿里云NLS)，按字符数计入 TTS 配额
     """
+    user_id = int(token.get("sub"))
+    await enforce_quota(user_id, TTS_CHARS, len(request.text))
     audio_data = await AliyunTTSService.synthesize(request.text)
     if not audio_data:
         raise HTTPException(status_code=500, detail="TTS generation failed")
-    
+    usage_ledger.charge(user_id, tts_chars=len(request.text))
+
     return Response(content=audio_data, media_type="audio/mp3")
 
+
+@router.get("/usage")
+async def get_usage(token: dict = Depends(verify_token)):
+    """当前用户在各滚动窗口内的 Token / TTS 字符用量及限额"""
+    usage = await usage_ledger.usage(int(token.get("sub")))
+    return {
+        resource: {name: {"used": usage[resource][name], "limit": limit}
+                   for name, _, limit in quota_windows(resource)}
+        for resource in RESOURCES
+    }
+
 @router.post("/chat")
 async def chat(
         request: ChatRequest,
         token: dict = Depends(verify_token),
-        db: Session = Depends(get_db),
         rate_limit_ok: bool = Depends(check_rate_limit)
 ):
     """
@@ -119,71 +242,41 @@ async def chat(
     参数:
     - request: 包含用户消息、会话ID、文件等信息
     - token: JWT 认证 Token
-    - db: 数据库会话
+
+    数据库读写使用独立的异步会话 (流式响应结束后仍需保存回复)
     """
-    user_id = token.get("sub")
+    user_id = int(token.get("sub"))
     logger.info(f"Received chat request from user {user_id}: {request.message}")
 
     # --- 会话管理 ---
     # 如果没有提供 session_id，则生成一个新的 UUID
     current_session_id = request.session_id if request.session_id else str(uuid.uuid4())
     
-    # --- 数据库操作 (同步函数) ---
-    # 为了避免阻塞异步事件循环，将阻塞的数据库操作封装在同步函数中
-    def sync_save_session_and_message(sess_id, uid, title, msg_content, role, mode):
-        db_local = SessionLocal()
-        try:
-            # 1. 检查或创建会话
-            sess = db_local.query(ChatSession).filter(ChatSession.id == sess_id).first()
-            if not sess:
-                # 新会话：使用用户消息的前几个字作为标题
-                sess = ChatSession(id=sess_id, user_id=uid, title=title, mode=mode)
-                db_local.add(sess)
-            else:
-                # 旧会话：更新最后活跃时间
-                sess.updated_at = datetime.utcnow()
-                # 更新 mode (如果会话复用，通常不建议改 mode，但这里保持一致)
-                # sess.mode = mode 
-                
-            db_local.commit()
-            
-            # 2. 保存消息记录
-            msg = ChatMessage(session_id=sess_id, role=role, content=msg_content)
-            db_local.add(msg)
-            
-            # 3. 如果是用户提问，记录学习事件 (用于看板)
-            if role == "user":
-                # 简单判断：只有在 professional 模式下或者明确是提问时记录？
-                # 这里为了看板数据丰富，我们记录所有提问
-                record = LearningRecord(
-                    user_id=uid,
-                    event_type="question_asked",
-                    content=msg_content[:200] # 只存前200字
-                )
-                db_local.add(record)
-                
-            db_local.commit()
-        except Exception as e:
-            logger.error(f"DB Error: {e}")
-        finally:
-            db_local.close()
-
-    # 立即保存用户的消息到数据库
-    # 使用 run_in_threadpool 在线程池中执行同步函数
-    await run_in_threadpool(
-        sync_save_session_and_message,
-        current_session_id,
-        user_id,
-        request.message[:50], # 使用前50个字符作为会话标题
-        request.message,
-        "user",
-        request.mode
-    )
+    # --- 准入控制 ---
+    # 用量配额用完时返回 429，上游繁忙时返回 503 (都在保存消息之前，避免留下没有回复的提问)
+    await enforce_quota(user_id, TOKENS)
+    llm_slot = await acquire_llm_slot(user_id, PRIORITY_CHAT)
+
+    # 立即保存用户的消息到数据库 (异步数据库会话，不阻塞事件循环也不占用线程池)
+    with trace_span("save_user"):
+        await save_session_and_message(
+            current_session_id,
+            user_id,
+            request.message[:50], # 使用前50个字符作为会话标题
+            request.message,
+            "user",
+            request.mode
+        )
 
     # --- 生成器函数 (流式响应核心) ---
     async def generate():
         assistant_response = ""
-        
+        # 上游在最后一个 Chunk 中返回的实际用量
+        stream_usage = {}
+        # 中间件建立的请求追踪 (响应头之后的阶段在结尾的 timing 事件中返回)
+        trace = current_trace.get()
+        sse_streams_active.inc()
+
         try:
             # 1. 发送会话 ID 给前端 (这对新会话很重要，前端需要知道 ID 以便后续追加消息)
             yield f"data: {json.dumps({'event': 'session_update', 'session_id': current_session_id})}\n\n"
@@ -232,40 +325,15 @@ async def chat(
                     - 口语化，接地气，可以适当使用网络热梗（但不要过时）。
                     - 语气词使用要自然，不要每句话都加“呼...”。
                 """
-            messages.append({"role": "system", "content": system_prompt})
-            
-            # (B) 获取历史记录 (从数据库)
-            # 定义同步函数获取最近 10 条消息
-            def get_history(sess_id):
-                if not sess_id:
-                    return []
-                db_local = SessionLocal()
-                try:
-                    # 获取最近 11 条 (10条历史 + 1条当前刚存的)
-                    history_msgs = db_local.query(ChatMessage).filter(
-                        ChatMessage.session_id == sess_id
-                    ).order_by(ChatMessage.created_at.desc()).limit(11).all()
-                    
-                    return history_msgs[::-1] # 反转为时间正序
-                finally:
-                    db_local.close()
+            # (B) 获取滚动摘要和历史记录 (从数据库)
+            with trace_span("history"):
+                summary, history = await load_history_and_summary(current_session_id)
+            messages.append({"role": "system", "content": with_summary(system_prompt, summary)})
 
-            history = await run_in_threadpool(get_history, current_session_id)
-            
             # (C) 过滤重复的当前消息
             # 因为我们在前面已经把当前消息存入数据库了，所以 history 里可能包含了它
-            if history:
-                last_msg = history[-1]
-                # 如果数据库里最后一条消息就是当前请求的消息，则在构建 Context 时排除它
-                # (因为我们会在最后单独构建包含图片信息的 Current Message)
-                if last_msg.role == 'user' and last_msg.content == request.message:
-                    context_msgs = history[:-1]
-                else:
-                    context_msgs = history
-                    
-                for msg in context_msgs:
-                    if msg.role == 'system': continue
-                    messages.append({"role": msg.role, "content": msg.content})
+            # (我们会在最后单独构建包含图片信息的 Current Message)
+            messages.extend(build_context_messages(history, request.message))
             
             # (D) 构建当前消息 (支持多模态/图片)
             user_content = [{"type": "text", "text": request.message}]
@@ -280,7 +348,7 @@ async def chat(
                         file_path = UPLOAD_DIR / filename
                         
                         if file_path.exists():
-                            with open(file_path, "rb") as image_file:
+                            with trace_span("images"), open(file_path, "rb") as image_file:
                                 base64_image = base64.b64encode(image_file.read()).decode('utf-8')
                                 
                             ext = filename.split('.')[-1].lower()
@@ -299,26 +367,45 @@ async def chat(
 
             messages.append({"role": "user", "content": user_content if len(request.files) > 0 else request.message})
 
-            # 3. 初始化 OpenAI 客户端 (适配阿里云 Qwen)
-            client = AsyncOpenAI(
-                api_key=settings.LLM_API_KEY,
-                base_url=settings.LLM_BASE_URL
-            )
-            
-            # Debug: 打印发送给 LLM 的消息
-            logger.info(f"Sending messages to LLM: {json.dumps(messages, ensure_ascii=False)}")
-
-            # 4. 调用 LLM 并流式接收
-            response = await client.chat.completions.create(
-                model=settings.LLM_MODEL_NAME,
-                messages=messages,
-                stream=True,
-                temperature=0.7, # 增加随机性
-                presence_penalty=0.6, # 避免重复
-            )
-
-            async for chunk in response:
-                content = chunk.choices[0].delta.content
+            # Debug: 打印发送给 LLM 的消息 (完整 Prompt 可能含 Base64 图片，序列化很慢，只在 DEBUG 日志级别输出)
+            logger.info(f"Sending {len(messages)} messages to LLM ({prompt_size(messages)} chars, {len(user_content) - 1} images)")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"LLM messages: {json.dumps(messages, ensure_ascii=False)}")
+
+            # 3. 按请求形态选择模型：带图片走视觉模型，纯文本走更快更便宜的文本模型
+            route = choose_model(request.mode, has_images=len(user_content) > 1, prompt_chars=prompt_size(messages))
+            logger.info(f"Model route: {route}")
+
+            # 4. 调用 LLM 并流式接收 (多上游路由，首个 Token 之前失败会自动切换上游)
+            async def upstream():
+                route_timer = model_route_stats.timer(route)
+                try:
+                    response = llm_router.stream(
+                        messages,
+                        route=route.route,
+                        temperature=0.7, # 增加随机性
+                        presence_penalty=0.6, # 避免重复
+                    )
+                    async for chunk in response:
+                        if chunk.usage:
+                            stream_usage["usage"] = chunk.usage
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            route_timer.first_token()
+                            yield chunk.choices[0].delta.content
+                except Exception:
+                    route_timer.finish(ok=False)
+                    raise
+                route_timer.finish(usage=stream_usage.get("usage"))
+
+            # 纯文本请求可选地与同时到达的相同请求合并，共享同一个上游流
+            # (名额交给合并器：复用进行中的请求或缓存时立即释放，发起上游时随上游流结束才释放)
+            if not request.files and request_coalescer.enabled_for(request.mode):
+                coalesce_key = request_coalescer.make_key(request.mode, route.route, messages)
+                pieces = request_coalescer.stream(coalesce_key, upstream, slot=llm_slot)
+            else:
+                pieces = upstream()
+
+            async for content in pieces:
                 if content:
                     assistant_response += content
                     # SSE 格式: data: {json}\n\n
@@ -333,87 +420,194 @@ async def chat(
         except Exception as e:
             logger.error(f"Stream error: {e}")
             yield f"data: {json.dumps({'event': 'error', 'message': str(e)})}\n\n"
+        finally:
+            llm_slot.release()
+            sse_streams_active.dec()
             
         # 6. 保存 AI 回复到数据库 (完整内容)
         if current_session_id and assistant_response:
-            await run_in_threadpool(
-                sync_save_session_and_message,
-                current_session_id,
-                user_id,
-                request.message[:50], 
-                assistant_response,
-                "assistant",
-                request.mode
-            )
+            with trace_span("save_reply"):
+                await save_session_and_message(
+                    current_session_id,
+                    user_id,
+                    request.message[:50], 
+                    assistant_response,
+                    "assistant",
+                    request.mode
+                )
+            # 后台增量更新滚动摘要，不阻塞本次响应
+            conversation_summarizer.schedule(current_session_id)
+            # 按实际用量记账 (合并请求或上游未返回 usage 时按字符数估算)
+            usage_ledger.charge(user_id, tokens=usage_tokens(
+                stream_usage.get("usage"), prompt_size(messages), len(assistant_response), len(user_content) - 1
+            ))
+
+        # 7. 本轮各阶段耗时 (响应头中的 Server-Timing 只包含流开始之前的部分)
+        if trace is not None and settings.SERVER_TIMING_ENABLED:
+            yield f"data: {json.dumps({'event': 'timing', **trace.to_dict()}, ensure_ascii=False)}\n\n"
+
+    # 客户端在流开始前断开时生成器不会执行，由 background 兜底释放名额 (release 可重复调用)
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"X-Queue-Wait-Ms": str(int(llm_slot.queue_wait * 1000))},
+        background=BackgroundTask(llm_slot.release)
+    )
+
 
-    return StreamingResponse(generate(), media_type="text/event-stream")
+
+def encode_cursor(at: datetime, key) -> str:
+    """把分页位置 (时间戳, id) 编码为不透明的游标字符串"""
+    raw = json.dumps([at.isoformat(), key]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_type: type):
+    try:
+        at, key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(key, key_type):
+            raise ValueError("cursor key type")
+        return datetime.fromisoformat(at), key
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
+def page_limit(limit: Optional[int], default: int) -> int:
+    return min(limit or default, settings.PAGE_SIZE_MAX)
+
 
 @router.get("/sessions")
 async def get_sessions(
         mode: str = Query("casual", description="Session mode: casual or professional"),
+        limit: Optional[int] = Query(None, ge=1, description="Page size"),
+        cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
         token: dict = Depends(verify_token),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_read_db)
 ):
-    """获取用户的所有会话 (根据 mode 过滤)"""
-    user_id = token.get("sub")
-    
-    # 兼容旧数据：如果 mode 是 casual，则查询 casual 或 NULL
-    if mode == "casual":
-        sessions = db.query(ChatSession).filter(
-            ChatSession.user_id == user_id,
-            (ChatSession.mode == "casual") | (ChatSession.mode == None)
-        ).order_by(ChatSession.updated_at.desc()).all()
-    else:
-        sessions = db.query(ChatSession).filter(
-            ChatSession.user_id == user_id,
-            ChatSession.mode == mode
-        ).order_by(ChatSession.updated_at.desc()).all()
+    """
+    分页获取用户的会话列表 (根据 mode 过滤，最近活跃的在前)
 
-    return sessions
+    只查询列表展示需要的列 (不带 summary 等大字段)；next_cursor 为空表示没有更多。
+    """
+    user_id = int(token.get("sub"))
+    limit = page_limit(limit, settings.SESSION_PAGE_SIZE)
+
+    # 旧数据中为 NULL 的 mode 已由迁移回填为 casual
+    query = select(
+        ChatSession.id, ChatSession.title, ChatSession.mode, ChatSession.created_at, ChatSession.updated_at
+    ).filter(
+        ChatSession.user_id == user_id,
+        ChatSession.mode == mode,
+        ChatSession.deleted_at.is_(None)
+    )
+    if cursor:
+        query = query.filter(keyset_before(ChatSession.updated_at, ChatSession.id, decode_cursor(cursor, str)))
+    result = await db.execute(query.order_by(ChatSession.updated_at.desc(), ChatSession.id.desc()).limit(limit + 1))
+    rows = result.all()
+
+    next_cursor = encode_cursor(rows[limit - 1].updated_at, rows[limit - 1].id) if len(rows) > limit else None
+    return {"items": [dict(row._mapping) for row in rows[:limit]], "next_cursor": next_cursor}
 
 
 @router.get("/messages/{session_id}")
 async def get_messages(
         session_id: str,
+        limit: Optional[int] = Query(None, ge=1, description="Page size"),
+        cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+        token: dict = Depends(verify_token),
+        db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    分页获取指定会话的消息
+
+    第一页为最新的 limit 条，next_cursor 指向更早的消息 (向上翻页)；每页内按时间正序返回。
+    只返回当前用户自己的、未删除的会话中的消息 (已删除会话的消息在清理完成前仍在表中)。
+    已归档的会话从 chat_archives 解压后按同样的顺序分页，对调用方透明。
+    """
+    user_id = int(token.get("sub"))
+    limit = page_limit(limit, settings.MESSAGE_PAGE_SIZE)
+    before = decode_cursor(cursor, int) if cursor else None
+    sess = (await db.execute(select(ChatSession.archived_at).filter(
+        ChatSession.id == session_id,
+        ChatSession.user_id == user_id,
+        ChatSession.deleted_at.is_(None)
+    ))).first()
+    if sess is None:
+        return {"items": [], "next_cursor": None}
+
+    if sess.archived_at is not None:
+        rows = sorted(await archived_messages(db, session_id), key=lambda m: (m["created_at"], m["id"]), reverse=True)
+        if before:
+            rows = [m for m in rows if (m["created_at"], m["id"]) < before]
+        rows = rows[:limit + 1]
+    else:
+        query = select(
+            ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at
+        ).filter(ChatMessage.session_id == session_id)
+        if before:
+            query = query.filter(keyset_before(ChatMessage.created_at, ChatMessage.id, before))
+        result = await db.execute(query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit + 1))
+        rows = [dict(row._mapping) for row in result.all()]
+
+    next_cursor = encode_cursor(rows[limit - 1]["created_at"], rows[limit - 1]["id"]) if len(rows) > limit else None
+    return {"items": rows[:limit][::-1], "next_cursor": next_cursor}
+
+
+@router.get("/search")
+async def search_history(
+        q: str = Query(..., min_length=1, description="Search terms, separated by spaces"),
+        limit: Optional[int] = Query(None, ge=1, description="Page size"),
+        offset: int = Query(0, ge=0),
         token: dict = Depends(verify_token),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_read_db)
 ):
-    """获取指定会话的所有消息"""
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.session_id == session_id
-    ).order_by(ChatMessage.created_at).all()
+    """在当前用户的聊天记录中全文搜索，结果按相关度排序；next_offset 为空表示没有更多"""
+    user_id = int(token.get("sub"))
+    limit = page_limit(limit, settings.SEARCH_PAGE_SIZE)
+    items, has_more = await search_messages(db, user_id, q, limit, offset)
+    return {"items": items, "next_offset": offset + limit if has_more else None}
 
-    return messages
 
 @router.delete("/sessions/{session_id}")
 async def delete_session(
         session_id: str,
         token: dict = Depends(verify_token),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    """删除指定会话"""
-    user_id = token.get("sub")
-    session = db.query(ChatSession).filter(
+    """
+    删除指定会话
+
+    只把会话标记为已删除后立即返回，消息由后台任务 session_purger 分批清理。
+    """
+    user_id = int(token.get("sub"))
+    # 带 deleted_at IS NULL 条件的更新：并发的重复删除只有一个会生效，不会重复扣减提问数
+    result = await db.execute(update(ChatSession).filter(
         ChatSession.id == session_id,
-        ChatSession.user_id == user_id
-    ).first()
+        ChatSession.user_id == user_id,
+        ChatSession.deleted_at.is_(None)
+    ).values(deleted_at=datetime.utcnow(), updated_at=ChatSession.updated_at))
 
-    if not session:
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    # 删除会话（级联删除消息）
-    db.delete(session)
-    db.commit()
-
+    # 看板的提问数只统计现存会话中的消息，删除会话时同步扣减
+    user_questions = await db.scalar(select(func.count(ChatMessage.id)).filter(
+        ChatMessage.session_id == session_id,
+        ChatMessage.role == "user"
+    ))
+    # 已归档会话的消息不在 chat_messages 中，提问数记在归档行上
+    user_questions += await db.scalar(select(ChatArchive.question_count).filter(
+        ChatArchive.session_id == session_id
+    )) or 0
+    if user_questions:
+        await bump_user_stats(db, user_id, questions=-user_questions)
+    await db.commit()
+
+    session_purger.wake()
     return {"status": "success", "message": "Session deleted"}
 
 
-from ..services.gesture_recognition import GestureRecognizer
-
-# Initialize global recognizer
-gesture_recognizer = GestureRecognizer()
+from ..services.vision import vision_stack
 
 @router.websocket("/ws/chat/{session_id}")
 async def websocket_chat(
@@ -425,66 +619,32 @@ async def websocket_chat(
     
     # 1. Verify Token
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id = payload.get("sub")
-    except JWTError:
+        payload = token_cache.decode(token)
+        user_id = int(payload.get("sub"))
+    except (JWTError, TypeError, ValueError):
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
 
-    # 2. Helper for DB (Sync) - Reused
-    def sync_save_session_and_message(sess_id, uid, title, msg_content, role):
-        db_local = SessionLocal()
-        try:
-            sess = db_local.query(ChatSession).filter(ChatSession.id == sess_id).first()
-            if not sess:
-                sess = ChatSession(id=sess_id, user_id=uid, title=title)
-                db_local.add(sess)
-            else:
-                sess.updated_at = datetime.utcnow()
-            db_local.commit()
-            
-            msg = ChatMessage(session_id=sess_id, role=role, content=msg_content)
-            db_local.add(msg)
-            
-            # Record Learning Event for Dashboard
-            if role == "user":
-                record = LearningRecord(
-                    user_id=uid,
-                    event_type="question_asked",
-                    content=msg_content[:200]
-                )
-                db_local.add(record)
-                
-            db_local.commit()
-        except Exception as e:
-            logger.error(f"DB Error: {e}")
-        finally:
-            db_local.close()
-
-    def get_history(sess_id):
-        if not sess_id: return []
-        db_local = SessionLocal()
-        try:
-            history_msgs = db_local.query(ChatMessage).filter(
-                ChatMessage.session_id == sess_id
-            ).order_by(ChatMessage.created_at.desc()).limit(11).all()
-            return history_msgs[::-1]
-        finally:
-            db_local.close()
-
     # State for Gesture Memory
     last_seen_gesture = None
     last_seen_time = 0
 
-    # Notify Frontend about Vision Status
-    vision_status = "enabled" if gesture_recognizer.is_ready else "disabled"
+    # Notify Frontend about Vision Status (未预加载时从第一次视频通话开始加载)
+    vision_stack.start()
+    vision_status = vision_stack.status
     await websocket.send_json({"type": "system_status", "vision": vision_status})
     logger.info(f"Sent system status: vision={vision_status}")
 
+    websocket_connections_active.inc()
     try:
         while True:
             # 3. Receive Message
             raw_data = await websocket.receive_text()
+
+            # 视觉模块在通话过程中加载完成时，通知前端更新状态
+            if vision_stack.status != vision_status:
+                vision_status = vision_stack.status
+                await websocket.send_json({"type": "system_status", "vision": vision_status})
             
             is_json = False
             try:
@@ -501,10 +661,7 @@ async def websocket_chat(
                 image_data = json_data.get('data')
                 
                 # Run gesture recognition in thread pool
-                gestures = await run_in_threadpool(
-                    gesture_recognizer.process_frame, 
-                    image_data
-                )
+                gestures = await vision_stack.process_frame(image_data)
                 
                 if not gestures:
                     continue
@@ -604,23 +761,40 @@ async def websocket_chat(
                                  await websocket.send_json({"type": "done"})
                                  
                                  # Save to DB so history is correct
-                                 await run_in_threadpool(
-                                     sync_save_session_and_message,
+                                 await save_session_and_message(
                                      session_id, user_id, user_input[:20], user_input, "user"
                                  )
-                                 await run_in_threadpool(
-                                     sync_save_session_and_message,
+                                 await save_session_and_message(
                                      session_id, user_id, user_input[:20], direct_answer, "assistant"
                                  )
                                  continue # Skip LLM
                              except:
                                  pass
 
+            # 本轮对话的分阶段耗时：结束时通过 timing 消息返回，并按配置写追踪日志
+            turn_trace = RequestTrace("ws_turn", session_id=session_id)
+            current_trace.set(turn_trace)
+
+            # Admission: 语音通话优先级最高，但配额用完或上游饱和时仍然快速告知前端稍后重试
+            try:
+                await usage_ledger.check(user_id, TOKENS)
+                await usage_ledger.check(user_id, TTS_CHARS)
+            except QuotaExceeded as e:
+                await websocket.send_json({"type": "error", "message": "本时段用量已达上限，请稍后再试", "retry_after": e.retry_after})
+                await websocket.send_json({"type": "done"})
+                continue
+            try:
+                llm_slot = await llm_scheduler.acquire(user_id, PRIORITY_VOICE)
+            except SchedulerSaturated as e:
+                await websocket.send_json({"type": "error", "message": "服务繁忙，请稍后再试", "retry_after": e.retry_after})
+                await websocket.send_json({"type": "done"})
+                continue
+
             # Save User Message
-            await run_in_threadpool(
-                sync_save_session_and_message,
-                session_id, user_id, user_input[:20], user_input, "user"
-            )
+            with trace_span("save_user"):
+                await save_session_and_message(
+                    session_id, user_id, user_input[:20], user_input, "user"
+                )
             
             # 4. Prepare Context
             messages = []
@@ -643,71 +817,86 @@ async def websocket_chat(
             
             请完全沉浸在这个角色中！
             """
-            messages.append({"role": "system", "content": system_prompt})
-            
-            # History
-            history = await run_in_threadpool(get_history, session_id)
-            if history:
-                last_msg = history[-1]
-                if last_msg.role == 'user' and last_msg.content == user_input:
-                    context_msgs = history[:-1]
-                else:
-                    context_msgs = history
-                for msg in context_msgs:
-                     if msg.role != 'system':
-                        messages.append({"role": msg.role, "content": msg.content})
+            # History (滚动摘要 + 最近消息)
+            with trace_span("history"):
+                summary, history = await load_history_and_summary(session_id)
+            messages.append({"role": "system", "content": with_summary(system_prompt, summary)})
+            messages.extend(build_context_messages(history, user_input))
             
             messages.append({"role": "user", "content": user_input})
             
-            # 5. Call LLM
-            client = AsyncOpenAI(
-                api_key=settings.LLM_API_KEY,
-                base_url=settings.LLM_BASE_URL
-            )
-            
-            response = await client.chat.completions.create(
-                model=settings.LLM_MODEL_NAME,
-                messages=messages,
-                stream=True,
-                temperature=0.8,
-                presence_penalty=0.5,
-            )
-            
             assistant_response = ""
-            tts_buffer = ""
+            turn_usage = None
+            tts_chars = 0
+            # 5. Call LLM (voice turns prefer the low-latency model, routed across backends)
+            route = choose_model("voice", prompt_chars=prompt_size(messages))
+            route_timer = model_route_stats.timer(route)
+            try:
+                response = llm_router.stream(
+                    messages,
+                    route=route.route,
+                    temperature=0.8,
+                    presence_penalty=0.5,
+                )
             
-            async for chunk in response:
-                content = chunk.choices[0].delta.content
-                if content:
-                    assistant_response += content
-                    tts_buffer += content
+                tts_buffer = ""
+            
+                async for chunk in response:
+                    if chunk.usage:
+                        turn_usage = chunk.usage
+                    content = chunk.choices[0].delta.content if chunk.choices else None
+                    if content:
+                        route_timer.first_token()
+                        assistant_response += content
+                        tts_buffer += content
                     
-                    await websocket.send_json({"type": "text", "content": content})
+                        await websocket.send_json({"type": "text", "content": content})
                     
-                    if any(p in content for p in "。！？；!?;"):
-                        if tts_buffer.strip():
-                             audio_data = await AliyunTTSService.synthesize(tts_buffer)
-                             if audio_data:
-                                 b64_audio = base64.b64encode(audio_data).decode('utf-8')
-                                 await websocket.send_json({"type": "audio", "data": b64_audio})
-                             tts_buffer = ""
-            
-            if tts_buffer.strip():
-                 audio_data = await AliyunTTSService.synthesize(tts_buffer)
-                 if audio_data:
-                     b64_audio = base64.b64encode(audio_data).decode('utf-8')
-                     await websocket.send_json({"type": "audio", "data": b64_audio})
+                        if any(p in content for p in "。！？；!?;"):
+                            if tts_buffer.strip():
+                                 tts_chars += len(tts_buffer)
+                                 audio_data = await AliyunTTSService.synthesize(tts_buffer)
+                                 if audio_data:
+                                     b64_audio = base64.b64encode(audio_data).decode('utf-8')
+                                     await websocket.send_json({"type": "audio", "data": b64_audio})
+                                 tts_buffer = ""
             
-            await run_in_threadpool(
-                sync_save_session_and_message,
-                session_id, user_id, user_input[:20], assistant_response, "assistant"
-            )
+                if tts_buffer.strip():
+                     tts_chars += len(tts_buffer)
+                     audio_data = await AliyunTTSService.synthesize(tts_buffer)
+                     if audio_data:
+                         b64_audio = base64.b64encode(audio_data).decode('utf-8')
+                         await websocket.send_json({"type": "audio", "data": b64_audio})
+                route_timer.finish(usage=turn_usage)
+            except Exception:
+                route_timer.finish(ok=False)
+                raise
+            finally:
+                llm_slot.release()
+                if assistant_response or turn_usage:
+                    usage_ledger.charge(
+                        user_id,
+                        tokens=usage_tokens(turn_usage, prompt_size(messages), len(assistant_response)),
+                        tts_chars=tts_chars
+                    )
+
+            with trace_span("save_reply"):
+                await save_session_and_message(
+                    session_id, user_id, user_input[:20], assistant_response, "assistant"
+                )
+            conversation_summarizer.schedule(session_id)
             
             await websocket.send_json({"type": "done"})
+            if settings.SERVER_TIMING_ENABLED:
+                await websocket.send_json({"type": "timing", **turn_trace.to_dict()})
+            turn_trace.log()
+            current_trace.set(None)
 
     except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected for session {session_id}")
     except Exception as e:
         logger.error(f"WebSocket Error: {e}")
         await websocket.close()
+    finally:
+        websocket_connections_active.dec()
 
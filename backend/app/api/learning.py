@@ -1,16 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 from typing import List, Optional
 from datetime import datetime
-from openai import AsyncOpenAI
 import json
 
-from ..database import get_db
-from ..models import LearningRecord, User, ChatMessage, ChatSession
+from ..database import get_async_db, get_async_read_db
+from ..models import LearningRecord, User
 from ..middleware.auth import verify_token
 from ..config import settings
+from ..services.user_stats import insert_learning_events, record_learning_events, get_user_stats
+from ..services.analysis_jobs import analysis_jobs, JOB_DONE
+from ..services.activity_rollups import activity_histogram, quiz_trend, question_categories
 
 router = APIRouter()
 
@@ -18,6 +21,11 @@ class LearningEvent(BaseModel):
     event_type: str
     content: Optional[str] = None
     score: Optional[int] = None
+    category: Optional[str] = Field(None, max_length=50)
+    # 客户端生成的事件 ID (如 UUID)，重试上报时用于去重
+    client_event_id: Optional[str] = Field(None, max_length=64)
+
+_event_list = TypeAdapter(List[LearningEvent])
 
 class DashboardStats(BaseModel):
     total_logins: int
@@ -30,55 +38,95 @@ class DashboardStats(BaseModel):
 async def track_learning_event(
     event: LearningEvent,
     token: dict = Depends(verify_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    上报一条学习事件
+
+    与批量上报走同一条写入路径：带 client_event_id 的重试 (包括并发重试) 只记录一次，
+    重复上报返回已有记录的 id。
+    """
+    user_id = int(token.get("sub"))
+    inserted = await insert_learning_events(db, user_id, [event.model_dump()])
+    if not inserted:
+        existing_id = await db.scalar(select(LearningRecord.id).filter(
+            LearningRecord.user_id == user_id,
+            LearningRecord.client_event_id == event.client_event_id
+        ))
+        return {"status": "success", "id": existing_id, "duplicate": True}
+    await db.commit()
+    return {"status": "success", "id": inserted[0]["id"]}
+
+def _parse_event_batch(body: bytes, content_type: str) -> list:
+    """
+    解析批量上报的请求体 (尚未校验字段)
+
+    支持 JSON 数组、{"events": [...]}，以及 Content-Type 为 application/x-ndjson 的每行一个事件
+    """
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        items = []
+        for lineno, line in enumerate(body.decode("utf-8").splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise HTTPException(status_code=422, detail=f"Invalid JSON on line {lineno}: {e.msg}")
+        return items
+
+    try:
+        data = json.loads(body or b"[]")
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid JSON: {e.msg}")
+    if isinstance(data, dict):
+        data = data.get("events")
+    if not isinstance(data, list):
+        raise HTTPException(status_code=422, detail="Expected a JSON array of events")
+    return data
+
+@router.post("/track/batch")
+async def track_learning_events(
+    request: Request,
+    token: dict = Depends(verify_token),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user_id = token.get("sub")
-    record = LearningRecord(
-        user_id=user_id,
-        event_type=event.event_type,
-        content=event.content,
-        score=event.score
-    )
-    db.add(record)
-    db.commit()
-    db.refresh(record)
-    return {"status": "success", "id": record.id}
+    """
+    批量上报学习事件 (页面浏览、测验等埋点)
+
+    整批一起校验，任意一条不合法则整批拒绝 (422，错误位置带有事件下标)；
+    校验通过后在一个事务中一次性写入。带 client_event_id 的事件重复上报只会记录一次，可以放心重试。
+    """
+    user_id = int(token.get("sub"))
+    items = _parse_event_batch(await request.body(), request.headers.get("content-type", ""))
+    if len(items) > settings.TRACK_BATCH_MAX_EVENTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many events in one batch (max {settings.TRACK_BATCH_MAX_EVENTS})"
+        )
+    try:
+        events = _event_list.validate_python(items)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+    accepted, duplicates = await record_learning_events(db, user_id, [e.model_dump() for e in events])
+    await db.commit()
+    return {"status": "success", "accepted": accepted, "duplicates": duplicates}
 
 @router.get("/dashboard")
 async def get_dashboard_data(
     token: dict = Depends(verify_token),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    user_id = token.get("sub")
-    
-    # 1. Basic Stats
-    logins = db.query(LearningRecord).filter(
-        LearningRecord.user_id == user_id, 
-        LearningRecord.event_type == 'login'
-    ).count()
-    
-    # Count questions from ChatMessage (linked via ChatSession)
-    questions = db.query(ChatMessage).join(ChatSession).filter(
-        ChatSession.user_id == user_id,
-        ChatMessage.role == 'user'
-    ).count()
+    user_id = int(token.get("sub"))
     
-    # Quiz scores (mock or real)
-    quiz_records = db.query(LearningRecord).filter(
-        LearningRecord.user_id == user_id,
-        LearningRecord.event_type == 'quiz_result'
-    ).all()
-    
-    quiz_avg = 0
-    if quiz_records:
-        scores = [r.score for r in quiz_records if r.score is not None]
-        if scores:
-            quiz_avg = sum(scores) / len(scores)
+    # 1. Basic Stats + 3. AI Analysis (user_stats 汇总表，一次主键查询)
+    stats = await get_user_stats(db, user_id)
 
     # 2. Recent Activity
-    recent_records = db.query(LearningRecord).filter(
+    result = await db.execute(select(LearningRecord).filter(
         LearningRecord.user_id == user_id
-    ).order_by(LearningRecord.created_at.desc()).limit(10).all()
+    ).order_by(LearningRecord.created_at.desc()).limit(10))
+    recent_records = result.scalars().all()
     
     activity_log = [
         {
@@ -90,81 +138,101 @@ async def get_dashboard_data(
         for r in recent_records
     ]
 
-    # 3. AI Analysis
-    last_analysis = db.query(LearningRecord).filter(
-        LearningRecord.user_id == user_id,
-        LearningRecord.event_type == 'ai_analysis'
-    ).order_by(LearningRecord.created_at.desc()).first()
-    
-    analysis_text = last_analysis.content if last_analysis else "暂无分析数据，请点击生成。"
+    analysis_text = stats["analysis"] or "暂无分析数据，请点击生成。"
 
     return {
-        "total_logins": logins,
-        "questions_asked": questions,
-        "quiz_average": round(quiz_avg, 1),
+        "total_logins": stats["logins"],
+        "questions_asked": stats["questions"],
+        "quiz_average": round(float(stats["quiz_average"]), 1),
         "recent_activity": activity_log,
         "ai_analysis": analysis_text
     }
 
+def _clamp_days(granularity: str, days: int) -> int:
+    max_days = settings.ANALYTICS_MAX_HOURLY_DAYS if granularity == "hour" else settings.ANALYTICS_MAX_DAYS
+    return min(days, max_days)
+
+@router.get("/analytics/activity")
+async def get_activity_histogram(
+    granularity: str = Query("day", pattern="^(hour|day|week)$"),
+    days: int = Query(30, ge=1, description="最近多少天 (按小时最多 7 天)"),
+    token: dict = Depends(verify_token),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """按小时 / 天 / 周统计各类学习事件的数量 (来自预聚合的活动汇总表)，时间桶均为 ANALYTICS_TZ_OFFSET_MINUTES 时区的本地时间"""
+    user_id = int(token.get("sub"))
+    days = _clamp_days(granularity, days)
+    return {
+        "granularity": granularity,
+        "buckets": await activity_histogram(db, user_id, granularity, days)
+    }
+
+@router.get("/analytics/quiz-trend")
+async def get_quiz_trend(
+    granularity: str = Query("day", pattern="^(day|week)$"),
+    days: int = Query(90, ge=1),
+    token: dict = Depends(verify_token),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """测验成绩趋势：每个时间桶的测验次数与平均分"""
+    user_id = int(token.get("sub"))
+    days = _clamp_days(granularity, days)
+    return {
+        "granularity": granularity,
+        "buckets": await quiz_trend(db, user_id, granularity, days)
+    }
+
+@router.get("/analytics/questions")
+async def get_question_categories(
+    days: int = Query(30, ge=1),
+    token: dict = Depends(verify_token),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """各分类 (会话模式) 的提问数量"""
+    user_id = int(token.get("sub"))
+    days = _clamp_days("day", days)
+    return {"categories": await question_categories(db, user_id, days)}
+
 @router.post("/analyze")
 async def generate_analysis(
-    token: dict = Depends(verify_token),
-    db: Session = Depends(get_db)
+    token: dict = Depends(verify_token)
 ):
-    user_id = token.get("sub")
-    
-    # Gather context
-    last_questions = db.query(ChatMessage.content).join(ChatSession).filter(
-        ChatSession.user_id == user_id,
-        ChatMessage.role == 'user'
-    ).order_by(ChatMessage.created_at.desc()).limit(20).all()
-    
-    question_text = "\n".join([q[0] for q in last_questions]) if last_questions else "暂无提问记录"
-    
-    quizzes = db.query(LearningRecord).filter(
-        LearningRecord.user_id == user_id,
-        LearningRecord.event_type == 'quiz_result'
-    ).all()
-    quiz_text = "\n".join([f"分数: {q.score} (详情: {q.content})" for q in quizzes]) if quizzes else "暂无测验记录"
-
-    prompt = f"""
-    请根据以下学员数据生成一份简短的学习分析报告（Markdown格式）。
-    
-    [最近提问]
-    {question_text}
-    
-    [测验成绩]
-    {quiz_text}
-    
-    请包含：
-    1. 学习兴趣点（基于提问）
-    2. 薄弱环节（基于低分测验或重复提问）
-    3. 学习建议
     """
+    提交 AI 学习分析 (立即返回)
 
-    try:
-        client = AsyncOpenAI(
-            api_key=settings.LLM_API_KEY,
-            base_url=settings.LLM_BASE_URL
-        )
-        
-        response = await client.chat.completions.create(
-            model=settings.LLM_MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        analysis = response.choices[0].message.content
-        
-        # Save analysis
-        record = LearningRecord(
-            user_id=user_id,
-            event_type='ai_analysis',
-            content=analysis
-        )
-        db.add(record)
-        db.commit()
-        
-        return {"analysis": analysis}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    学习数据没有变化时直接返回上次的报告 (cached=true)；
+    否则返回 job_id，通过 GET /analyze/{job_id} 轮询或 GET /analyze/{job_id}/stream 订阅生成过程。
+    """
+    user_id = int(token.get("sub"))
+    return await analysis_jobs.submit(user_id)
+
+@router.get("/analyze/{job_id}")
+async def get_analysis_job(
+    job_id: str,
+    token: dict = Depends(verify_token)
+):
+    job = analysis_jobs.get(job_id, int(token.get("sub")))
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    return job.to_dict()
+
+@router.get("/analyze/{job_id}/stream")
+async def stream_analysis_job(
+    job_id: str,
+    token: dict = Depends(verify_token)
+):
+    """SSE 订阅分析生成过程，事件格式与 /api/chat 相同 (message / done / error)"""
+    job = analysis_jobs.get(job_id, int(token.get("sub")))
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+
+    async def generate():
+        async for content in job.updates():
+            yield f"data: {json.dumps({'event': 'message', 'answer': content}, ensure_ascii=False)}\n\n"
+        if job.status == JOB_DONE:
+            yield f"data: {json.dumps({'event': 'done'})}\n\n"
+        else:
+            payload = {'event': 'error', 'message': job.error, 'retry_after': job.retry_after}
+            yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
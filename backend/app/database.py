@@ -1,16 +1,196 @@
-from sqlalchemy import create_engine
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Tuple
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import and_, create_engine, event, or_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from .config import settings
 
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    database = make_url(url).database
+    return not database or database == ":memory:"
+
+
+def apply_sqlite_pragmas(dbapi_connection, read_only: bool = False):
+    """
+    新建 SQLite 连接时设置引擎参数
+
+    journal_mode 是持久化在数据库文件里的，只需写连接设置；
+    其余参数都是连接级别的，每个连接都要设置。
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        if settings.SQLITE_WAL_ENABLED and not read_only:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        # 负数表示以 KiB 为单位
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        if read_only:
+            # 读连接池拒绝任何写操作，误把写请求路由到读库时直接报错而不是悄悄抢写锁
+            cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
+
+
+def _install_pragmas(engine, read_only: bool = False):
+    sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, read_only=read_only)
+
+
+def to_async_url(url: str) -> str:
+    """
+    把同步驱动的数据库 URL 转换为对应的异步驱动
+
+    sqlite -> sqlite+aiosqlite, postgresql -> postgresql+asyncpg, mysql -> mysql+aiomysql
+    """
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    async_drivers = {
+        "sqlite": "sqlite+aiosqlite",
+        "postgresql": "postgresql+asyncpg",
+        "mysql": "mysql+aiomysql",
+    }
+    if dialect not in async_drivers:
+        return url
+    return f"{async_drivers[dialect]}{sep}{rest}"
+
+
+def create_async_engines(url: str, profile: bool = True) -> Tuple[AsyncEngine, AsyncEngine]:
+    """
+    创建 (写引擎, 读引擎)
+
+    SQLite 文件库：写引擎只有一个连接，所有写入在进程内排队，不会互相撞上 database is locked；
+    读引擎是独立的只读连接池，WAL 模式下读取不会被写入阻塞，也不会阻塞写入。
+    其他数据库 (或内存 SQLite) 读写共用同一个引擎。
+    profile=False 时使用 SQLAlchemy 默认参数 (用于基准对比)。
+    """
+    async_url = to_async_url(url)
+    if not profile or not is_sqlite(url) or _is_memory_sqlite(url):
+        engine = create_async_engine(async_url)
+        return engine, engine
+
+    writer = create_async_engine(
+        async_url,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=settings.DB_WRITE_POOL_TIMEOUT,
+    )
+    reader = create_async_engine(
+        async_url,
+        pool_size=settings.DB_READ_POOL_SIZE,
+        max_overflow=settings.DB_READ_POOL_SIZE,
+    )
+    _install_pragmas(writer)
+    _install_pragmas(reader, read_only=True)
+    return writer, reader
+
+
+# 同步引擎：仅用于启动时建表和离线脚本，请求处理路径统一使用下面的异步引擎
 engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if is_sqlite(settings.DATABASE_URL):
+    _install_pragmas(engine)
+
+
+class AppSession(Session):
+    """应用的会话类：提交耗时等事件只注册在这个类上，不影响进程内其他使用 Session 的代码"""
+
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=AppSession)
 
 Base = declarative_base()
 
+# 异步引擎：数据库 IO 不再阻塞事件循环，也不占用线程池
+async_engine, async_read_engine = create_async_engines(settings.DATABASE_URL)
+# expire_on_commit=False：提交后仍可直接读取对象属性 (异步模式下不能隐式懒加载)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, sync_session_class=AppSession,
+                                       autoflush=False, expire_on_commit=False)
+# 只读会话：看板、会话列表、历史消息等纯查询走读连接池
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession, sync_session_class=AppSession,
+                                           autoflush=False, expire_on_commit=False)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+def keyset_before(at_column, key_column, cursor):
+    """
+    按 (at, key) 降序排列时位于游标之后的行
+
+    写成 at <= 游标 AND (at < 游标 OR key < 游标) 而不是行值比较：前半部分是索引范围条件，
+    后半部分只排除同一时间戳中已经返回过的行。
+    """
+    at, key = cursor
+    return and_(at_column <= at, or_(at_column < at, key_column < key))
+
+
+def upsert_statement(dialect_name: str, model, key_columns: Sequence[str],
+                     increment: Iterable[str] = (), replace: Iterable[str] = ()):
+    """
+    INSERT ... ON CONFLICT (key) DO UPDATE (MySQL 为 ON DUPLICATE KEY UPDATE)
+
+    increment 中的列累加 (col = col + excluded.col)，replace 中的列覆盖。
+    单条语句完成"不存在则创建、存在则更新"，并发写入同一行也不会丢更新；
+    参数可以是一个 dict，也可以是 dict 列表 (executemany)。
+    """
+    table = model.__table__
+    if dialect_name == "mysql":
+        stmt = mysql.insert(table)
+        new = stmt.inserted
+    else:
+        stmt = (postgresql if dialect_name == "postgresql" else sqlite).insert(table)
+        new = stmt.excluded
+
+    set_ = {col: table.c[col] + new[col] for col in increment}
+    set_.update({col: new[col] for col in replace})
+    if dialect_name == "mysql":
+        return stmt.on_duplicate_key_update(set_)
+    return stmt.on_conflict_do_update(index_elements=list(key_columns), set_=set_)
+
+
+def run_migrations(database_url: Optional[str] = None):
+    """
+    把数据库升级到最新的迁移版本 (等价于在 backend 目录执行 alembic upgrade head)
+
+    迁移脚本位于 backend/migrations/versions，新增表或列时新建一个迁移而不是修改 models 后依赖 create_all。
+    """
+    cfg = Config(str(Path(__file__).resolve().parent.parent / "alembic.ini"))
+    cfg.attributes["configure_logger"] = False
+    if database_url:
+        cfg.attributes["database_url"] = database_url
+    command.upgrade(cfg, "head")
+
+
+async def dispose_engines():
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
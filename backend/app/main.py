@@ -1,23 +1,63 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 
 from .config import settings
-from .database import engine, Base
-# from .middleware.rate_limit import rate_limit_middleware
+from .database import AppSession, async_engine, async_read_engine, dispose_engines, run_migrations
+from .middleware.server_timing import ServerTimingMiddleware
+from .middleware.simple_rate_limit import rate_limiter
 from .api import chat, auth, learning
+from .services.llm_scheduler import llm_scheduler
+from .services.llm_router import llm_router
+from .services.loop_monitor import loop_monitor
+from .services.metrics import instrument_engine, instrument_sessions, metrics
+from .services.model_routing import model_route_stats
+from .services.password_hasher import password_hasher
+from .services.session_purger import session_purger
+from .services.token_cache import revocation_sync
+from .services.usage_quota import usage_ledger
+from .services.vision import vision_stack
 
 # --- 生命周期管理器 ---
 # 用于在应用启动和关闭时执行特定逻辑
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # 启动时：自动创建数据库表结构
-    # 如果使用 Alembic 进行迁移，这里可以移除
-    Base.metadata.create_all(bind=engine)
-    print("Database tables created")
+    # 启动时：执行数据库迁移 (Alembic)，新库会自动建表，旧库补齐缺少的列和索引
+    run_migrations()
+    print("Database migrated")
+    # 后台清理已删除会话的消息
+    session_purger.start()
+    # 预先拉起密码哈希进程
+    password_hasher.start()
+    # 定期把用量账本写入数据库
+    usage_ledger.start()
+    # 定期拉取其他 worker 写入的 Token 吊销记录
+    revocation_sync.start()
+    # 手势识别模型在后台线程加载，不阻塞启动
+    if settings.VISION_PRELOAD:
+        vision_stack.start()
+    # LLM 客户端在后台线程中创建，不由第一个请求在事件循环中完成
+    llm_router.warm_up()
+    # 语句执行与提交耗时 (/metrics 与请求追踪)
+    if settings.METRICS_ENABLED or settings.SERVER_TIMING_ENABLED or settings.TRACE_LOG_ENABLED:
+        instrument_engine(async_engine.sync_engine, "writer")
+        if async_read_engine is not async_engine:
+            instrument_engine(async_read_engine.sync_engine, "reader")
+        instrument_sessions(AppSession)
+    # 事件循环延迟监控，阻塞时抓取调用栈
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
     yield
     # 关闭时：可以在这里释放资源（如数据库连接池、Redis 连接等）
+    await loop_monitor.stop()
+    await session_purger.stop()
+    await revocation_sync.stop()
+    password_hasher.shutdown()
+    await rate_limiter.close()
+    await usage_ledger.stop()
+    await dispose_engines()
     print("Shutting down")
 
 # --- 初始化 FastAPI 应用 ---
@@ -37,13 +77,16 @@ app.add_middleware(
     allow_headers=["*"],  # 允许所有 Header (Authorization, Content-Type, etc.)
 )
 
+# --- 请求耗时追踪 ---
+# Server-Timing 响应头 (浏览器开发者工具的 Timing 面板可直接查看) 与可选的 JSON 追踪日志
+app.add_middleware(ServerTimingMiddleware)
+
 # --- 静态文件挂载 ---
 # 挂载 uploads 目录，使用户上传的图片/文件可以通过 URL 访问
 # 例如: http://localhost:8000/uploads/example.jpg
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
-# 限流中间件已在各个路由中单独应用，这里注释掉全局应用
-# app = rate_limit_middleware(app)
+# 限流在各个路由中通过 Depends(check_rate_limit) 单独应用，后端由 RATE_LIMIT_BACKEND 选择 (memory / redis)
 
 # --- 注册路由模块 ---
 # auth.router: 处理登录、注册、Token 刷新
@@ -65,6 +108,27 @@ async def health_check():
     """健康检查接口，用于负载均衡或监控"""
     return {"status": "healthy"}
 
+@app.get("/health/llm")
+async def llm_health():
+    """LLM 调度器与上游状态：并发占用、排队等待、各上游健康情况、各路由的模型选择与延迟"""
+    return {
+        "scheduler": llm_scheduler.stats(),
+        "backends": llm_router.stats(),
+        "routes": model_route_stats.stats(),
+    }
+
+@app.get("/health/loop")
+async def loop_health():
+    """事件循环延迟与最近的阻塞记录 (含阻塞时事件循环线程的调用栈)"""
+    return loop_monitor.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus 抓取接口：LLM 首 Token 延迟与生成速度、TTS、手势识别、数据库耗时、连接数、限流与缓存命中"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     # 启动开发服务器
@@ -1,7 +1,7 @@
 from fastapi import Request, HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
-from ..config import settings
+from jose import JWTError
+from ..services.token_cache import token_cache
 
 security = HTTPBearer()
 
@@ -15,8 +15,8 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
 
     token = credentials.credentials
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
+        # 命中缓存时跳过签名校验和声明解析
+        return token_cache.decode(token)
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,31 +1,74 @@
-import redis
-from fastapi import Request, HTTPException
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from ..config import settings
 import logging
+import time
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from ..config import settings
+from .simple_rate_limit import RateLimitBackend, SimpleRateLimiter
 
 logger = logging.getLogger(__name__)
 
-# 尝试连接Redis，如果失败则使用内存存储
-try:
-    redis_client = redis.from_url(settings.REDIS_URL)
-    # 测试Redis连接
-    redis_client.ping()
-    storage_uri = settings.REDIS_URL
-    logger.info("Redis connection successful")
-except Exception as e:
-    logger.warning(f"Redis connection failed: {e}, using memory storage")
-    storage_uri = "memory://"
-
-limiter = Limiter(
-    key_func=get_remote_address,
-    storage_uri=storage_uri,
-    default_limits=[f"{settings.RATE_LIMIT_PER_MINUTE}/minute"]
-)
-
-def rate_limit_middleware(app):
-    app.state.limiter = limiter
-    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-    return app
\ No newline at end of file
+# 两桶滑动窗口计数，与 SimpleRateLimiter 的算法一致；读取、判断和计数在一次 EVALSHA 中原子完成
+# KEYS[1] 当前窗口计数，KEYS[2] 上一窗口计数；ARGV: 限额, 窗口秒数, 上一窗口的权重
+SLIDING_WINDOW_LUA = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * tonumber(ARGV[3]) + current >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]) * 2)
+return 1
+"""
+
+
+class RedisRateLimiter(RateLimitBackend):
+    """
+    多个 worker / 容器共享的限流器 (Redis)
+
+    - 计数按窗口序号存放在 ratelimit:{key}:{窗口序号}，两个窗口后自动过期
+    - 窗口序号由本机时间计算，要求各节点时钟同步 (NTP)
+    - Redis 不可用时记录一次告警，在 RATE_LIMIT_REDIS_RETRY 秒内改用进程内限流
+      (此时有效限额按 worker 数放大，但不会因为 Redis 故障拒绝或放行全部请求)
+    """
+
+    def __init__(self, url: str = None, rate_limit: int = None, time_window: float = 60,
+                 prefix: str = "ratelimit"):
+        self.rate_limit = rate_limit or settings.RATE_LIMIT_PER_MINUTE
+        self.time_window = time_window
+        self.prefix = prefix
+        self.client = redis.from_url(
+            url or settings.REDIS_URL,
+            socket_timeout=settings.RATE_LIMIT_REDIS_TIMEOUT,
+            socket_connect_timeout=settings.RATE_LIMIT_REDIS_TIMEOUT
+        )
+        self._script = self.client.register_script(SLIDING_WINDOW_LUA)
+        self.local = SimpleRateLimiter(self.rate_limit, time_window)
+        self._down_until = 0.0
+
+    @property
+    def degraded(self) -> bool:
+        return time.monotonic() < self._down_until
+
+    async def allow(self, key: str) -> bool:
+        if self.degraded:
+            return self.local.is_allowed(key)
+
+        now = time.time()
+        window = int(now // self.time_window)
+        weight = 1 - (now - window * self.time_window) / self.time_window
+        try:
+            allowed = await self._script(
+                keys=[f"{self.prefix}:{key}:{window}", f"{self.prefix}:{key}:{window - 1}"],
+                args=[self.rate_limit, int(self.time_window), weight]
+            )
+            return bool(allowed)
+        except (RedisError, OSError) as e:
+            logger.warning(f"Redis rate limiter unavailable ({e}), using local limits "
+                           f"for {settings.RATE_LIMIT_REDIS_RETRY}s")
+            self._down_until = time.monotonic() + settings.RATE_LIMIT_REDIS_RETRY
+            return self.local.is_allowed(key)
+
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,33 @@
+from starlette.datastructures import MutableHeaders
+
+from ..config import settings
+from ..services.request_trace import RequestTrace
+
+
+class ServerTimingMiddleware:
+    """
+    为每个 HTTP 请求建立 RequestTrace，并在响应头中返回 Server-Timing
+
+    纯 ASGI 中间件 (不使用 BaseHTTPMiddleware)：不缓冲流式响应，接口和服务层在同一个上下文中
+    通过 record_span / trace_span 写入阶段耗时。响应头在第一个字节之前发送，
+    SSE 的后续阶段由 /api/chat 在结尾的 timing 事件中返回；请求结束后写 JSON 追踪日志 (可选)。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (settings.SERVER_TIMING_ENABLED or settings.TRACE_LOG_ENABLED):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and settings.SERVER_TIMING_ENABLED:
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", trace.server_timing())
+                # 允许跨域页面 (前端开发服务器) 通过 Performance API 读取
+                headers.append("Timing-Allow-Origin", "*")
+            await send(message)
+
+        with RequestTrace(f"{scope['method']} {scope['path']}") as trace:
+            await self.app(scope, receive, send_with_timing)
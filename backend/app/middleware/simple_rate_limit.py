@@ -1,38 +1,112 @@
 import time
-from collections import defaultdict
+from collections import OrderedDict
 from fastapi import Request, HTTPException
+from jose import JWTError
 from ..config import settings
+from ..services.metrics import rate_limit_rejections_total
+from ..services.token_cache import token_cache
 
-# 简单的内存限流器
-class SimpleRateLimiter:
-    def __init__(self):
-        self.requests = defaultdict(list)
-        self.rate_limit = settings.RATE_LIMIT_PER_MINUTE
-        self.time_window = 60  # 60 seconds
-    
-    def is_allowed(self, key: str) -> bool:
-        now = time.time()
-        # 清理过期的请求记录
-        self.requests[key] = [req_time for req_time in self.requests[key] if now - req_time < self.time_window]
-        
-        # 检查是否超过限流
-        if len(self.requests[key]) >= self.rate_limit:
+
+class RateLimitBackend:
+    """限流后端接口：allow(key) 判断并记录一次请求"""
+
+    async def allow(self, key: str) -> bool:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+# 简单的内存限流器 (滑动窗口计数)
+class SimpleRateLimiter(RateLimitBackend):
+    """
+    两桶滑动窗口计数器
+
+    每个键只保存 [当前窗口起点, 上一窗口计数, 当前窗口计数, 最近访问时间]，
+    估算值 = 上一窗口计数 × 上一窗口仍落在滑动窗口内的比例 + 当前窗口计数，每次检查 O(1)。
+    键按最近访问时间排在 OrderedDict 中，检查时顺带淘汰超过两个窗口未访问的键
+    (它们的估算值已经为 0，淘汰不改变限流结果)，内存只与活跃客户端数有关。
+    """
+
+    def __init__(self, rate_limit: int = None, time_window: float = 60):
+        self.requests: "OrderedDict[str, list]" = OrderedDict()
+        self.rate_limit = rate_limit or settings.RATE_LIMIT_PER_MINUTE
+        self.time_window = time_window  # 60 seconds
+
+    def is_allowed(self, key: str, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self._evict_idle(now)
+
+        state = self.requests.get(key)
+        if state is None:
+            state = [now, 0, 0, now]
+            self.requests[key] = state
+        else:
+            self.requests.move_to_end(key)
+            state[3] = now
+
+        # 滚动窗口：跨过一个窗口时当前计数变为上一窗口计数，跨过两个及以上时清零
+        elapsed = now - state[0]
+        if elapsed >= self.time_window:
+            windows = int(elapsed // self.time_window)
+            state[1] = state[2] if windows == 1 else 0
+            state[2] = 0
+            state[0] += windows * self.time_window
+            elapsed = now - state[0]
+
+        estimate = state[1] * (1 - elapsed / self.time_window) + state[2]
+        if estimate >= self.rate_limit:
             return False
-        
+
         # 记录当前请求
-        self.requests[key].append(now)
+        state[2] += 1
         return True
 
-rate_limiter = SimpleRateLimiter()
+    async def allow(self, key: str) -> bool:
+        return self.is_allowed(key)
+
+    def _evict_idle(self, now: float):
+        idle_before = now - 2 * self.time_window
+        while self.requests:
+            state = next(iter(self.requests.values()))
+            if state[3] > idle_before:
+                break
+            self.requests.popitem(last=False)
+
+
+def create_rate_limiter() -> RateLimitBackend:
+    """RATE_LIMIT_BACKEND = "redis" 时多个 worker 共享限额，否则每个进程单独计数"""
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        from .rate_limit import RedisRateLimiter
+        return RedisRateLimiter()
+    return SimpleRateLimiter()
+
 
-def check_rate_limit(request: Request):
-    """检查限流 - 使用客户端IP作为限流键"""
-    client_ip = request.client.host if request.client else "unknown"
-    
-    if not rate_limiter.is_allowed(client_ip):
+rate_limiter = create_rate_limiter()
+
+
+def rate_limit_key(request: Request) -> str:
+    """携带有效 Token 时按用户限流 (同一出口 IP 后的多个用户互不影响)，否则按客户端 IP"""
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            sub = token_cache.decode(token).get("sub")
+            if sub is not None:
+                return f"user:{sub}"
+        except JWTError:
+            pass
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+async def check_rate_limit(request: Request):
+    """检查限流 - 使用用户 ID 或客户端IP作为限流键"""
+    key = rate_limit_key(request)
+    if not await rate_limiter.allow(key):
+        rate_limit_rejections_total.labels(key.partition(":")[0]).inc()
         raise HTTPException(
             status_code=429,
             detail="Rate limit exceeded. Please try again later."
         )
-    
-    return True
\ No newline at end of file
+
+    return True
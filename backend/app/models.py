@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Index, LargeBinary
 from datetime import datetime
 import uuid
 from .database import Base
@@ -17,17 +17,32 @@ class User(Base):
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # 会话列表：按用户 + 模式过滤，按 (最后活跃时间, id) 游标分页
+        Index("ix_chat_sessions_user_mode_updated", "user_id", "mode", "updated_at", "id"),
+    )
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(Integer, index=True)
     title = Column(String(255))
     mode = Column(String(20), default="casual") # casual, learning
+    # 滚动摘要：覆盖历史窗口之外的旧消息，summary_message_id 为已摘要到的最后一条消息 ID
+    summary = Column(Text, nullable=True)
+    summary_message_id = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 软删除：标记后对用户不可见，由后台清理任务分批删除消息后再删除本行
+    deleted_at = Column(DateTime, nullable=True, index=True)
+    # 冷数据归档：消息已压缩存入 chat_archives，不再在 chat_messages 中
+    archived_at = Column(DateTime, nullable=True)
 
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # 历史消息：按会话过滤，按 (时间, id) 游标分页 (id 即 rowid，隐含在索引末尾)
+        Index("ix_chat_messages_session_created", "session_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String(36), index=True)
@@ -37,12 +52,112 @@ class ChatMessage(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class ChatArchive(Base):
+    """
+    长期不活跃会话的消息归档 (每个会话一行)
+
+    payload 为该会话全部消息的压缩 JSON，codec 记录压缩算法；读取时解压，会话继续对话时恢复到 chat_messages。
+    """
+    __tablename__ = "chat_archives"
+
+    session_id = Column(String(36), primary_key=True)
+    codec = Column(String(10), nullable=False)
+    message_count = Column(Integer, nullable=False)
+    # 用户提问数：会话不在 chat_messages 中时，删除会话和重算统计仍需要它
+    question_count = Column(Integer, nullable=False)
+    raw_bytes = Column(Integer, nullable=False)
+    compressed_bytes = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
 class LearningRecord(Base):
     __tablename__ = "learning_records"
+    __table_args__ = (
+        # 看板统计：按用户 + 事件类型过滤，按时间排序
+        Index("ix_learning_records_user_event_created", "user_id", "event_type", "created_at"),
+        # 客户端重试时按事件 ID 去重 (NULL 不参与唯一约束)
+        Index("ux_learning_records_user_client_event", "user_id", "client_event_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True)
     event_type = Column(String(50))  # login, quiz_result, question_asked, page_view
     content = Column(Text, nullable=True) # JSON or text details
     score = Column(Integer, nullable=True) # For numeric tracking
+    client_event_id = Column(String(64), nullable=True) # 客户端生成的事件 ID，用于重试去重
+    category = Column(String(50), nullable=True) # 分类：提问为会话模式 (casual/professional)，测验可为科目
     created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UserStats(Base):
+    """
+    看板统计的汇总表 (每个用户一行)
+
+    与对应事件在同一个事务中增量更新，看板只需读取这一行；
+    数据出现偏差时用 rebuild_user_stats.py 从明细表重算。
+    """
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, primary_key=True)
+    login_count = Column(Integer, default=0, server_default="0", nullable=False)
+    question_count = Column(Integer, default=0, server_default="0", nullable=False)
+    quiz_sum = Column(Integer, default=0, server_default="0", nullable=False)
+    quiz_count = Column(Integer, default=0, server_default="0", nullable=False)
+    last_analysis_id = Column(Integer, nullable=True)
+    # 学习数据版本：提问/测验每次变化 +1 (即分析 Prompt 的输入变化)；analysis_version 为最新分析生成时的版本，两者相等说明分析仍然有效
+    data_version = Column(Integer, default=0, server_default="0", nullable=False)
+    analysis_version = Column(Integer, default=0, server_default="0", nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ActivityRollupMixin:
+    """
+    学习事件按时间桶预聚合的计数 (每个用户 + 时间桶 + 事件类型 + 分类一行)
+
+    与明细在同一个事务中增量更新，看板图表只扫描时间范围内的桶，不扫描 learning_records。
+    """
+    user_id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    event_type = Column(String(50), primary_key=True)
+    category = Column(String(50), primary_key=True, default="") # 无分类时为空字符串 (主键列不能为 NULL)
+    event_count = Column(Integer, default=0, server_default="0", nullable=False)
+    score_sum = Column(Integer, default=0, server_default="0", nullable=False)
+    score_count = Column(Integer, default=0, server_default="0", nullable=False)
+
+
+class ActivityHourly(ActivityRollupMixin, Base):
+    """小时桶 (按 ANALYTICS_TZ_OFFSET_MINUTES 指定时区的整点)"""
+    __tablename__ = "activity_hourly"
+
+
+class ActivityDaily(ActivityRollupMixin, Base):
+    """天桶 (按 ANALYTICS_TZ_OFFSET_MINUTES 指定时区的自然日)"""
+    __tablename__ = "activity_daily"
+
+
+class UsageHourly(Base):
+    """
+    每个用户每小时的 LLM Token 与 TTS 字符用量 (UTC 整点桶)
+
+    由用量账本 (services/usage_quota.py) 在内存中累计后定期批量累加写入，配额按最近若干个桶计算。
+    """
+    __tablename__ = "usage_hourly"
+
+    user_id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    tokens = Column(Integer, default=0, server_default="0", nullable=False)
+    tts_chars = Column(Integer, default=0, server_default="0", nullable=False)
+
+
+class RevokedToken(Base):
+    """
+    登出吊销的 JWT (按 SHA-256 摘要记录)
+
+    各 worker 定期把仍在有效期内的记录拉取到进程内的吊销列表 (services/token_cache.py)；
+    token 本身过期后记录不再有用，由之后的登出请求顺带删除。
+    """
+    __tablename__ = "revoked_tokens"
+
+    digest = Column(String(64), primary_key=True)
+    expires_at = Column(DateTime, nullable=True, index=True) # token 的 exp，没有 exp 时为空 (永久吊销)
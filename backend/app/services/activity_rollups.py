@@ -0,0 +1,197 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import upsert_statement
+from ..models import ActivityDaily, ActivityHourly, LearningRecord
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KEYS = ["user_id", "bucket", "event_type", "category"]
+ROLLUP_COUNTERS = ["event_count", "score_sum", "score_count"]
+
+# (event_type, category, score, created_at)
+ActivityEvent = Tuple[str, Optional[str], Optional[int], datetime]
+
+
+def hour_bucket(at: datetime) -> datetime:
+    """UTC 时间 -> 配置时区下的整点 (以不带时区的本地时间存储，与天桶使用同一时区)"""
+    local = at + timedelta(minutes=settings.ANALYTICS_TZ_OFFSET_MINUTES)
+    return local.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(at: datetime) -> datetime:
+    """UTC 时间 -> 配置时区下的自然日零点 (以不带时区的本地时间存储)"""
+    return hour_bucket(at).replace(hour=0)
+
+
+def local_today() -> datetime:
+    return day_bucket(datetime.utcnow())
+
+
+def aggregate(user_id: int, events: Iterable[ActivityEvent]) -> Tuple[List[dict], List[dict]]:
+    """把事件合并为 (小时桶行, 天桶行)，同一个桶只产生一行"""
+    tables = (defaultdict(lambda: [0, 0, 0]), defaultdict(lambda: [0, 0, 0]))
+    for event_type, category, score, at in events:
+        for table, bucket in zip(tables, (hour_bucket(at), day_bucket(at))):
+            row = table[(bucket, event_type, category or "")]
+            row[0] += 1
+            if score is not None:
+                row[1] += score
+                row[2] += 1
+
+    def rows(table):
+        return [
+            {"user_id": user_id, "bucket": bucket, "event_type": event_type, "category": category,
+             "event_count": c[0], "score_sum": c[1], "score_count": c[2]}
+            for (bucket, event_type, category), c in table.items()
+        ]
+    return rows(tables[0]), rows(tables[1])
+
+
+async def bump_activity(db: AsyncSession, user_id: int, events: List[ActivityEvent]):
+    """在调用方的事务中累加活动计数 (由调用方 commit)"""
+    if not events:
+        return
+    dialect_name = db.bind.dialect.name
+    hourly, daily = aggregate(user_id, events)
+    for model, rows in ((ActivityHourly, hourly), (ActivityDaily, daily)):
+        await db.execute(upsert_statement(dialect_name, model, ROLLUP_KEYS, ROLLUP_COUNTERS), rows)
+
+
+def _step(granularity: str) -> timedelta:
+    return {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}[granularity]
+
+
+def _range(granularity: str, days: int) -> Tuple[type, datetime, List[datetime]]:
+    """返回 (汇总表, 起始桶, 全部桶的起点)，周桶从周一开始"""
+    if granularity == "hour":
+        end = hour_bucket(datetime.utcnow())
+        start = end - timedelta(hours=days * 24 - 1)
+        model = ActivityHourly
+    else:
+        end = local_today()
+        start = end - timedelta(days=days - 1)
+        if granularity == "week":
+            start -= timedelta(days=start.weekday())
+            end -= timedelta(days=end.weekday())
+        model = ActivityDaily
+
+    buckets, cursor = [], start
+    while cursor <= end:
+        buckets.append(cursor)
+        cursor += _step(granularity)
+    return model, start, buckets
+
+
+def _bucket_of(granularity: str, bucket: datetime) -> datetime:
+    if granularity == "week":
+        return bucket - timedelta(days=bucket.weekday())
+    return bucket
+
+
+def _label(granularity: str, bucket: datetime) -> str:
+    return bucket.strftime("%Y-%m-%d %H:00" if granularity == "hour" else "%Y-%m-%d")
+
+
+async def activity_histogram(db: AsyncSession, user_id: int, granularity: str, days: int) -> List[dict]:
+    """各时间桶中每种事件的数量，没有事件的桶也会返回 (counts 为空)"""
+    model, start, buckets = _range(granularity, days)
+    result = await db.execute(select(
+        model.bucket, model.event_type, func.sum(model.event_count)
+    ).filter(
+        model.user_id == user_id,
+        model.bucket >= start
+    ).group_by(model.bucket, model.event_type))
+
+    counts: Dict[datetime, Dict[str, int]] = {b: defaultdict(int) for b in buckets}
+    for bucket, event_type, count in result.all():
+        key = _bucket_of(granularity, bucket)
+        if key in counts:
+            counts[key][event_type] += int(count)
+    return [{"start": _label(granularity, b), "counts": dict(counts[b])} for b in buckets]
+
+
+async def quiz_trend(db: AsyncSession, user_id: int, granularity: str, days: int) -> List[dict]:
+    """各时间桶的测验次数与平均分 (没有测验的桶 average 为 None)"""
+    model, start, buckets = _range(granularity, days)
+    result = await db.execute(select(
+        model.bucket, func.sum(model.score_sum), func.sum(model.score_count)
+    ).filter(
+        model.user_id == user_id,
+        model.event_type == "quiz_result",
+        model.bucket >= start
+    ).group_by(model.bucket))
+
+    totals: Dict[datetime, List[int]] = {b: [0, 0] for b in buckets}
+    for bucket, score_sum, score_count in result.all():
+        key = _bucket_of(granularity, bucket)
+        if key in totals:
+            totals[key][0] += int(score_sum or 0)
+            totals[key][1] += int(score_count or 0)
+    return [
+        {"start": _label(granularity, b), "count": c,
+         "average": round(s / c, 1) if c else None}
+        for b, (s, c) in totals.items()
+    ]
+
+
+async def question_categories(db: AsyncSession, user_id: int, days: int) -> List[dict]:
+    """时间范围内各分类的提问数量，按数量降序"""
+    start = local_today() - timedelta(days=days - 1)
+    result = await db.execute(select(
+        ActivityDaily.category, func.sum(ActivityDaily.event_count)
+    ).filter(
+        ActivityDaily.user_id == user_id,
+        ActivityDaily.event_type == "question_asked",
+        ActivityDaily.bucket >= start
+    ).group_by(ActivityDaily.category))
+    rows = [{"category": category or "other", "count": int(count)} for category, count in result.all()]
+    return sorted(rows, key=lambda r: r["count"], reverse=True)
+
+
+def rebuild_activity_rollups(db: Session, user_id: Optional[int] = None) -> int:
+    """
+    从 learning_records 重算小时桶和天桶 (同步会话，用于离线脚本和数据修复)
+
+    逐个用户流式读取事件并在该用户的事务中替换汇总行，内存中只保留一个用户的桶；
+    全量重算最后清掉已没有事件的用户留下的汇总行。返回重算的用户数。
+    """
+    has_events = LearningRecord.created_at.isnot(None)
+    if user_id is not None:
+        user_ids = [user_id]
+    else:
+        user_ids = list(db.scalars(
+            select(LearningRecord.user_id).filter(has_events).distinct().order_by(LearningRecord.user_id)
+        ))
+
+    rebuilt = 0
+    for uid in user_ids:
+        rows = db.execute(select(
+            LearningRecord.event_type, LearningRecord.category, LearningRecord.score, LearningRecord.created_at
+        ).filter(
+            LearningRecord.user_id == uid, has_events
+        ).execution_options(yield_per=5000))
+        hourly, daily = aggregate(uid, (tuple(row) for row in rows))
+
+        db.execute(delete(ActivityHourly).filter(ActivityHourly.user_id == uid))
+        db.execute(delete(ActivityDaily).filter(ActivityDaily.user_id == uid))
+        if hourly:
+            db.execute(insert(ActivityHourly), hourly)
+            db.execute(insert(ActivityDaily), daily)
+            rebuilt += 1
+        db.commit()
+
+    if user_id is None:
+        active = select(LearningRecord.user_id).filter(has_events)
+        db.execute(delete(ActivityHourly).filter(ActivityHourly.user_id.not_in(active)))
+        db.execute(delete(ActivityDaily).filter(ActivityDaily.user_id.not_in(active)))
+        db.commit()
+    logger.info(f"Rebuilt activity rollups for {rebuilt} user(s)")
+    return rebuilt
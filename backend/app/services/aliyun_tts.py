@@ -1,10 +1,11 @@
+import asyncio
 import json
 import logging
 import time
 from typing import Optional
-from aliyunsdkcore.client import AcsClient
-from aliyunsdkcore.request import CommonRequest
 from ..config import settings
+from .metrics import tts_audio_bytes, tts_latency_seconds
+from .request_trace import record_span
 import httpx
 
 logger = logging.getLogger(__name__)
@@ -12,6 +13,10 @@ logger = logging.getLogger(__name__)
 class AliyunTTSService:
     _token = None
     _token_expire_time = 0
+    # 刷新锁在首次使用时按事件循环创建：asyncio.Lock 会绑定到第一次等待它的事件循环，
+    # 类属性在导入时创建会被多个事件循环 (测试、多次 asyncio.run) 共用
+    _refresh_lock: Optional[asyncio.Lock] = None
+    _refresh_loop: Optional[asyncio.AbstractEventLoop] = None
 
     @classmethod
     def get_token(cls) -> Optional[str]:
@@ -26,6 +31,10 @@ class AliyunTTSService:
             return cls._token
 
         try:
+            # 阿里云 SDK 只在获取 Token 时才需要 (每天约一次)，不在应用启动时导入
+            from aliyunsdkcore.client import AcsClient
+            from aliyunsdkcore.request import CommonRequest
+
             # 创建AcsClient实例
             client = AcsClient(
                 settings.ALIYUN_ACCESS_KEY_ID,
@@ -57,14 +66,42 @@ class AliyunTTSService:
             logger.error(f"Error getting NLS Token: {e}")
             return None
 
+    @classmethod
+    async def get_token_async(cls) -> Optional[str]:
+        """
+        异步获取 Token：缓存有效时直接返回；
+        需要刷新时在线程中调用 get_token (阿里云 SDK 是同步 HTTP 请求，会阻塞事件循环)，同一时刻只刷新一次
+        """
+        if cls._token and time.time() < cls._token_expire_time - 600:
+            return cls._token
+        loop = asyncio.get_running_loop()
+        if cls._refresh_lock is None or cls._refresh_loop is not loop:
+            cls._refresh_lock, cls._refresh_loop = asyncio.Lock(), loop
+        async with cls._refresh_lock:
+            if cls._token and time.time() < cls._token_expire_time - 600:
+                return cls._token
+            return await asyncio.to_thread(cls.get_token)
+
     @classmethod
     async def synthesize(cls, text: str) -> Optional[bytes]:
+        """语音合成，并记录耗时和音频大小 (/metrics 与请求追踪)"""
+        started = time.perf_counter()
+        audio = await cls._synthesize(text)
+        elapsed = time.perf_counter() - started
+        tts_latency_seconds.labels("ok" if audio else "error").observe(elapsed)
+        record_span("tts", elapsed)
+        if audio:
+            tts_audio_bytes.observe(len(audio))
+        return audio
+
+    @classmethod
+    async def _synthesize(cls, text: str) -> Optional[bytes]:
         """
         调用阿里云RESTful API进行语音合成
         
         使用 httpx 进行异步 HTTP 请求，避免阻塞主线程。
         """
-        token = cls.get_token()
+        token = await cls.get_token_async()
         if not token:
             logger.error("Cannot synthesize: Token is missing")
             return None
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import AsyncReadSessionLocal, AsyncSessionLocal
+from ..models import ChatMessage, ChatSession, LearningRecord
+from .llm_router import llm_router
+from .metrics import register_cache
+from .llm_scheduler import llm_scheduler, SchedulerSaturated, PRIORITY_ANALYSIS
+from .model_routing import choose_model, model_route_stats
+from .session_archiver import archived_messages, archived_sessions
+from .usage_quota import usage_ledger, usage_tokens, QuotaExceeded, TOKENS
+from .user_stats import get_user_stats, record_learning_event
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+ANALYSIS_PROMPT = """
+请根据以下学员数据生成一份简短的学习分析报告（Markdown格式）。
+
+[最近提问]
+{questions}
+
+[测验成绩]
+{quizzes}
+
+请包含：
+1. 学习兴趣点（基于提问）
+2. 薄弱环节（基于低分测验或重复提问）
+3. 学习建议
+"""
+
+
+class AnalysisJob:
+    """一次 AI 学习分析任务，生成过程中的文本可以被多个订阅者 (轮询 / SSE) 读取"""
+
+    def __init__(self, user_id: int, data_version: int):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        # 生成该报告所基于的学习数据版本
+        self.data_version = data_version
+        self.status = JOB_PENDING
+        self.text = ""
+        self.error: Optional[str] = None
+        self.retry_after: Optional[int] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def append(self, content: str):
+        self.text += content
+        await self._notify()
+
+    async def finish(self, status: str, error: Optional[str] = None, retry_after: Optional[int] = None):
+        self.status = status
+        self.error = error
+        self.retry_after = retry_after
+        self.finished_at = time.time()
+        await self._notify()
+
+    async def updates(self) -> AsyncIterator[str]:
+        """从头开始产出文本片段，直到任务结束 (晚加入的订阅者先拿到已生成的部分)"""
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.text) > sent or self.finished)
+            if len(self.text) > sent:
+                chunk, sent = self.text[sent:], len(self.text)
+                yield chunk
+            elif self.finished:
+                return
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "cached": False,
+            "analysis": self.text if self.status == JOB_DONE else None,
+            "partial": self.text if self.status == JOB_RUNNING else None,
+            "error": self.error,
+            "retry_after": self.retry_after,
+        }
+
+
+async def _recent_questions(db: AsyncSession, user_id: int) -> List[str]:
+    """
+    最近的 ANALYSIS_RECENT_QUESTIONS 条提问，包括已归档会话中的提问
+
+    归档按会话最后活跃时间从新到旧读取，会话的 updated_at 早于已选中的最旧一条提问时不再解压。
+    """
+    limit = settings.ANALYSIS_RECENT_QUESTIONS
+    result = await db.execute(select(ChatMessage.created_at, ChatMessage.content).join(
+        ChatSession, ChatMessage.session_id == ChatSession.id
+    ).filter(
+        ChatSession.user_id == user_id,
+        ChatSession.deleted_at.is_(None),
+        ChatMessage.role == 'user'
+    ).order_by(ChatMessage.created_at.desc()).limit(limit))
+    questions = [(row.created_at or datetime.min, row.content) for row in result.all()]
+
+    for session in await archived_sessions(db, user_id):
+        if len(questions) >= limit and session.updated_at and session.updated_at < questions[-1][0]:
+            break
+        questions += [(m["created_at"] or datetime.min, m["content"])
+                      for m in await archived_messages(db, session.id) if m["role"] == "user"]
+        questions = sorted(questions, key=lambda q: q[0], reverse=True)[:limit]
+    return [content for _, content in questions]
+
+
+async def _build_prompt(user_id: int) -> str:
+    async with AsyncReadSessionLocal() as db:
+        questions = await _recent_questions(db, user_id)
+
+        # 只带最近的测验明细，整体水平用汇总表里的平均分表示
+        result = await db.execute(select(LearningRecord.score, LearningRecord.content).filter(
+            LearningRecord.user_id == user_id,
+            LearningRecord.event_type == 'quiz_result'
+        ).order_by(LearningRecord.created_at.desc()).limit(settings.ANALYSIS_RECENT_QUIZZES))
+        quizzes = result.all()
+        stats = await get_user_stats(db, user_id)
+
+    question_text = "\n".join(questions) if questions else "暂无提问记录"
+    quiz_text = "\n".join([f"分数: {q.score} (详情: {q.content})" for q in quizzes]) if quizzes else "暂无测验记录"
+    if quizzes:
+        quiz_text = f"平均分: {stats['quiz_average']:.1f}\n{quiz_text}"
+    return ANALYSIS_PROMPT.format(questions=question_text, quizzes=quiz_text)
+
+
+class AnalysisJobRunner:
+    """
+    看板 AI 学习分析的后台任务
+
+    - submit() 立即返回：学习数据自上次分析以来没有变化时直接返回缓存的报告，
+      否则启动 (或复用同一用户进行中的) 后台任务，返回 job_id 供轮询或 SSE 订阅
+    - 缓存依据 user_stats 的 data_version / analysis_version，事件写入时同事务更新，不会读到过期结果
+    - 任务状态保存在进程内存中，多 worker 部署时需要把轮询请求粘到同一个 worker
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, AnalysisJob] = {}
+        # 每个用户当前进行中的任务
+        self._active: Dict[int, AnalysisJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # 直接返回缓存报告记为 hit，需要重新生成记为 miss
+        self.hits = 0
+        self.misses = 0
+
+    def _prune(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and now - job.finished_at > settings.ANALYSIS_JOB_TTL]
+        for job_id in expired:
+            self._jobs.pop(job_id, None)
+
+    def get(self, job_id: str, user_id: int) -> Optional[AnalysisJob]:
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    async def submit(self, user_id: int) -> dict:
+        self._prune()
+        async with AsyncReadSessionLocal() as db:
+            stats = await get_user_stats(db, user_id)
+        if stats["analysis_fresh"]:
+            self.hits += 1
+            return {"job_id": None, "status": JOB_DONE, "cached": True, "analysis": stats["analysis"],
+                    "partial": None, "error": None, "retry_after": None}
+
+        job = self._active.get(user_id)
+        if job is not None and not job.finished and job.data_version == stats["data_version"]:
+            return job.to_dict()
+
+        self.misses += 1
+        job = AnalysisJob(user_id, stats["data_version"])
+        self._jobs[job.id] = job
+        self._active[user_id] = job
+        self._tasks[job.id] = asyncio.create_task(self._run(job))
+        return job.to_dict()
+
+    async def _run(self, job: AnalysisJob):
+        job.status = JOB_RUNNING
+        route_timer = None
+        try:
+            prompt = await _build_prompt(job.user_id)
+            try:
+                await usage_ledger.check(job.user_id, TOKENS)
+            except QuotaExceeded as e:
+                await job.finish(JOB_FAILED, error="本时段 AI 用量已达上限，请稍后重试", retry_after=e.retry_after)
+                return
+            try:
+                llm_slot = await llm_scheduler.acquire(job.user_id, PRIORITY_ANALYSIS)
+            except SchedulerSaturated as e:
+                await job.finish(JOB_FAILED, error="AI 服务繁忙，请稍后重试", retry_after=e.retry_after)
+                return
+
+            stream_usage = None
+            try:
+                route = choose_model("analysis", prompt_chars=len(prompt))
+                route_timer = model_route_stats.timer(route)
+                async for chunk in llm_router.stream([{"role": "user", "content": prompt}], route=route.route):
+                    if chunk.usage:
+                        stream_usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        route_timer.first_token()
+                        await job.append(chunk.choices[0].delta.content)
+                route_timer.finish(usage=stream_usage)
+                route_timer = None
+            finally:
+                llm_slot.release()
+                if job.text or stream_usage:
+                    usage_ledger.charge(job.user_id, tokens=usage_tokens(stream_usage, len(prompt), len(job.text)))
+
+            async with AsyncSessionLocal() as db:
+                await record_learning_event(db, LearningRecord(
+                    user_id=job.user_id,
+                    event_type='ai_analysis',
+                    content=job.text
+                ), analysis_version=job.data_version)
+                await db.commit()
+            await job.finish(JOB_DONE)
+        except Exception as e:
+            logger.error(f"Analysis job {job.id} failed: {e}")
+            if route_timer is not None:
+                route_timer.finish(ok=False)
+            await job.finish(JOB_FAILED, error=str(e))
+        finally:
+            self._tasks.pop(job.id, None)
+            if self._active.get(job.user_id) is job:
+                self._active.pop(job.user_id, None)
+
+
+analysis_jobs = AnalysisJobRunner()
+register_cache("analysis_report", analysis_jobs)
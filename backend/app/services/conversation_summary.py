@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select, update
+
+from ..config import settings
+from ..database import AsyncSessionLocal, AsyncReadSessionLocal
+from ..models import ChatMessage, ChatSession
+from .llm_router import llm_router
+from .model_routing import choose_model
+from .llm_scheduler import llm_scheduler, SchedulerSaturated, PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """
+你负责维护一段对话的滚动摘要。下面给出【已有摘要】和【新增对话】，请把新增对话中的关键信息合并进摘要。
+
+要求：
+1. 保留用户的身份背景、偏好、正在解决的问题、已经得出的结论和未完成的事项。
+2. 去掉寒暄、重复内容和角色扮演的语气词。
+3. 使用简洁的中文陈述句，总长度不超过 {max_chars} 个字。
+4. 只输出摘要正文，不要输出任何解释。
+
+【已有摘要】
+{summary}
+
+【新增对话】
+{turns}
+"""
+
+
+def recent_messages(session_id: str, limit: int, *columns):
+    """
+    会话最近 limit 条消息的查询 (倒序)
+
+    对话历史窗口和摘要边界都用这个查询，排序键统一为 (id, created_at)：
+    摘要进度按 id 推进，若窗口按 created_at 取，时间戳与插入顺序不一致时窗口边缘的消息
+    既不在窗口内也不会被摘要。
+    """
+    return select(*columns).filter(
+        ChatMessage.session_id == session_id
+    ).order_by(ChatMessage.id.desc(), ChatMessage.created_at.desc()).limit(limit)
+
+
+async def _load_pending_turns(session_id: str) -> Tuple[Optional[str], int, List[Tuple[int, str, str]]]:
+    """
+    读取会话当前摘要，以及已经移出历史窗口、尚未被摘要的消息
+
+    返回 (summary, summary_message_id, [(id, role, content), ...])
+    """
+    async with AsyncReadSessionLocal() as db_local:
+        sess = await db_local.get(ChatSession, session_id)
+        if not sess:
+            return None, 0, []
+        upto_id = sess.summary_message_id or 0
+
+        # 历史窗口内最早的一条消息，窗口之前的消息才需要摘要
+        result = await db_local.execute(recent_messages(session_id, settings.HISTORY_WINDOW, ChatMessage.id))
+        window_ids = result.scalars().all()
+        if len(window_ids) < settings.HISTORY_WINDOW:
+            return sess.summary, upto_id, []
+        boundary_id = window_ids[-1]
+
+        result = await db_local.execute(select(ChatMessage.id, ChatMessage.role, ChatMessage.content).filter(
+            ChatMessage.session_id == session_id,
+            ChatMessage.id > upto_id,
+            ChatMessage.id < boundary_id
+        ).order_by(ChatMessage.id).limit(settings.SUMMARY_BATCH_MESSAGES))
+        return sess.summary, upto_id, [(r[0], r[1], r[2] or "") for r in result.all()]
+
+
+async def _save_summary(session_id: str, expected_upto_id: int, summary: str, new_upto_id: int) -> bool:
+    """
+    持久化摘要 (乐观并发：只有摘要进度没被其他任务推进时才写入)
+    """
+    async with AsyncSessionLocal() as db_local:
+        result = await db_local.execute(update(ChatSession).filter(
+            ChatSession.id == session_id,
+            ChatSession.summary_message_id == expected_upto_id
+        ).values({
+            ChatSession.summary: summary,
+            ChatSession.summary_message_id: new_upto_id,
+            # 摘要不是用户活动，保持 updated_at 不变，避免会话列表顺序被打乱
+            ChatSession.updated_at: ChatSession.updated_at,
+        }))
+        await db_local.commit()
+        return result.rowcount > 0
+
+
+class ConversationSummarizer:
+    """
+    会话滚动摘要的后台维护器
+
+    每轮对话结束后调用 schedule()，实际的摘要在后台任务中执行，不占用请求的关键路径。
+    同一会话同时只有一个摘要任务，期间的新调度会在当前任务结束后再补跑一次。
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._pending: Set[str] = set()
+
+    def schedule(self, session_id: Optional[str]):
+        if not settings.SUMMARY_ENABLED or not session_id:
+            return
+        task = self._tasks.get(session_id)
+        if task and not task.done():
+            self._pending.add(session_id)
+            return
+        self._tasks[session_id] = asyncio.create_task(self._run(session_id))
+
+    async def _run(self, session_id: str):
+        try:
+            while True:
+                self._pending.discard(session_id)
+                # 一次最多合并 SUMMARY_BATCH_MESSAGES 条，积压较多时循环追赶
+                while await self._summarize_once(session_id):
+                    pass
+                if session_id not in self._pending:
+                    break
+        except Exception as e:
+            logger.error(f"Summary error for session {session_id}: {e}")
+        finally:
+            self._tasks.pop(session_id, None)
+
+    async def _summarize_once(self, session_id: str) -> bool:
+        summary, upto_id, turns = await _load_pending_turns(session_id)
+        if len(turns) < settings.SUMMARY_MIN_NEW_MESSAGES:
+            return False
+
+        turns_text = "\n".join(
+            f"{'用户' if role == 'user' else '助手'}: {content[:settings.HISTORY_MESSAGE_MAX_CHARS]}"
+            for _, role, content in turns
+            if role != "system"
+        )
+        prompt = SUMMARY_PROMPT.format(
+            max_chars=settings.SUMMARY_MAX_CHARS,
+            summary=summary or "(无)",
+            turns=turns_text
+        )
+
+        # 摘要属于后台任务，使用最低优先级；上游饱和时放弃本次，等下一轮对话再补
+        try:
+            llm_slot = await llm_scheduler.acquire(None, PRIORITY_BACKGROUND)
+        except SchedulerSaturated:
+            logger.info(f"Skip summary for session {session_id}: LLM scheduler saturated")
+            return False
+        route = choose_model("summary", prompt_chars=len(prompt))
+        async with llm_slot:
+            response = await llm_router.complete(
+                [{"role": "user", "content": prompt}],
+                route=route.route,
+                temperature=0.3,
+            )
+        new_summary = (response.choices[0].message.content or "").strip()
+        if not new_summary:
+            return False
+        # 模型偶尔不遵守长度要求，这里硬截断，保证 Prompt 大小有上界
+        new_summary = new_summary[:settings.SUMMARY_MAX_CHARS]
+
+        saved = await _save_summary(session_id, upto_id, new_summary, turns[-1][0])
+        if saved:
+            logger.info(f"Session {session_id} summary advanced to message {turns[-1][0]}")
+        return saved and len(turns) >= settings.SUMMARY_BATCH_MESSAGES
+
+
+conversation_summarizer = ConversationSummarizer()
@@ -0,0 +1,270 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import openai
+from openai import AsyncOpenAI
+
+from ..config import settings
+from .model_routing import default_route_models
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBackend:
+    """
+    一个 OpenAI 兼容的上游 LLM 服务
+
+    记录首 Token 延迟的指数滑动平均 (EWMA) 和连续失败次数；
+    连续失败达到 LLM_EJECT_FAILURES 次后被暂时摘除 LLM_EJECT_SECONDS 秒。
+    """
+
+    def __init__(self, name: str, base_url: str, api_key: str, model: str,
+                 weight: float = 1.0, models: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.weight = weight
+        # 路由类别 (fast / text / vision) -> 本上游的模型名，例如 {"fast": "gpt-4o-mini", "vision": "gpt-4o"}；
+        # 没有配置的类别使用 model
+        self.models = models or {}
+        self.latency_ewma: Optional[float] = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.in_flight = 0
+        self.total_requests = 0
+        self.total_failures = 0
+        self._client: Optional[AsyncOpenAI] = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        # 复用客户端以复用连接池；重试由路由器负责，这里关闭 SDK 自带的重试
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                timeout=settings.LLM_REQUEST_TIMEOUT
+            )
+        return self._client
+
+    def resolve_model(self, route: Optional[str] = None) -> str:
+        """按路由类别取本上游的模型名 (不同厂商的模型名不通用，不能把其他上游的模型名直接发过来)"""
+        if not settings.MODEL_ROUTING_ENABLED or not route:
+            return self.model
+        return self.models.get(route, self.model)
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def record_success(self, latency: Optional[float] = None):
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        if latency is None:
+            return
+        alpha = settings.LLM_LATENCY_EWMA_ALPHA
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = alpha * latency + (1 - alpha) * self.latency_ewma
+
+    def record_failure(self, error: Exception):
+        self.consecutive_failures += 1
+        self.total_failures += 1
+        if self.consecutive_failures >= settings.LLM_EJECT_FAILURES:
+            self.ejected_until = time.monotonic() + settings.LLM_EJECT_SECONDS
+            logger.warning(
+                f"LLM backend {self.name} ejected for {settings.LLM_EJECT_SECONDS}s "
+                f"after {self.consecutive_failures} failures: {error}"
+            )
+        else:
+            logger.warning(f"LLM backend {self.name} failed ({self.consecutive_failures}): {error}")
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "model": self.model,
+            "weight": self.weight,
+            "healthy": self.is_healthy(time.monotonic()),
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "in_flight": self.in_flight,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+        }
+
+
+def _is_retryable(error: Exception) -> bool:
+    """请求本身有问题 (4xx，429 除外) 时换一个上游也没用，直接抛出"""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500 or error.status_code == 429
+    return True
+
+
+def load_backends() -> List[LLMBackend]:
+    """
+    从配置加载上游列表
+
+    LLM_BACKENDS 为 JSON 数组，每项包含 name / base_url / api_key / model / weight / models
+    (models 为路由类别到模型名的映射)；
+    未配置时退化为 LLM_BASE_URL + LLM_MODEL_NAME 单个上游，各类别的模型取 LLM_*_MODEL_NAME。
+    """
+    if not settings.LLM_BACKENDS.strip():
+        return [LLMBackend("default", settings.LLM_BASE_URL, settings.LLM_API_KEY, settings.LLM_MODEL_NAME,
+                           models=default_route_models())]
+
+    backends = []
+    for i, item in enumerate(json.loads(settings.LLM_BACKENDS)):
+        backends.append(LLMBackend(
+            name=item.get("name", f"backend-{i}"),
+            base_url=item["base_url"],
+            api_key=item.get("api_key", settings.LLM_API_KEY),
+            model=item.get("model", settings.LLM_MODEL_NAME),
+            weight=float(item.get("weight", 1.0)),
+            models=item.get("models"),
+        ))
+    return backends
+
+
+class LLMRouter:
+    """
+    多上游 LLM 路由
+
+    - 加权路由：有效权重 = 配置权重 / 首 Token 延迟 EWMA，越快的上游分到越多流量
+    - 健康摘除：连续失败的上游暂时摘除，到期后自动恢复接收流量 (再失败会立即再次摘除)
+    - 故障转移：在收到首个 Token 之前失败或超时，自动换一个上游重试；
+      首个 Token 之后的错误直接抛给调用方 (已经输出给用户的内容无法撤回)
+    """
+
+    def __init__(self, backends: Optional[List[LLMBackend]] = None):
+        self.backends = backends if backends is not None else load_backends()
+        self._warm_up_task: Optional[asyncio.Task] = None
+
+    def _candidates(self) -> List[LLMBackend]:
+        """按加权随机顺序排列候选上游；全部被摘除时仍然尝试 (fail-open)，最早恢复的排前面"""
+        now = time.monotonic()
+        healthy = [b for b in self.backends if b.is_healthy(now)]
+        if not healthy:
+            return sorted(self.backends, key=lambda b: b.ejected_until)
+
+        known = [b.latency_ewma for b in healthy if b.latency_ewma is not None]
+        default_latency = sum(known) / len(known) if known else 1.0
+        pool = [(b, b.weight / max(b.latency_ewma or default_latency, 0.05)) for b in healthy]
+
+        ordered = []
+        while pool:
+            total = sum(w for _, w in pool)
+            pick = random.uniform(0, total)
+            for i, (backend, w) in enumerate(pool):
+                pick -= w
+                if pick <= 0 or i == len(pool) - 1:
+                    ordered.append(backend)
+                    pool.pop(i)
+                    break
+        return ordered
+
+    async def stream(self, messages: List[dict], route: Optional[str] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        """
+        流式调用，逐个产出原始的 ChatCompletionChunk
+
+        route 为 choose_model() 选出的路由类别，每个上游按自己的配置解析成模型名。
+        首个 Chunk 之前的失败会切换上游重试，最多尝试 LLM_MAX_ATTEMPTS 个上游。
+        LLM_STREAM_USAGE 开启时最后一个 Chunk 不含 choices，只带 usage (用于用量配额)。
+        """
+        if settings.LLM_STREAM_USAGE:
+            kwargs.setdefault("stream_options", {"include_usage": True})
+        last_error: Optional[Exception] = None
+        for backend in self._candidates()[:settings.LLM_MAX_ATTEMPTS]:
+            start = time.monotonic()
+            backend.total_requests += 1
+            backend.in_flight += 1
+            response = None
+            try:
+                try:
+                    response = await asyncio.wait_for(
+                        backend.client.chat.completions.create(
+                            model=backend.resolve_model(route),
+                            messages=messages,
+                            stream=True,
+                            **kwargs
+                        ),
+                        timeout=settings.LLM_FIRST_TOKEN_TIMEOUT
+                    )
+                    iterator = response.__aiter__()
+                    # 建立连接和等待首个 Chunk 共用同一个超时预算
+                    remaining = settings.LLM_FIRST_TOKEN_TIMEOUT - (time.monotonic() - start)
+                    first = await asyncio.wait_for(iterator.__anext__(), timeout=max(remaining, 0.1))
+                except StopAsyncIteration:
+                    backend.record_success(time.monotonic() - start)
+                    return
+                except Exception as e:
+                    last_error = e
+                    if response is not None:
+                        # 释放已建立的连接，避免超时的上游继续占用连接池
+                        try:
+                            await response.close()
+                        except Exception:
+                            pass
+                    if not _is_retryable(e):
+                        raise
+                    backend.record_failure(e)
+                    continue
+
+                backend.record_success(time.monotonic() - start)
+                yield first
+                try:
+                    async for chunk in iterator:
+                        yield chunk
+                except Exception as e:
+                    backend.record_failure(e)
+                    raise
+                return
+            finally:
+                backend.in_flight -= 1
+
+        raise last_error or RuntimeError("No LLM backend available")
+
+    async def complete(self, messages: List[dict], route: Optional[str] = None, **kwargs: Any) -> Any:
+        """非流式调用，失败时切换上游重试 (整体耗时与首 Token 延迟不可比，不计入 EWMA)"""
+        last_error: Optional[Exception] = None
+        for backend in self._candidates()[:settings.LLM_MAX_ATTEMPTS]:
+            backend.total_requests += 1
+            backend.in_flight += 1
+            try:
+                response = await backend.client.chat.completions.create(
+                    model=backend.resolve_model(route),
+                    messages=messages,
+                    **kwargs
+                )
+            except Exception as e:
+                last_error = e
+                if not _is_retryable(e):
+                    raise
+                backend.record_failure(e)
+                continue
+            finally:
+                backend.in_flight -= 1
+            backend.record_success()
+            return response
+
+        raise last_error or RuntimeError("No LLM backend available")
+
+    def warm_up(self):
+        """
+        在后台线程中创建各上游的客户端
+
+        第一次创建 AsyncOpenAI 会导入 httpcore 并创建 SSL 上下文 (数百毫秒)，
+        放在第一个聊天请求里会阻塞事件循环 (事件循环看门狗抓到过)，启动时提前完成
+        """
+        self._warm_up_task = asyncio.create_task(asyncio.to_thread(lambda: [b.client for b in self.backends]))
+
+    def stats(self) -> List[dict]:
+        return [b.stats() for b in self.backends]
+
+
+llm_router = LLMRouter()
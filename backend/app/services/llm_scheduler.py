@@ -0,0 +1,238 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+from ..config import settings
+from .metrics import metrics
+from .request_trace import record_span
+
+logger = logging.getLogger(__name__)
+
+# --- 优先级 (数值越小越优先) ---
+PRIORITY_VOICE = 0       # 实时语音通话 (WebSocket)
+PRIORITY_CHAT = 1        # 文本聊天 (/api/chat)
+PRIORITY_ANALYSIS = 2    # 看板学习分析 (/api/learning/analyze)
+PRIORITY_BACKGROUND = 3  # 后台任务 (会话摘要等)
+
+PRIORITY_NAMES = {
+    PRIORITY_VOICE: "voice",
+    PRIORITY_CHAT: "chat",
+    PRIORITY_ANALYSIS: "analysis",
+    PRIORITY_BACKGROUND: "background",
+}
+
+
+def _queue_timeout(priority: int) -> float:
+    return {
+        PRIORITY_VOICE: settings.LLM_QUEUE_TIMEOUT_VOICE,
+        PRIORITY_CHAT: settings.LLM_QUEUE_TIMEOUT_CHAT,
+        PRIORITY_ANALYSIS: settings.LLM_QUEUE_TIMEOUT_ANALYSIS,
+    }.get(priority, settings.LLM_QUEUE_TIMEOUT_BACKGROUND)
+
+
+class SchedulerSaturated(Exception):
+    """调度器已饱和 (队列已满或排队超时)"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, priority: int, seq: int, user_id: Optional[str]):
+        self.priority = priority
+        self.seq = seq
+        self.user_id = user_id
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class LLMSlot:
+    """一个已获准的上游调用名额，使用完毕后必须 release() (可重复调用)"""
+
+    def __init__(self, scheduler: "LLMScheduler", user_id: Optional[str], priority: int, queue_wait: float):
+        self._scheduler = scheduler
+        self.user_id = user_id
+        self.priority = priority
+        self.queue_wait = queue_wait
+        self.acquired_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        self._scheduler._release(self)
+
+    def transfer(self) -> "LLMSlot":
+        """
+        把名额转交给新的持有者 (例如合并请求的上游任务)，之后本对象的 release() 不再生效
+
+        名额随实际的上游调用一起释放，而不是随最初申请它的请求释放。
+        """
+        if self.released:
+            raise RuntimeError("LLM slot already released")
+        self.released = True
+        slot = LLMSlot(self._scheduler, self.user_id, self.priority, self.queue_wait)
+        slot.acquired_at = self.acquired_at
+        return slot
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class LLMScheduler:
+    """
+    LLM 上游调用的准入控制与优先级调度
+
+    - 全局并发上限 LLM_MAX_CONCURRENCY，单用户并发上限 LLM_MAX_CONCURRENCY_PER_USER
+    - 超出上限的请求按优先级 (语音 > 文本聊天 > 看板分析 > 后台任务) 排队，同优先级先到先得
+    - 每个优先级有各自的排队截止时间；队列已满或排队超时会抛出 SchedulerSaturated，
+      由调用方快速返回 503 + Retry-After，而不是把压力传给上游导致 429
+    """
+
+    def __init__(self):
+        self._active = 0
+        self._active_per_user: Dict[str, int] = defaultdict(int)
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        # 统计信息
+        self._hold_ewma = 5.0 # 名额平均占用时长 (秒)，用于估算 Retry-After
+        self._wait_ewma: Dict[int, float] = defaultdict(float)
+        self._wait_max: Dict[int, float] = defaultdict(float)
+        self._admitted: Dict[int, int] = defaultdict(int)
+        self._rejected: Dict[int, int] = defaultdict(int)
+
+    def _user_has_room(self, user_id: Optional[str]) -> bool:
+        if user_id is None:
+            return True
+        return self._active_per_user[user_id] < settings.LLM_MAX_CONCURRENCY_PER_USER
+
+    def _retry_after(self) -> int:
+        # 粗略估计：排在前面的请求数 / 并发数 * 平均占用时长
+        rounds = (len(self._waiters) + 1) / max(settings.LLM_MAX_CONCURRENCY, 1)
+        return max(1, math.ceil(rounds * self._hold_ewma))
+
+    def _dispatch(self):
+        """按优先级把空闲名额分配给排队中的请求"""
+        if not self._waiters:
+            return
+        self._waiters.sort(key=lambda w: (w.priority, w.seq))
+        remaining = []
+        for waiter in self._waiters:
+            if waiter.future.done():
+                continue
+            if self._active < settings.LLM_MAX_CONCURRENCY and self._user_has_room(waiter.user_id):
+                self._active += 1
+                if waiter.user_id is not None:
+                    self._active_per_user[waiter.user_id] += 1
+                waiter.future.set_result(True)
+            else:
+                remaining.append(waiter)
+        self._waiters = remaining
+
+    def _reject(self, priority: int, reason: str):
+        self._rejected[priority] += 1
+        retry_after = self._retry_after()
+        logger.warning(
+            f"LLM scheduler saturated ({reason}): priority={PRIORITY_NAMES.get(priority)}, "
+            f"active={self._active}, queued={len(self._waiters)}, retry_after={retry_after}s"
+        )
+        raise SchedulerSaturated(reason, retry_after)
+
+    async def acquire(self, user_id: Optional[str], priority: int = PRIORITY_CHAT) -> LLMSlot:
+        """申请一个上游调用名额，必要时排队等待；饱和时抛出 SchedulerSaturated"""
+        if len(self._waiters) >= settings.LLM_MAX_QUEUE:
+            self._reject(priority, "queue full")
+
+        start = time.monotonic()
+        waiter = _Waiter(priority, next(self._seq), str(user_id) if user_id is not None else None)
+        self._waiters.append(waiter)
+        self._dispatch()
+
+        if not waiter.future.done():
+            try:
+                await asyncio.wait([waiter.future], timeout=_queue_timeout(priority))
+            except asyncio.CancelledError:
+                # 客户端在排队期间断开
+                if waiter.future.done() and not waiter.future.cancelled():
+                    self._release_counts(waiter.user_id)
+                else:
+                    waiter.future.cancel()
+                self._dispatch()
+                raise
+            if not waiter.future.done():
+                waiter.future.cancel()
+                self._dispatch()
+                self._reject(priority, "queue timeout")
+
+        queue_wait = time.monotonic() - start
+        record_span("queue", queue_wait)
+        self._admitted[priority] += 1
+        self._wait_ewma[priority] = 0.8 * self._wait_ewma[priority] + 0.2 * queue_wait
+        self._wait_max[priority] = max(self._wait_max[priority], queue_wait)
+        if queue_wait > 0.5:
+            logger.info(f"LLM slot granted after {queue_wait:.2f}s queue wait (priority={PRIORITY_NAMES.get(priority)})")
+        return LLMSlot(self, waiter.user_id, priority, queue_wait)
+
+    def _release_counts(self, user_id: Optional[str]):
+        self._active -= 1
+        if user_id is not None:
+            self._active_per_user[user_id] -= 1
+            if self._active_per_user[user_id] <= 0:
+                del self._active_per_user[user_id]
+
+    def _release(self, slot: LLMSlot):
+        held = time.monotonic() - slot.acquired_at
+        self._hold_ewma = 0.9 * self._hold_ewma + 0.1 * held
+        self._release_counts(slot.user_id)
+        self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "queued": len(self._waiters),
+            "max_concurrency": settings.LLM_MAX_CONCURRENCY,
+            "max_concurrency_per_user": settings.LLM_MAX_CONCURRENCY_PER_USER,
+            "avg_hold_seconds": round(self._hold_ewma, 3),
+            "priorities": {
+                name: {
+                    "admitted": self._admitted[p],
+                    "rejected": self._rejected[p],
+                    "queue_wait_avg_ms": round(self._wait_ewma[p] * 1000, 1),
+                    "queue_wait_max_ms": round(self._wait_max[p] * 1000, 1),
+                }
+                for p, name in PRIORITY_NAMES.items()
+            },
+        }
+
+
+llm_scheduler = LLMScheduler()
+metrics.callback("llm_scheduler_active", "LLM calls currently holding a slot", lambda: llm_scheduler._active)
+metrics.callback("llm_scheduler_queued", "LLM calls waiting for a slot", lambda: len(llm_scheduler._waiters))
+metrics.callback(
+    "llm_scheduler_rejections_total", "LLM calls rejected by admission control (503)",
+    lambda: {(name,): llm_scheduler._rejected[p] for p, name in PRIORITY_NAMES.items()},
+    kind="counter", labelnames=["priority"]
+)
+
+
+async def acquire_llm_slot(user_id: Optional[str], priority: int = PRIORITY_CHAT) -> LLMSlot:
+    """申请上游调用名额 - 饱和时返回 503 并附带 Retry-After"""
+    try:
+        return await llm_scheduler.acquire(user_id, priority)
+    except SchedulerSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Service busy, please try again later.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, List, Optional
+
+from ..config import settings
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+event_loop_lag_seconds = metrics.histogram(
+    "event_loop_lag_seconds", "Delay of the event loop waking up a periodic timer",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+event_loop_blocked_total = metrics.counter(
+    "event_loop_blocked_total", "Times the event loop was blocked longer than LOOP_BLOCK_THRESHOLD"
+)
+
+
+class BlockedLoop:
+    """一次事件循环阻塞：发现时间、持续时长 (结束后才确定) 和看门狗抓到的调用栈"""
+
+    def __init__(self, stack: List[str]):
+        self.stack = stack
+        self.duration: Optional[float] = None
+        self.at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "at": self.at,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "stack": self.stack,
+        }
+
+
+class LoopLagMonitor:
+    """
+    事件循环延迟监控 + 阻塞调用看门狗
+
+    - 心跳任务每 LOOP_LAG_INTERVAL 秒在事件循环中醒来一次，实际醒来时间与预期之差即循环延迟，记入直方图
+    - 看门狗线程检查心跳：超过 LOOP_BLOCK_THRESHOLD 秒没有更新说明有代码正在阻塞事件循环，
+      此时从 sys._current_frames() 取出事件循环线程的调用栈 (指向正在执行的阻塞代码) 并记录告警；
+      同一次阻塞只抓一次，阻塞结束后补上持续时长
+    - 最近的阻塞记录保存在内存中，由 /health/loop 返回
+    """
+
+    def __init__(self, interval: Optional[float] = None, threshold: Optional[float] = None,
+                 history: Optional[int] = None):
+        self.interval = interval or settings.LOOP_LAG_INTERVAL
+        self.threshold = threshold or settings.LOOP_BLOCK_THRESHOLD
+        self.blocks: Deque[BlockedLoop] = deque(maxlen=history or settings.LOOP_BLOCK_HISTORY)
+        self.max_lag = 0.0
+        self._heartbeat = 0.0
+        self._current: Optional[BlockedLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._watchdog.join(timeout=self.interval * 2)
+        self._watchdog = None
+
+    async def _beat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            event_loop_lag_seconds.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            current = self._current
+            if current is not None:
+                # 阻塞已经结束，补上持续时长
+                current.duration = lag
+                self._current = None
+                logger.warning(f"Event loop was blocked for {current.duration * 1000:.0f}ms")
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            heartbeat = self._heartbeat
+            # 心跳本身每 interval 秒更新一次，超出的部分才是阻塞时间
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.threshold or self._current is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = traceback.format_stack(frame) if frame is not None else []
+            del frame
+            if self._heartbeat != heartbeat:
+                # 抓取调用栈的同时事件循环已经恢复，这个调用栈不一定是阻塞的代码
+                continue
+            block = BlockedLoop(stack)
+            self._current = block
+            self.blocks.append(block)
+            event_loop_blocked_total.inc()
+            logger.warning(
+                f"Event loop blocked for more than {blocked * 1000:.0f}ms, currently executing:\n"
+                + "".join(stack[-settings.LOOP_BLOCK_STACK_DEPTH:])
+            )
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_ms": round(self.interval * 1000, 1),
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "blocked_now": self._current is not None,
+            "recent_blocks": [block.to_dict() for block in self.blocks],
+        }
+
+
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,136 @@
+import logging
+import re
+from datetime import datetime
+from typing import List, Tuple
+
+from sqlalchemy import Integer, column, func, literal_column, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models import ChatMessage, ChatSession
+from .session_archiver import archived_messages, archived_sessions
+
+logger = logging.getLogger(__name__)
+
+# trigram 分词只能匹配不少于 3 个字符的词，更短的词用 LIKE 在 FTS 命中 (或用户自己的消息) 中过滤
+TRIGRAM_MIN_CHARS = 3
+
+# 由迁移 0008 创建，rowid 即 chat_messages.id
+chat_messages_fts = table("chat_messages_fts", column("rowid", Integer))
+FTS = literal_column("chat_messages_fts")
+
+
+def split_terms(query: str) -> List[str]:
+    """按空白拆分搜索词 (多个词之间为 AND)，去重并保持顺序"""
+    terms = []
+    for term in query[:settings.SEARCH_MAX_QUERY_CHARS].split():
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def fts_phrase(term: str) -> str:
+    """把用户输入转成 FTS5 短语，避免引号、AND / OR / NEAR 等被当成查询语法"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _contains(term: str, ignore_case: bool = False):
+    """子串匹配，转义用户输入中的 LIKE 通配符"""
+    pattern = "%" + re.sub(r"([\\%_])", r"\\\1", term) + "%"
+    if ignore_case:
+        return ChatMessage.content.ilike(pattern, escape="\\")
+    return ChatMessage.content.like(pattern, escape="\\")
+
+
+def snippet(content: str, terms: List[str]) -> str:
+    """截取第一个命中词附近的片段"""
+    width = settings.SEARCH_SNIPPET_CHARS
+    lowered = content.lower()
+    hits = [i for i in (lowered.find(t.lower()) for t in terms) if i >= 0]
+    start = max(0, min(hits) - width // 4) if hits else 0
+    text = content[start:start + width]
+    return ("…" if start > 0 else "") + text + ("…" if start + width < len(content) else "")
+
+
+async def search_messages(db: AsyncSession, user_id: int, query: str,
+                          limit: int, offset: int = 0) -> Tuple[List[dict], bool]:
+    """
+    在用户自己的会话中搜索消息，返回 (结果, 是否还有下一页)
+
+    - SQLite: FTS5 trigram 索引 MATCH，按 bm25 相关度排序
+    - PostgreSQL: ILIKE (pg_trgm GIN 索引)，按 similarity() 排序
+    - 其他数据库，或所有词都短于 3 个字符时: LIKE 过滤用户自己的消息，按时间倒序
+
+    已归档会话的消息不在 chat_messages (也不在索引) 中，排在 chat_messages 的结果之后，
+    翻到这部分时逐个解压用户的归档按子串 (不区分大小写) 匹配，按时间倒序。
+    """
+    terms = split_terms(query)
+    if not terms:
+        return [], False
+
+    dialect_name = db.bind.dialect.name
+    long_terms = [t for t in terms if len(t) >= TRIGRAM_MIN_CHARS]
+
+    stmt = select(
+        ChatMessage.id, ChatMessage.session_id, ChatSession.title, ChatSession.mode,
+        ChatMessage.role, ChatMessage.content, ChatMessage.created_at
+    )
+    if dialect_name == "sqlite" and long_terms:
+        stmt = stmt.select_from(chat_messages_fts).join(
+            ChatMessage, ChatMessage.id == chat_messages_fts.c.rowid
+        ).join(ChatSession, ChatMessage.session_id == ChatSession.id).filter(
+            FTS.op("MATCH")(" ".join(fts_phrase(t) for t in long_terms)),
+            *[_contains(t) for t in terms if t not in long_terms]
+        ).order_by(func.bm25(FTS), ChatMessage.id.desc())
+    elif dialect_name == "postgresql":
+        stmt = stmt.join(ChatSession, ChatMessage.session_id == ChatSession.id).filter(
+            *[_contains(t, ignore_case=True) for t in terms]
+        ).order_by(func.similarity(ChatMessage.content, " ".join(terms)).desc(), ChatMessage.id.desc())
+    else:
+        stmt = stmt.join(ChatSession, ChatMessage.session_id == ChatSession.id).filter(
+            *[_contains(t) for t in terms]
+        ).order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+
+    # data: 图片不在 FTS 索引中，其他路径也一并排除
+    stmt = stmt.filter(
+        ChatSession.user_id == user_id,
+        ChatSession.deleted_at.is_(None),
+        ChatMessage.content.notlike("data:%")
+    )
+    result = await db.execute(stmt.limit(limit + 1).offset(offset))
+    rows = [row._mapping for row in result.all()]
+
+    if len(rows) <= limit:
+        # chat_messages 的结果到此为止，剩下的位置由归档中的命中补上
+        live_total = offset + len(rows)
+        if not rows and offset:
+            live_total = await db.scalar(select(func.count()).select_from(stmt.order_by(None).subquery()))
+        archived = await _search_archives(db, user_id, terms)
+        start = max(0, offset - live_total)
+        rows += archived[start:start + limit + 1 - len(rows)]
+
+    items = [{
+        "message_id": row["id"],
+        "session_id": row["session_id"],
+        "session_title": row["title"],
+        "mode": row["mode"],
+        "role": row["role"],
+        "snippet": snippet(row["content"], terms),
+        "created_at": row["created_at"],
+    } for row in rows[:limit]]
+    return items, len(rows) > limit
+
+
+async def _search_archives(db: AsyncSession, user_id: int, terms: List[str]) -> List[dict]:
+    """在用户已归档会话的消息中做子串匹配 (所有词都要命中)，按时间倒序"""
+    lowered = [t.lower() for t in terms]
+    hits = []
+    for session in await archived_sessions(db, user_id):
+        for message in await archived_messages(db, session.id):
+            content = message["content"]
+            if not content or content.startswith("data:"):
+                continue
+            if all(t in content.lower() for t in lowered):
+                hits.append({**message, "session_id": session.id, "title": session.title, "mode": session.mode})
+    hits.sort(key=lambda m: (m["created_at"] or datetime.min, m["id"]), reverse=True)
+    return hits
@@ -0,0 +1,326 @@
+import time
+import weakref
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from sqlalchemy import event
+
+from .request_trace import record_span
+
+# 延迟类直方图的默认分桶 (秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("upper", "counts", "sum")
+
+    def __init__(self, upper: Tuple[float, ...]):
+        self.upper = upper
+        # 各桶自身的计数 (不累加)，最后一个为 +Inf
+        self.counts = [0] * (len(upper) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        # le 含边界：value <= upper[i] 落在第 i 个桶
+        self.counts[bisect_left(self.upper, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+
+    def labels(self, *values):
+        """按标签值取子序列；热路径上可以把返回值保存下来重复使用"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for values, child in self._children.items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self):
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class _Callback(_Metric):
+    """抓取时才读取的指标 (缓存命中数、调度器队列长度等已有统计)，热路径上没有额外开销"""
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: Sequence[str],
+                 read: Callable[[], object]):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.read = read
+
+    def samples(self):
+        result = self.read()
+        items = result.items() if isinstance(result, dict) else [((), result)]
+        for values, value in items:
+            if value is None:
+                continue
+            values = values if isinstance(values, tuple) else (values,)
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    """
+    进程内指标注册表，/metrics 以 Prometheus 文本格式输出
+
+    记录一次观测只是一次字典查找 + 整数加法 (直方图再加一次二分查找)，没有锁：
+    记录都发生在事件循环线程中 (数据库事件在 greenlet 中，仍是同一线程)；
+    例外是事件循环看门狗线程，它只写自己独占的计数器。
+    多 worker 部署时每个进程单独输出，由 Prometheus 按实例聚合。
+    """
+
+    def __init__(self, prefix: str = "kkchat_"):
+        self.prefix = prefix
+        self._metrics: List[_Metric] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        if not metric.labelnames and not isinstance(metric, _Callback):
+            # 没有标签的指标从 0 开始输出，而不是第一次记录后才出现
+            metric.labels()
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self.prefix + name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self.prefix + name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, read: Callable[[], object],
+                 kind: str = "gauge", labelnames: Sequence[str] = ()):
+        """read() 返回一个数值，或 {标签值 (元组): 数值}"""
+        self._register(_Callback(self.prefix + name, documentation, kind, labelnames, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# --- LLM ---
+llm_ttft_seconds = metrics.histogram(
+    "llm_ttft_seconds", "LLM time to first token", ["route"],
+    buckets=(0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 15.0)
+)
+llm_tokens_per_second = metrics.histogram(
+    "llm_tokens_per_second", "LLM completion tokens per second after the first token", ["route"],
+    buckets=(1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300)
+)
+llm_requests_total = metrics.counter("llm_requests_total", "LLM streaming calls by outcome", ["route", "outcome"])
+
+# --- 流式连接 ---
+sse_streams_active = metrics.gauge("sse_streams_active", "Chat SSE streams currently open")
+websocket_connections_active = metrics.gauge("websocket_connections_active", "Voice/video WebSocket connections currently open")
+
+# --- TTS ---
+tts_latency_seconds = metrics.histogram("tts_latency_seconds", "TTS synthesis latency", ["outcome"])
+tts_audio_bytes = metrics.histogram(
+    "tts_audio_bytes", "Size of synthesized TTS audio",
+    buckets=(1024, 4096, 16384, 32768, 65536, 131072, 262144, 524288, 1048576)
+)
+
+# --- 手势识别 ---
+vision_frames_total = metrics.counter(
+    "vision_frames_total", "Video frames received for gesture recognition", ["result"]
+)
+vision_inference_seconds = metrics.histogram(
+    "vision_inference_seconds", "Gesture recognition time per frame",
+    buckets=(0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0)
+)
+
+# --- 数据库 ---
+db_query_seconds = metrics.histogram("db_query_seconds", "Database statement execution time", ["engine", "statement"])
+db_commit_seconds = metrics.histogram("db_commit_seconds", "Session commit time (flush + COMMIT)")
+
+# --- 限流 / 缓存 ---
+rate_limit_rejections_total = metrics.counter(
+    "rate_limit_rejections_total", "Requests rejected by the API rate limiter", ["scope"]
+)
+
+# 各缓存对象自己维护 hits / misses 计数，抓取时读取
+_caches: Dict[str, object] = {}
+
+
+def register_cache(name: str, cache):
+    """cache 需要有 hits / misses 属性"""
+    _caches[name] = cache
+
+
+def _cache_requests() -> Dict[tuple, int]:
+    result = {}
+    for name, cache in _caches.items():
+        result[(name, "hit")] = cache.hits
+        result[(name, "miss")] = cache.misses
+    return result
+
+
+def _cache_hit_ratios() -> Dict[tuple, float]:
+    return {(name,): cache.hits / (cache.hits + cache.misses)
+            for name, cache in _caches.items() if cache.hits + cache.misses}
+
+
+metrics.callback("cache_requests_total", "Cache lookups by result", _cache_requests,
+                 kind="counter", labelnames=["cache", "result"])
+metrics.callback("cache_hit_ratio", "Cache hit ratio since process start", _cache_hit_ratios, labelnames=["cache"])
+
+
+# 已注册计时事件的引擎和 Session 类：应用生命周期可能在同一进程内运行多次 (测试)，重复注册会重复计数
+_instrumented = weakref.WeakSet()
+
+
+def instrument_engine(engine, role: str):
+    """记录引擎上每条语句的执行时间 (按 SQL 动词分类)，engine 为同步引擎 (异步引擎的 sync_engine)"""
+    if engine in _instrumented:
+        return
+    _instrumented.add(engine)
+    # 开始时间记在语句自己的执行上下文上：语句出错时 after_cursor_execute 不会触发，
+    # 放在连接上的话会残留下来，之后的语句取到错误的开始时间
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_start", None)
+        if started is None:
+            return
+        verb = statement.lstrip()[:6].lower()
+        if verb not in ("select", "insert", "update", "delete"):
+            verb = "other"
+        elapsed = time.perf_counter() - started
+        db_query_seconds.labels(role, verb).observe(elapsed)
+        record_span("db", elapsed)
+
+
+def instrument_sessions(session_class):
+    """
+    记录会话提交耗时 (异步会话的事件注册在其内部的同步 Session 类上)
+
+    传入应用自己的 Session 子类，不要传 sqlalchemy.orm.Session：事件会作用到进程内所有会话 (包括 Alembic 等第三方代码)。
+    """
+    if session_class in _instrumented:
+        return
+    _instrumented.add(session_class)
+    @event.listens_for(session_class, "before_commit")
+    def _before(session):
+        session.info["metrics_commit_start"] = time.perf_counter()
+
+    @event.listens_for(session_class, "after_commit")
+    def _after(session):
+        started = session.info.pop("metrics_commit_start", None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            db_commit_seconds.observe(elapsed)
+            record_span("db_commit", elapsed)
+
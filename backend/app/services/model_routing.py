@@ -0,0 +1,165 @@
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+from ..config import settings
+from .metrics import llm_requests_total, llm_tokens_per_second, llm_ttft_seconds
+from .request_trace import record_span
+
+logger = logging.getLogger(__name__)
+
+# --- 路由类别 ---
+ROUTE_VISION = "vision"  # 带图片的多模态请求
+ROUTE_TEXT = "text"      # 专业模式 / 长 Prompt / 看板分析
+ROUTE_FAST = "fast"      # 闲聊短消息 / 语音通话 / 后台摘要
+
+
+class RouteDecision:
+    """
+    路由结果：route 为路由类别，调用 llm_router 时传入，由各上游解析成自己的模型名；
+    model 为默认上游 (LLM_*_MODEL_NAME) 上对应的模型，用于日志和统计
+    """
+
+    def __init__(self, route: str, model: str, reason: str):
+        self.route = route
+        self.model = model
+        self.reason = reason
+
+    def __repr__(self):
+        return f"RouteDecision(route={self.route}, model={self.model}, reason={self.reason})"
+
+
+def _model_for(route: str) -> str:
+    return {
+        ROUTE_VISION: settings.LLM_VISION_MODEL_NAME or settings.LLM_MODEL_NAME,
+        ROUTE_TEXT: settings.LLM_TEXT_MODEL_NAME or settings.LLM_MODEL_NAME,
+        ROUTE_FAST: settings.LLM_FAST_MODEL_NAME or settings.LLM_MODEL_NAME,
+    }[route]
+
+
+def default_route_models() -> Dict[str, str]:
+    """未配置 LLM_BACKENDS 时，单个默认上游的路由类别 -> 模型名"""
+    return {route: _model_for(route) for route in (ROUTE_VISION, ROUTE_TEXT, ROUTE_FAST)}
+
+
+def choose_model(mode: Optional[str], has_images: bool = False, prompt_chars: int = 0) -> RouteDecision:
+    """
+    根据请求形态选择模型
+
+    - 带图片：必须使用视觉模型
+    - 语音通话 / 后台摘要：优先低延迟的快速模型
+    - Prompt 较长、专业模式、看板分析：使用能力更强的文本模型
+    - 其余闲聊短消息：快速模型
+    """
+    if not settings.MODEL_ROUTING_ENABLED:
+        return RouteDecision(ROUTE_VISION, settings.LLM_MODEL_NAME, "routing disabled")
+
+    if has_images:
+        route, reason = ROUTE_VISION, "images attached"
+    elif mode in ("voice", "summary"):
+        route, reason = ROUTE_FAST, f"{mode} mode"
+    elif prompt_chars > settings.MODEL_ROUTING_LONG_PROMPT_CHARS:
+        route, reason = ROUTE_TEXT, f"long prompt ({prompt_chars} chars)"
+    elif mode in ("professional", "analysis"):
+        route, reason = ROUTE_TEXT, f"{mode} mode"
+    else:
+        route, reason = ROUTE_FAST, "short casual text"
+
+    decision = RouteDecision(route, _model_for(route), reason)
+    model_route_stats.record_choice(decision)
+    return decision
+
+
+def prompt_size(messages) -> int:
+    """估算 Prompt 字符数 (多模态消息只计算文本部分)"""
+    total = 0
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, str):
+            total += len(content)
+        elif isinstance(content, list):
+            total += sum(len(part.get("text", "")) for part in content if part.get("type") == "text")
+    return total
+
+
+class RouteTimer:
+    """记录一次路由调用的首 Token 延迟、生成速度与总耗时"""
+
+    def __init__(self, stats: "ModelRouteStats", decision: RouteDecision):
+        self._stats = stats
+        self.decision = decision
+        self.start = time.monotonic()
+        self.ttft: Optional[float] = None
+        self.chunks = 0
+
+    def first_token(self):
+        """每个内容 Chunk 调用一次 (Token 循环中只做一次计数)"""
+        self.chunks += 1
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self.start
+
+    def finish(self, ok: bool = True, usage=None):
+        """usage 为上游返回的用量；没有时按内容 Chunk 数估算生成的 Token 数"""
+        total = time.monotonic() - self.start
+        self._stats.record_latency(self.decision.route, self.ttft, total, ok)
+        record_span("llm", total)
+        route = self.decision.route
+        llm_requests_total.labels(route, "ok" if ok else "error").inc()
+        if not ok or self.ttft is None:
+            return
+        llm_ttft_seconds.labels(route).observe(self.ttft)
+        record_span("llm_ttft", self.ttft)
+        generating = total - self.ttft
+        tokens = getattr(usage, "completion_tokens", None) or self.chunks
+        if generating > 0 and tokens > 1:
+            # 首个 Token 之后的生成速度
+            llm_tokens_per_second.labels(route).observe((tokens - 1) / generating)
+
+
+class ModelRouteStats:
+    """各路由的选择次数与延迟统计 (EWMA)"""
+
+    def __init__(self):
+        self._choices: Dict[str, int] = defaultdict(int)
+        self._reasons: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._errors: Dict[str, int] = defaultdict(int)
+        self._ttft_ewma: Dict[str, float] = {}
+        self._total_ewma: Dict[str, float] = {}
+        self._models: Dict[str, str] = {}
+
+    def record_choice(self, decision: RouteDecision):
+        self._choices[decision.route] += 1
+        self._reasons[decision.route][decision.reason] += 1
+        self._models[decision.route] = decision.model
+
+    def timer(self, decision: RouteDecision) -> RouteTimer:
+        return RouteTimer(self, decision)
+
+    @staticmethod
+    def _ewma(table: Dict[str, float], route: str, value: float):
+        table[route] = value if route not in table else 0.8 * table[route] + 0.2 * value
+
+    def record_latency(self, route: str, ttft: Optional[float], total: float, ok: bool):
+        if not ok:
+            self._errors[route] += 1
+            return
+        if ttft is not None:
+            self._ewma(self._ttft_ewma, route, ttft)
+        self._ewma(self._total_ewma, route, total)
+
+    def stats(self) -> dict:
+        return {
+            route: {
+                "model": self._models.get(route),
+                "chosen": self._choices[route],
+                "reasons": dict(self._reasons[route]),
+                "errors": self._errors[route],
+                "ttft_avg_ms": round(self._ttft_ewma[route] * 1000, 1) if route in self._ttft_ewma else None,
+                "total_avg_ms": round(self._total_ewma[route] * 1000, 1) if route in self._total_ewma else None,
+            }
+            for route in (ROUTE_VISION, ROUTE_TEXT, ROUTE_FAST)
+        }
+
+
+model_route_stats = ModelRouteStats()
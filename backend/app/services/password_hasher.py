@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from passlib.context import CryptContext
+
+from ..config import settings
+from .request_trace import trace_span
+
+logger = logging.getLogger(__name__)
+
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+
+
+# 以下函数在工作进程中执行，必须是模块级函数 (可被 pickle)
+def _init_worker(niceness: int):
+    # 降低哈希进程的调度优先级：CPU 紧张时优先保证主进程 (事件循环) 上的流式对话
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class HasherSaturated(Exception):
+    """排队中的哈希任务已达上限"""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__("password hasher saturated")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    在独立的进程池中计算密码哈希 (pbkdf2_sha256 每次几十毫秒 CPU)
+
+    - 登录 / 注册高峰时不再阻塞事件循环，同一 worker 上的流式对话不受影响
+    - 进程数 PASSWORD_HASH_WORKERS，进行中 + 排队的任务最多 PASSWORD_HASH_MAX_PENDING 个，
+      超出时抛出 HasherSaturated (接口返回 503)，而不是无限排队
+    - 使用 spawn 启动工作进程：主进程里已有事件循环和数据库线程，fork 不安全
+    - 工作进程以 PASSWORD_HASH_NICE 降低优先级运行，CPU 核数少时也不会和事件循环抢占
+    - 工作进程异常退出时重建进程池重试一次，仍失败则抛出 HasherSaturated
+    - PASSWORD_HASH_WORKERS = 0 时不建进程池，在线程池中计算；
+      PASSWORD_HASH_INLINE 时在事件循环中同步计算 (优化前的行为，仅供 bench_login_ttft.py 对比)
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 inline: Optional[bool] = None):
+        self.workers = settings.PASSWORD_HASH_WORKERS if workers is None else workers
+        self.inline = settings.PASSWORD_HASH_INLINE if inline is None else inline
+        self.max_pending = max_pending or settings.PASSWORD_HASH_MAX_PENDING
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self.rejected = 0
+
+    def start(self):
+        """创建进程池并预先拉起全部工作进程，避免第一批登录承担进程启动开销"""
+        if self._executor is not None or self.workers <= 0 or self.inline:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(settings.PASSWORD_HASH_NICE,)
+        )
+        for _ in range(self.workers):
+            self._executor.submit(os.getpid)
+        logger.info(f"Password hasher started with {self.workers} process(es)")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        # 不等待：坏掉的进程池里可能还有卡住的进程，不能在事件循环上 join
+        # 并发任务可能已经换上了新的进程池，只清掉出错的那一个
+        if self._executor is executor:
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn, *args):
+        if self.inline:
+            return fn(*args)
+        if self.workers <= 0:
+            return await asyncio.to_thread(fn, *args)
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise HasherSaturated()
+        self._pending += 1
+        try:
+            # 工作进程异常退出 (如被 OOM kill) 时重建进程池重试一次，仍失败则按繁忙处理
+            for _ in range(2):
+                self.start()
+                executor = self._executor
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+                except BrokenProcessPool:
+                    logger.error("Password hasher pool is broken, recreating")
+                    self._discard(executor)
+            self.rejected += 1
+            raise HasherSaturated()
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        with trace_span("password_hash"):
+            return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        with trace_span("password_hash"):
+            return await self._run(verify_password, plain_password, hashed_password)
+
+
+password_hasher = PasswordHasher()
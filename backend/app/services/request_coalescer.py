@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+
+from ..config import settings
+from .llm_scheduler import LLMSlot
+from .metrics import register_cache
+
+logger = logging.getLogger(__name__)
+
+# 队列中的结束标记
+_DONE = object()
+
+
+class _Flight:
+    """一次正在进行中的上游流式请求，以及订阅它的所有 SSE 连接"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.task: Optional[asyncio.Task] = None
+        # 发起者的上游调用名额，由上游任务持有到结束
+        self.slot: Optional[LLMSlot] = None
+
+
+class RequestCoalescer:
+    """
+    相同 LLM 请求的单飞合并 (single-flight)
+
+    同一时刻内容完全相同的请求 (模式、System Prompt、历史记录和当前问题都一致)
+    只向上游发起一次流式调用，产生的每个片段扇出给所有订阅者。
+    完成后的结果会短暂缓存，稍晚到达的相同请求直接回放缓存。
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        # 命中缓存或并入进行中的请求记为 hit，发起新的上游调用记为 miss
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def enabled_for(mode: Optional[str]) -> bool:
+        if not settings.LLM_COALESCE_ENABLED:
+            return False
+        modes = [m.strip() for m in settings.LLM_COALESCE_MODES.split(",") if m.strip()]
+        return (mode or "casual") in modes
+
+    @staticmethod
+    def make_key(mode: Optional[str], route: str, messages: List[dict]) -> str:
+        """
+        根据规范化后的 Prompt 计算合并键
+
+        只有纯文本消息参与合并；内容中的空白字符会被折叠，避免格式差异导致无法合并。
+        """
+        normalized = [
+            {"role": m["role"], "content": " ".join(str(m["content"]).split())}
+            for m in messages
+        ]
+        raw = json.dumps([mode or "casual", route, normalized], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _get_cached(self, key: str) -> Optional[List[str]]:
+        now = time.monotonic()
+        # 清理过期缓存 (OrderedDict 按写入时间排序，过期的都在最前面)
+        while self._cache:
+            oldest_key, (expire_at, _) = next(iter(self._cache.items()))
+            if expire_at > now:
+                break
+            self._cache.pop(oldest_key)
+        entry = self._cache.get(key)
+        return entry[1] if entry else None
+
+    def _put_cached(self, key: str, chunks: List[str]):
+        if settings.LLM_COALESCE_CACHE_TTL <= 0:
+            return
+        self._cache.pop(key, None)
+        self._cache[key] = (time.monotonic() + settings.LLM_COALESCE_CACHE_TTL, chunks)
+        while len(self._cache) > settings.LLM_COALESCE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]],
+                     slot: Optional[LLMSlot] = None) -> AsyncIterator[str]:
+        """
+        订阅 key 对应的结果流
+
+        - 命中缓存：直接回放
+        - 已有进行中的请求：先回放已产生的片段，再接收后续片段
+        - 否则：调用 factory() 发起上游请求，自己成为第一个订阅者
+
+        slot 为调用方已申请的上游名额，交由合并器管理：复用进行中的请求或缓存时立即释放；
+        发起新的上游请求时转交给上游任务，直到上游结束才释放。
+        发起者中途断开时其他订阅者仍在接收同一个上游流，这期间名额不能提前归还，否则并发上限失效。
+        """
+        cached = self._get_cached(key)
+        if cached is not None:
+            if slot is not None:
+                slot.release()
+            self.hits += 1
+            logger.info(f"Coalescer cache hit: {key[:12]}")
+            for chunk in cached:
+                yield chunk
+            return
+
+        flight = self._flights.get(key)
+        if flight is None:
+            self.misses += 1
+            flight = _Flight()
+            if slot is not None:
+                flight.slot = slot.transfer()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, factory))
+        else:
+            if slot is not None:
+                slot.release()
+            self.hits += 1
+            logger.info(f"Coalescer joined in-flight request: {key[:12]} ({len(flight.subscribers)} subscribers)")
+
+        # 快照与注册之间没有 await，不会漏掉片段
+        queue: asyncio.Queue = asyncio.Queue()
+        replay = list(flight.chunks)
+        flight.subscribers.add(queue)
+        try:
+            for chunk in replay:
+                yield chunk
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            flight.subscribers.discard(queue)
+
+    async def _run(self, key: str, flight: _Flight, factory: Callable[[], AsyncIterator[str]]):
+        # 上游请求在独立任务中运行，某个订阅者断开不会影响其他订阅者
+        result = RuntimeError("Coalesced upstream request cancelled")
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                for queue in flight.subscribers:
+                    queue.put_nowait(chunk)
+            self._put_cached(key, flight.chunks)
+            result = _DONE
+        except Exception as e:
+            logger.error(f"Coalesced upstream error: {e}")
+            result = e
+        finally:
+            self._flights.pop(key, None)
+            if flight.slot is not None:
+                flight.slot.release()
+            for queue in flight.subscribers:
+                queue.put_nowait(result)
+
+
+request_coalescer = RequestCoalescer()
+register_cache("llm_coalesce", request_coalescer)
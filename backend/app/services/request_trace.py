@@ -0,0 +1,98 @@
+import contextvars
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from ..config import settings
+
+# 单独的 logger，便于把追踪日志输出到独立的文件 / 采集管道
+trace_logger = logging.getLogger("app.trace")
+
+# 当前请求 (或 WebSocket 的当前一轮对话) 的追踪，服务层通过 record_span / trace_span 写入
+current_trace: contextvars.ContextVar[Optional["RequestTrace"]] = contextvars.ContextVar("current_trace", default=None)
+
+
+class RequestTrace:
+    """
+    一次请求的分阶段耗时
+
+    - 同名阶段累加 (例如一轮对话中的多次 TTS、多条 SQL)，同时记录次数
+    - server_timing() 生成 Server-Timing 头；to_dict() 用于 SSE / WebSocket 的 timing 事件和 JSON 追踪日志
+    - 通过 with 语句成为当前追踪 (contextvar)，退出时按 TRACE_LOG_ENABLED 写一行 JSON 日志
+    """
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        # 阶段名 -> [累计秒数, 次数]，按首次出现的顺序
+        self.stages: Dict[str, List[float]] = {}
+        self._token = None
+
+    def add(self, stage: str, seconds: float):
+        entry = self.stages.get(stage)
+        if entry is None:
+            self.stages[stage] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        """Server-Timing 头：各阶段耗时 + 到目前为止的总耗时 (流式响应为首字节之前的部分)"""
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, (seconds, _) in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed * 1000:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace": self.name,
+            **self.attrs,
+            "total_ms": round(self.elapsed * 1000, 1),
+            "stages": {stage: round(seconds * 1000, 1) for stage, (seconds, _) in self.stages.items()},
+            "counts": {stage: int(count) for stage, (_, count) in self.stages.items() if count > 1},
+        }
+
+    def log(self):
+        if settings.TRACE_LOG_ENABLED and self.elapsed * 1000 >= settings.TRACE_LOG_MIN_MS:
+            trace_logger.info(json.dumps(self.to_dict(), ensure_ascii=False))
+
+    def __enter__(self) -> "RequestTrace":
+        self._token = current_trace.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        current_trace.reset(self._token)
+        self.log()
+        return False
+
+
+def record_span(stage: str, seconds: float):
+    """把已测得的耗时计入当前追踪 (没有进行中的追踪时忽略)"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def trace_span(stage: str):
+    """计时一段代码并计入当前追踪"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(stage):
+        yield
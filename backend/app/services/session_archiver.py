@@ -0,0 +1,193 @@
+import json
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import ChatArchive, ChatMessage, ChatSession
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_FIELDS = ("id", "role", "content", "tokens", "created_at")
+
+
+def resolve_codec(name: Optional[str] = None) -> str:
+    """配置的压缩算法；选了 zstd 但没有安装 zstandard 时退回 zlib"""
+    name = (name or settings.ARCHIVE_CODEC).lower()
+    if name == "zstd" and zstandard is None:
+        logger.warning("zstandard is not installed, archiving with zlib")
+        return "zlib"
+    if name not in ("zlib", "zstd"):
+        raise ValueError(f"Unknown archive codec: {name}")
+    return name
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    level = settings.ARCHIVE_COMPRESSION_LEVEL
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return zlib.compress(data, level)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd archives")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def encode_messages(rows) -> bytes:
+    """[(id, role, content, tokens, created_at), ...] -> 紧凑 JSON (每条消息一个数组)"""
+    return json.dumps(
+        [[r[0], r[1], r[2], r[3], r[4].isoformat() if r[4] else None] for r in rows],
+        ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+def decode_messages(archive: ChatArchive) -> List[dict]:
+    """按时间正序返回归档中的消息"""
+    rows = json.loads(decompress(archive.payload, archive.codec))
+    return [{
+        "id": r[0],
+        "session_id": archive.session_id,
+        "role": r[1],
+        "content": r[2],
+        "tokens": r[3],
+        "created_at": datetime.fromisoformat(r[4]) if r[4] else None,
+    } for r in rows]
+
+
+def archive_session(db: Session, session_id: str, cutoff: datetime, codec: str) -> Optional[ChatArchive]:
+    """
+    把一个会话的消息压缩进 chat_archives 并从 chat_messages 删除 (单个事务)
+
+    先带条件更新会话行：会话在此期间又有新消息 (updated_at 变新) 或被删除时跳过，返回 None。
+    """
+    claimed = db.execute(update(ChatSession).filter(
+        ChatSession.id == session_id,
+        ChatSession.updated_at < cutoff,
+        ChatSession.archived_at.is_(None),
+        ChatSession.deleted_at.is_(None)
+    ).values(archived_at=datetime.utcnow(), updated_at=ChatSession.updated_at))
+    if claimed.rowcount == 0:
+        db.rollback()
+        return None
+
+    rows = db.execute(select(
+        ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.tokens, ChatMessage.created_at
+    ).filter(ChatMessage.session_id == session_id).order_by(ChatMessage.created_at, ChatMessage.id)).all()
+    raw = encode_messages(rows)
+    payload = compress(raw, codec)
+    archive = ChatArchive(
+        session_id=session_id,
+        codec=codec,
+        message_count=len(rows),
+        question_count=sum(1 for r in rows if r.role == "user"),
+        raw_bytes=len(raw),
+        compressed_bytes=len(payload),
+        payload=payload,
+    )
+    db.add(archive)
+    db.execute(delete(ChatMessage).filter(ChatMessage.session_id == session_id))
+    db.commit()
+    return archive
+
+
+def archive_inactive_sessions(db: Session, days: int, limit: Optional[int] = None,
+                              codec: Optional[str] = None) -> dict:
+    """
+    归档超过 days 天未活跃的会话 (同步会话，用于 archive_sessions.py)，每个会话一个事务
+
+    返回 {"sessions", "messages", "raw_bytes", "compressed_bytes", "seconds"}。
+    """
+    codec = resolve_codec(codec)
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    query = select(ChatSession.id).filter(
+        ChatSession.updated_at < cutoff,
+        ChatSession.archived_at.is_(None),
+        ChatSession.deleted_at.is_(None)
+    ).order_by(ChatSession.updated_at)
+    if limit:
+        query = query.limit(limit)
+    session_ids = db.execute(query).scalars().all()
+
+    report = {"sessions": 0, "messages": 0, "raw_bytes": 0, "compressed_bytes": 0}
+    started = time.perf_counter()
+    for session_id in session_ids:
+        archive = archive_session(db, session_id, cutoff, codec)
+        if archive is None:
+            continue
+        report["sessions"] += 1
+        report["messages"] += archive.message_count
+        report["raw_bytes"] += archive.raw_bytes
+        report["compressed_bytes"] += archive.compressed_bytes
+    report["seconds"] = time.perf_counter() - started
+    logger.info(f"Archived {report['sessions']} session(s), {report['messages']} message(s)")
+    return report
+
+
+def _restore_rows(archive: ChatArchive) -> List[dict]:
+    # 保留原消息 ID：游标、摘要进度 (summary_message_id) 都依赖它
+    return [{k: m[k] for k in ("id", "session_id", "role", "content", "tokens", "created_at")}
+            for m in decode_messages(archive)]
+
+
+def _unarchive(session_id: str):
+    return update(ChatSession).filter(ChatSession.id == session_id).values(
+        archived_at=None, updated_at=ChatSession.updated_at
+    )
+
+
+def restore_session(db: Session, session_id: str) -> int:
+    """把归档的消息放回 chat_messages (同步会话，用于脚本)，返回恢复的消息数"""
+    archive = db.get(ChatArchive, session_id)
+    rows = _restore_rows(archive) if archive else []
+    if rows:
+        db.execute(insert(ChatMessage), rows)
+    db.execute(delete(ChatArchive).filter(ChatArchive.session_id == session_id))
+    db.execute(_unarchive(session_id))
+    db.commit()
+    return len(rows)
+
+
+async def rehydrate_session(db: AsyncSession, session_id: str) -> int:
+    """归档的会话继续对话时，在调用方的事务中把消息恢复到 chat_messages (不提交)"""
+    archive = await db.get(ChatArchive, session_id)
+    rows = _restore_rows(archive) if archive else []
+    if rows:
+        await db.execute(insert(ChatMessage), rows)
+    await db.execute(delete(ChatArchive).filter(ChatArchive.session_id == session_id))
+    await db.execute(_unarchive(session_id))
+    logger.info(f"Rehydrated {len(rows)} archived message(s) for session {session_id}")
+    return len(rows)
+
+
+async def archived_messages(db: AsyncSession, session_id: str) -> List[dict]:
+    """只读：解压归档会话的消息 (按时间正序)，不写回 chat_messages"""
+    archive = await db.get(ChatArchive, session_id)
+    if archive is None:
+        return []
+    return [{k: m[k] for k in ("id", "role", "content", "created_at")} for m in decode_messages(archive)]
+
+
+async def archived_sessions(db: AsyncSession, user_id: int) -> list:
+    """用户未删除的已归档会话 (id, title, mode, updated_at)，最近活跃在前"""
+    result = await db.execute(select(
+        ChatSession.id, ChatSession.title, ChatSession.mode, ChatSession.updated_at
+    ).join(ChatArchive, ChatArchive.session_id == ChatSession.id).filter(
+        ChatSession.user_id == user_id,
+        ChatSession.deleted_at.is_(None)
+    ).order_by(ChatSession.updated_at.desc(), ChatSession.id))
+    return result.all()
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import LargeBinary, cast, delete, exists, func, select, text
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models import ChatArchive, ChatMessage, ChatSession
+
+logger = logging.getLogger(__name__)
+
+
+def content_bytes(dialect_name: str):
+    """消息内容的字节数 (SQLite 的 length() 对文本返回字符数，需要先转成 BLOB)"""
+    if dialect_name == "sqlite":
+        return func.coalesce(func.length(cast(ChatMessage.content, LargeBinary)), 0)
+    return func.coalesce(func.octet_length(ChatMessage.content), 0)
+
+
+class SessionPurger:
+    """
+    后台清理已删除的会话
+
+    - DELETE /api/sessions/{id} 只设置 deleted_at 并立即返回，会话和消息随即对用户不可见
+    - 本任务每次删除一个会话的至多 PURGE_BATCH_SIZE 条消息，每批单独提交；消息删完后再删除会话行 (及其归档)
+    - 启动时以及每 PURGE_INTERVAL 秒扫描一次，删除会话时 wake() 立即唤醒
+    """
+
+    def __init__(self, session_factory=None, batch_size: Optional[int] = None):
+        self._session_factory = session_factory or AsyncSessionLocal
+        self.batch_size = batch_size or settings.PURGE_BATCH_SIZE
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # 累计清理量 (进程内)
+        self.sessions = 0
+        self.messages = 0
+        self.bytes = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        self._wake.set()
+
+    async def _loop(self):
+        while True:
+            # 先清除标记再清理，清理期间新删除的会话会让下一次等待立即返回
+            self._wake.clear()
+            try:
+                await self.purge_pending()
+            except Exception as e:
+                logger.error(f"Session purge failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.PURGE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def purge_pending(self) -> int:
+        """清理所有已标记删除的会话，返回处理的批数"""
+        batches = 0
+        while await self.purge_batch():
+            batches += 1
+            await asyncio.sleep(settings.PURGE_BATCH_PAUSE)
+        return batches
+
+    async def purge_batch(self) -> bool:
+        """处理一批：删除最早标记的会话的一批消息，或在消息已删完时删除会话行。没有待清理的会话时返回 False"""
+        async with self._session_factory() as db:
+            session_id = await db.scalar(select(ChatSession.id).filter(
+                ChatSession.deleted_at.isnot(None)
+            ).order_by(ChatSession.deleted_at).limit(1))
+            if session_id is None:
+                return False
+
+            result = await db.execute(select(
+                ChatMessage.id, content_bytes(db.bind.dialect.name)
+            ).filter(ChatMessage.session_id == session_id).limit(self.batch_size))
+            rows = result.all()
+            if rows:
+                await db.execute(delete(ChatMessage).filter(ChatMessage.id.in_([row[0] for row in rows])))
+                self.messages += len(rows)
+                self.bytes += sum(row[1] for row in rows)
+            else:
+                await db.execute(delete(ChatArchive).filter(ChatArchive.session_id == session_id))
+                await db.execute(delete(ChatSession).filter(
+                    ChatSession.id == session_id,
+                    ChatSession.deleted_at.isnot(None)
+                ))
+                self.sessions += 1
+                logger.info(f"Purged deleted session {session_id}")
+            await db.commit()
+            return True
+
+
+def sweep_orphan_messages(db: Session, batch_size: int = 1000, dry_run: bool = False) -> dict:
+    """
+    删除会话行已不存在的消息 (早期删除会话不会删除消息)，同步会话，用于一次性脚本
+
+    按 id 顺序分批处理，每批单独提交。返回 {"messages": 条数, "bytes": 内容字节数}。
+    """
+    orphan = ~exists().where(ChatSession.id == ChatMessage.session_id)
+    size = content_bytes(db.bind.dialect.name)
+    report = {"messages": 0, "bytes": 0}
+    last_id = 0
+    while True:
+        rows = db.execute(select(ChatMessage.id, size).filter(
+            orphan,
+            ChatMessage.id > last_id
+        ).order_by(ChatMessage.id).limit(batch_size)).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        report["messages"] += len(rows)
+        report["bytes"] += sum(row[1] for row in rows)
+        if not dry_run:
+            db.execute(delete(ChatMessage).filter(ChatMessage.id.in_([row[0] for row in rows])))
+            db.commit()
+    return report
+
+
+def sqlite_free_bytes(db: Session) -> int:
+    """SQLite 文件中空闲页的字节数 (删除数据后不会自动还给操作系统，VACUUM 后才会收缩文件)"""
+    page_size = db.execute(text("PRAGMA page_size")).scalar()
+    return db.execute(text("PRAGMA freelist_count")).scalar() * page_size
+
+
+session_purger = SessionPurger()
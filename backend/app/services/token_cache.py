@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import heapq
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from jose import JWTError, jwt
+from sqlalchemy import delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import AsyncReadSessionLocal, upsert_statement
+from ..models import RevokedToken
+from .metrics import register_cache
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCache:
+    """
+    已校验 JWT 的 LRU 缓存
+
+    - 以 token 的 SHA-256 摘要为键，缓存 jwt.decode 的结果；同一 token 再次请求时跳过签名校验和声明解析
+    - 缓存项在 exp 到期后失效，没有 exp 声明的 token 不缓存
+    - 最多 JWT_CACHE_SIZE 项，超出时淘汰最久未使用的
+    - 吊销列表 (登出) 同样按摘要记录，保留到 token 本身过期为止；decode() 只查这份进程内的列表，
+      其他 worker 的吊销由 RevocationSync 从数据库同步过来
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = settings.JWT_CACHE_SIZE if max_size is None else max_size
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._revoked: Dict[str, float] = {}
+        # (exp, 摘要) 的小顶堆，清理过期吊销记录时只弹出堆顶，不扫描整个吊销列表
+        self._revoked_expiry: List[Tuple[float, str]] = []
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def decode(self, token: str) -> dict:
+        """返回 token 的声明，无效、过期或已吊销时抛出 JWTError"""
+        key = self.digest(token)
+        now = time.time()
+        if self._revoked and self._is_revoked(key, now):
+            raise JWTError("Token has been revoked")
+
+        entry = self._cache.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+            del self._cache[key]
+
+        self.misses += 1
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        exp = payload.get("exp")
+        if self.max_size > 0 and isinstance(exp, (int, float)):
+            self._cache[key] = (exp, payload)
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return dict(payload)
+
+    def revoke(self, token: str, payload: dict):
+        """吊销 token (payload 为已校验的声明，用于确定保留期限)"""
+        if not settings.JWT_REVOCATION_ENABLED:
+            return
+        exp = payload.get("exp")
+        self.add_revoked(self.digest(token), exp if isinstance(exp, (int, float)) else float("inf"))
+
+    def add_revoked(self, key: str, exp: float):
+        """按摘要加入吊销列表，exp 为 Unix 时间戳；已记录的吊销 (每次同步都会重复拉到) 直接跳过"""
+        self._cache.pop(key, None)
+        if self._revoked.get(key) == exp:
+            return
+        now = time.time()
+        self._prune_revoked(now)
+        if exp > now:
+            self._revoked[key] = exp
+            heapq.heappush(self._revoked_expiry, (exp, key))
+
+    def _prune_revoked(self, now: float):
+        # 吊销列表的大小不超过仍在有效期内的 token 数；每条记录只会被弹出一次
+        heap = self._revoked_expiry
+        while heap and heap[0][0] <= now:
+            exp, key = heapq.heappop(heap)
+            if self._revoked.get(key) == exp:
+                del self._revoked[key]
+
+    def _is_revoked(self, key: str, now: float) -> bool:
+        exp = self._revoked.get(key)
+        if exp is None:
+            return False
+        if exp <= now:
+            del self._revoked[key]
+            return False
+        return True
+
+    def clear(self):
+        self._cache.clear()
+        self._revoked.clear()
+        self._revoked_expiry.clear()
+
+
+class RevocationSync:
+    """
+    在所有 worker / 容器之间共享吊销列表
+
+    - 登出时 publish() 把 token 摘要写入 revoked_tokens 表 (由调用方 commit)，并顺带删除已过期的记录
+    - 每个进程启动时以及每 JWT_REVOCATION_SYNC_INTERVAL 秒拉取仍在有效期内的记录，合并到本进程的吊销列表；
+      表中只有最近一个 Token 有效期内的登出记录，每次全量拉取，不依赖自增 ID 的提交顺序
+    - 其他 worker 最迟在一个同步周期后拒绝已登出的 token；数据库不可用时保留已同步的列表，下个周期重试
+    """
+
+    def __init__(self, cache: TokenCache, session_factory=None):
+        self.cache = cache
+        self._session_factory = session_factory or AsyncReadSessionLocal
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None and settings.JWT_REVOCATION_ENABLED:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.pull()
+            except Exception as e:
+                logger.error(f"Token revocation sync failed: {e}")
+            await asyncio.sleep(settings.JWT_REVOCATION_SYNC_INTERVAL)
+
+    async def publish(self, db: AsyncSession, token: str, payload: dict):
+        """在调用方的事务中记录吊销 (由调用方 commit)"""
+        if not settings.JWT_REVOCATION_ENABLED:
+            return
+        exp = payload.get("exp")
+        expires_at = datetime.utcfromtimestamp(exp) if isinstance(exp, (int, float)) else None
+        now = datetime.utcnow()
+        await db.execute(delete(RevokedToken).filter(RevokedToken.expires_at <= now))
+        await db.execute(upsert_statement(db.bind.dialect.name, RevokedToken, ["digest"], replace=["expires_at"]),
+                         {"digest": self.cache.digest(token), "expires_at": expires_at})
+
+    async def pull(self) -> int:
+        """把数据库中仍有效的吊销记录合并到本进程，返回记录数"""
+        async with self._session_factory() as db:
+            result = await db.execute(select(RevokedToken.digest, RevokedToken.expires_at).filter(
+                or_(RevokedToken.expires_at.is_(None), RevokedToken.expires_at > datetime.utcnow())
+            ))
+            rows = result.all()
+        for digest, expires_at in rows:
+            # expires_at 按 UTC 存储 (不带时区)
+            exp = (expires_at - datetime(1970, 1, 1)).total_seconds() if expires_at else float("inf")
+            self.cache.add_revoked(digest, exp)
+        return len(rows)
+
+
+token_cache = TokenCache()
+register_cache("jwt", token_cache)
+revocation_sync = RevocationSync(token_cache)
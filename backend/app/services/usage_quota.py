@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from ..config import settings
+from ..database import AsyncReadSessionLocal, AsyncSessionLocal, upsert_statement
+from ..models import UsageHourly
+
+logger = logging.getLogger(__name__)
+
+TOKENS = "tokens"
+TTS_CHARS = "tts_chars"
+RESOURCES = (TOKENS, TTS_CHARS)
+
+# 最长窗口 (天) 需要的小时桶数：24 个完整桶 + 1 个按比例计入的最旧桶
+HISTORY_HOURS = 25
+
+
+def hour_bucket(at: datetime) -> datetime:
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def quota_windows(resource: str) -> List[Tuple[str, int, int]]:
+    """[(窗口名, 小时数, 限额)]，限额为 0 的窗口不检查"""
+    if resource == TOKENS:
+        windows = [("hour", 1, settings.QUOTA_TOKENS_PER_HOUR), ("day", 24, settings.QUOTA_TOKENS_PER_DAY)]
+    else:
+        windows = [("hour", 1, settings.QUOTA_TTS_CHARS_PER_HOUR), ("day", 24, settings.QUOTA_TTS_CHARS_PER_DAY)]
+    return [w for w in windows if w[2] > 0]
+
+
+def estimate_tokens(prompt_chars: int, completion_chars: int, images: int = 0) -> int:
+    """上游没有返回 usage 时按字符数估算"""
+    chars = prompt_chars + completion_chars
+    return math.ceil(chars / settings.QUOTA_CHARS_PER_TOKEN) + images * settings.QUOTA_IMAGE_TOKENS
+
+
+def usage_tokens(usage, prompt_chars: int, completion_chars: int, images: int = 0) -> int:
+    """优先使用流式响应最后返回的 usage.total_tokens"""
+    total = getattr(usage, "total_tokens", None) if usage is not None else None
+    if total:
+        return int(total)
+    return estimate_tokens(prompt_chars, completion_chars, images)
+
+
+class QuotaExceeded(Exception):
+    """用户在某个滚动窗口内的用量已达上限"""
+
+    def __init__(self, resource: str, window: str, used: int, limit: int, retry_after: int):
+        super().__init__(f"{resource} quota exceeded ({window}): {used}/{limit}")
+        self.resource = resource
+        self.window = window
+        self.used = used
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class UsageLedger:
+    """
+    按用户统计 LLM Token 与 TTS 字符用量，并在准入前检查滚动窗口配额
+
+    - charge() 只在内存中累加 (O(1))，后台任务每 QUOTA_FLUSH_INTERVAL 秒批量累加写入 usage_hourly
+    - 检查时使用 数据库快照 + 本进程尚未落库的增量；快照超过 QUOTA_FLUSH_INTERVAL 秒后重新加载，
+      以便看到其他 worker 已写入的用量
+    - 滚动窗口按小时桶计算：窗口内的完整桶 + 最旧一个桶按仍在窗口内的比例计入 (与限流器的两桶估算相同)
+    - 用量在每轮对话结束后按上游返回的实际 usage 记账，因此单轮对话可能超出限额一次，之后的请求被拒绝
+    """
+
+    def __init__(self, session_factory=None, read_session_factory=None):
+        self._session_factory = session_factory or AsyncSessionLocal
+        self._read_session_factory = read_session_factory or AsyncReadSessionLocal
+        # user_id -> (加载时间, {小时桶: [tokens, tts_chars]})
+        self._snapshots: Dict[int, Tuple[float, Dict[datetime, List[int]]]] = {}
+        # (user_id, 小时桶) -> [tokens, tts_chars]，尚未写入数据库
+        self._pending: Dict[Tuple[int, datetime], List[int]] = {}
+        # 正在写入数据库的一批 (写入期间仍计入用量)
+        self._flushing: Dict[Tuple[int, datetime], List[int]] = {}
+        # 写入进行中时为一个 Future，写入结束 (成功或失败) 时完成；_flush_gen 为已结束的写入次数
+        self._flush_done: Optional[asyncio.Future] = None
+        self._flush_gen = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.QUOTA_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Usage flush failed: {e}")
+
+    def charge(self, user_id: int, tokens: int = 0, tts_chars: int = 0):
+        """记录一次用量 (只写内存)"""
+        if not settings.QUOTA_ENABLED or (tokens <= 0 and tts_chars <= 0):
+            return
+        key = (user_id, hour_bucket(datetime.utcnow()))
+        row = self._pending.get(key)
+        if row is None:
+            row = self._pending[key] = [0, 0]
+        row[0] += max(tokens, 0)
+        row[1] += max(tts_chars, 0)
+
+    async def flush(self) -> int:
+        """把内存中的增量累加写入 usage_hourly，返回写入的行数"""
+        if not self._pending or self._flushing:
+            return 0
+        self._flushing, self._pending = self._pending, {}
+        self._flush_done = asyncio.get_running_loop().create_future()
+        rows = [{"user_id": user_id, "bucket": bucket, "tokens": t, "tts_chars": c}
+                for (user_id, bucket), (t, c) in self._flushing.items()]
+        try:
+            async with self._session_factory() as db:
+                await db.execute(upsert_statement(
+                    db.bind.dialect.name, UsageHourly, ["user_id", "bucket"], increment=[TOKENS, TTS_CHARS]
+                ), rows)
+                await db.commit()
+        except Exception:
+            # 写入失败时放回待写入的增量，下次重试
+            for key, (t, c) in self._flushing.items():
+                row = self._pending.setdefault(key, [0, 0])
+                row[0] += t
+                row[1] += c
+            raise
+        finally:
+            flushed = self._flushing
+            self._flushing = {}
+            self._flush_gen += 1
+            self._flush_done.set_result(None)
+            self._flush_done = None
+        # 已落库的增量包含在数据库中，丢弃这些用户的快照，下次检查时重新加载
+        for user_id, _ in flushed:
+            self._snapshots.pop(user_id, None)
+        # 顺带清理过期快照，内存只与最近活跃的用户数有关
+        expired = time.monotonic() - settings.QUOTA_FLUSH_INTERVAL
+        for user_id in [u for u, (loaded_at, _) in self._snapshots.items() if loaded_at < expired]:
+            del self._snapshots[user_id]
+        return len(rows)
+
+    async def _snapshot(self, user_id: int) -> Dict[datetime, List[int]]:
+        cached = self._snapshots.get(user_id)
+        if cached is not None and time.monotonic() - cached[0] < settings.QUOTA_FLUSH_INTERVAL:
+            return cached[1]
+        # 快照不能含有 _flushing 中的行 (usage() 会再加一次)：等进行中的写入结束后再加载；
+        # 加载期间有写入完成时，快照可能缺少这批已从 _flushing 移除的行，重新加载
+        while True:
+            if self._flush_done is not None:
+                await asyncio.shield(self._flush_done)
+                continue
+            generation = self._flush_gen
+            since = hour_bucket(datetime.utcnow()) - timedelta(hours=HISTORY_HOURS - 1)
+            async with self._read_session_factory() as db:
+                result = await db.execute(select(
+                    UsageHourly.bucket, UsageHourly.tokens, UsageHourly.tts_chars
+                ).filter(UsageHourly.user_id == user_id, UsageHourly.bucket >= since))
+                buckets = {row.bucket: [row.tokens, row.tts_chars] for row in result}
+            if self._flush_gen == generation:
+                break
+        self._snapshots[user_id] = (time.monotonic(), buckets)
+        return buckets
+
+    async def usage(self, user_id: int) -> Dict[str, Dict[str, int]]:
+        """{resource: {窗口名: 滚动窗口内的用量}}"""
+        now = datetime.utcnow()
+        current = hour_bucket(now)
+        # 最旧的桶仍落在窗口内的比例
+        weight = 1 - (now - current).total_seconds() / 3600
+
+        totals: Dict[datetime, List[int]] = {}
+        for bucket, (t, c) in (await self._snapshot(user_id)).items():
+            totals[bucket] = [t, c]
+        for pending in (self._flushing, self._pending):
+            for (uid, bucket), (t, c) in pending.items():
+                if uid == user_id:
+                    row = totals.setdefault(bucket, [0, 0])
+                    row[0] += t
+                    row[1] += c
+
+        result = {}
+        for index, resource in enumerate(RESOURCES):
+            windows = {}
+            for name, hours, _ in quota_windows(resource):
+                oldest = current - timedelta(hours=hours)
+                used = sum(row[index] for bucket, row in totals.items() if oldest < bucket <= current)
+                used += totals.get(oldest, [0, 0])[index] * weight
+                windows[name] = int(used)
+            result[resource] = windows
+        return result
+
+    async def check(self, user_id: int, resource: str, cost: int = 0):
+        """准入检查：用量已达限额，或已用量 + 本次已知消耗超过限额时抛出 QuotaExceeded"""
+        if not settings.QUOTA_ENABLED:
+            return
+        used = (await self.usage(user_id))[resource]
+        for name, hours, limit in quota_windows(resource):
+            # cost 为 0 (消耗未知的预检查) 时，用量恰好等于限额也要拒绝
+            if used[name] >= limit or used[name] + cost > limit:
+                # 用量随最旧的桶滑出窗口而下降，最晚到下一个整点释放一部分
+                now = datetime.utcnow()
+                retry_after = max(1, int((hour_bucket(now) + timedelta(hours=1) - now).total_seconds()))
+                raise QuotaExceeded(resource, name, used[name], limit, retry_after)
+
+
+usage_ledger = UsageLedger()
+
+
+async def enforce_quota(user_id: int, resource: str, cost: int = 0):
+    """接口层的配额检查 - 超出时返回 429 并附带 Retry-After"""
+    try:
+        await usage_ledger.check(user_id, resource, cost)
+    except QuotaExceeded as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Usage quota exceeded ({e.resource} per {e.window}). Please try again later.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
@@ -0,0 +1,221 @@
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete, func, literal, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..database import upsert_statement
+from ..models import ChatArchive, ChatMessage, ChatSession, LearningRecord, User, UserStats
+from .activity_rollups import bump_activity
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("login_count", "question_count", "quiz_sum", "quiz_count", "data_version")
+
+
+async def bump_user_stats(db: AsyncSession, user_id: int, logins: int = 0, questions: int = 0,
+                          quiz_sum: int = 0, quiz_count: int = 0, last_analysis_id: Optional[int] = None,
+                          analysis_version: Optional[int] = None):
+    """
+    在调用方的事务中累加用户统计 (由调用方 commit，与事件明细一起提交或回滚)
+
+    questions 可以为负数 (删除会话时扣减)。提问或测验变化会让 data_version +1，使缓存的分析报告失效；
+    登录次数不进入分析 Prompt，只累加计数，不影响缓存的分析报告。
+    """
+    changed = bool(questions or quiz_count)
+    values = {
+        "user_id": user_id,
+        "login_count": logins,
+        "question_count": questions,
+        "quiz_sum": quiz_sum,
+        "quiz_count": quiz_count,
+        "data_version": 1 if changed else 0,
+        "last_analysis_id": last_analysis_id,
+        "analysis_version": analysis_version,
+        "updated_at": datetime.utcnow(),
+    }
+    values = {k: v for k, v in values.items() if v is not None}
+    replace = ["updated_at"] + [col for col in ("last_analysis_id", "analysis_version") if col in values]
+    await db.execute(upsert_statement(db.bind.dialect.name, UserStats, ["user_id"], COUNTERS, replace), values)
+
+
+async def record_learning_event(db: AsyncSession, record: LearningRecord, analysis_version: Optional[int] = None):
+    """
+    保存一条学习事件，并同步更新看板统计和活动汇总 (不提交)
+
+    analysis_version: 保存 AI 分析时传入生成该分析所基于的 data_version
+    """
+    # 显式设置时间，活动汇总需要知道事件落在哪个时间桶
+    record.created_at = record.created_at or datetime.utcnow()
+    db.add(record)
+    await bump_activity(db, record.user_id, [(record.event_type, record.category, record.score, record.created_at)])
+    if record.event_type == "login":
+        await bump_user_stats(db, record.user_id, logins=1)
+    elif record.event_type == "quiz_result" and record.score is not None:
+        await bump_user_stats(db, record.user_id, quiz_sum=record.score, quiz_count=1)
+    elif record.event_type == "ai_analysis":
+        # 需要自增 ID 作为最新分析的指针
+        await db.flush()
+        await bump_user_stats(db, record.user_id, last_analysis_id=record.id, analysis_version=analysis_version)
+
+
+def _insert_ignore(dialect_name: str):
+    """重复的 (user_id, client_event_id) 静默跳过"""
+    table = LearningRecord.__table__
+    if dialect_name == "mysql":
+        return mysql.insert(table).prefix_with("IGNORE")
+    return (postgresql if dialect_name == "postgresql" else sqlite).insert(table).on_conflict_do_nothing()
+
+
+async def _insert_new_rows(db: AsyncSession, rows: List[dict]) -> list:
+    """
+    INSERT 忽略重复的 (user_id, client_event_id)，返回实际写入的行 (id / event_type / category / score)
+
+    支持 RETURNING 的数据库 (SQLite 3.35+、PostgreSQL) 一条语句完成；
+    MySQL 没有 RETURNING，逐行 INSERT IGNORE 并按 rowcount 判断是否写入。
+    """
+    dialect = db.bind.dialect
+    stmt = _insert_ignore(dialect.name)
+    table = LearningRecord.__table__
+    if dialect.insert_executemany_returning:
+        result = await db.execute(
+            stmt.returning(table.c.id, table.c.event_type, table.c.category, table.c.score), rows
+        )
+        return [dict(row._mapping) for row in result]
+    inserted = []
+    for row in rows:
+        result = await db.execute(stmt, row)
+        if result.rowcount:
+            inserted.append({"id": result.inserted_primary_key[0], **row})
+    return inserted
+
+
+async def insert_learning_events(db: AsyncSession, user_id: int, events: List[dict]) -> list:
+    """
+    批量保存学习事件，并合并为一次看板统计和活动汇总更新 (不提交)
+
+    events 中每项包含 event_type / content / score / category / client_event_id，
+    带 client_event_id 的事件在批内和已入库的数据中去重。返回实际写入的行；
+    统计只按实际写入的行累加，并发重试被唯一索引跳过的事件不会重复计数。
+    """
+    seen = set()
+    fresh = []
+    for event in events:
+        client_id = event.get("client_event_id")
+        if client_id is not None:
+            if client_id in seen:
+                continue
+            seen.add(client_id)
+        fresh.append(event)
+    if seen:
+        result = await db.execute(select(LearningRecord.client_event_id).filter(
+            LearningRecord.user_id == user_id,
+            LearningRecord.client_event_id.in_(seen)
+        ))
+        existing = set(result.scalars().all())
+        fresh = [e for e in fresh if e.get("client_event_id") not in existing]
+    if not fresh:
+        return []
+
+    now = datetime.utcnow()
+    # 上面的去重之后，只有并发重试才会撞上唯一索引；这里兜底跳过
+    inserted = await _insert_new_rows(db, [{
+        "user_id": user_id,
+        "event_type": e["event_type"],
+        "content": e.get("content"),
+        "score": e.get("score"),
+        "category": e.get("category"),
+        "client_event_id": e.get("client_event_id"),
+        "created_at": now,
+    } for e in fresh])
+    if not inserted:
+        return []
+    await bump_activity(db, user_id, [(r["event_type"], r["category"], r["score"], now) for r in inserted])
+
+    scores = [r["score"] for r in inserted if r["event_type"] == "quiz_result" and r["score"] is not None]
+    logins = sum(1 for r in inserted if r["event_type"] == "login")
+    last_analysis_id = None
+    if any(r["event_type"] == "ai_analysis" for r in inserted):
+        last_analysis_id = await db.scalar(select(func.max(LearningRecord.id)).filter(
+            LearningRecord.user_id == user_id,
+            LearningRecord.event_type == "ai_analysis"
+        ))
+    if logins or scores or last_analysis_id:
+        await bump_user_stats(db, user_id, logins=logins, quiz_sum=sum(scores), quiz_count=len(scores),
+                              last_analysis_id=last_analysis_id)
+    return inserted
+
+
+async def record_learning_events(db: AsyncSession, user_id: int, events: List[dict]) -> Tuple[int, int]:
+    """批量保存学习事件 (不提交)，返回 (写入条数, 重复跳过条数)"""
+    inserted = await insert_learning_events(db, user_id, events)
+    return len(inserted), len(events) - len(inserted)
+
+
+async def get_user_stats(db: AsyncSession, user_id: int) -> dict:
+    """读取看板统计：一次主键查询，顺带取出最新一条 AI 分析的内容"""
+    result = await db.execute(
+        select(UserStats, LearningRecord.content)
+        .outerjoin(LearningRecord, LearningRecord.id == UserStats.last_analysis_id)
+        .filter(UserStats.user_id == user_id)
+    )
+    row = result.first()
+    if row is None:
+        return {"logins": 0, "questions": 0, "quiz_average": 0.0, "analysis": None,
+                "data_version": 0, "analysis_fresh": False}
+    stats, analysis = row
+    return {
+        "logins": stats.login_count,
+        "questions": stats.question_count,
+        "quiz_average": stats.quiz_sum / stats.quiz_count if stats.quiz_count else 0.0,
+        "analysis": analysis,
+        "data_version": stats.data_version,
+        # 最新分析生成之后学习数据没有变化
+        "analysis_fresh": analysis is not None and stats.analysis_version == stats.data_version,
+    }
+
+
+def rebuild_user_stats(db: Session, user_id: Optional[int] = None) -> int:
+    """
+    从明细表重算统计 (同步会话，用于离线脚本和数据修复)
+
+    user_id 为空时重算全部用户，返回写入的行数。
+    """
+    def per_user(stmt, column):
+        return stmt.filter(column == User.id).correlate(User).scalar_subquery()
+
+    logins = per_user(select(func.count(LearningRecord.id)).filter(
+        LearningRecord.event_type == "login"
+    ), LearningRecord.user_id)
+    questions = per_user(select(func.count(ChatMessage.id)).join(
+        ChatSession, ChatMessage.session_id == ChatSession.id
+    ).filter(ChatMessage.role == "user", ChatSession.deleted_at.is_(None)), ChatSession.user_id)
+    # 已归档会话的提问数记在归档行上
+    archived_questions = per_user(select(func.coalesce(func.sum(ChatArchive.question_count), 0)).join(
+        ChatSession, ChatArchive.session_id == ChatSession.id
+    ).filter(ChatSession.deleted_at.is_(None)), ChatSession.user_id)
+    quiz_filter = (LearningRecord.event_type == "quiz_result", LearningRecord.score.isnot(None))
+    quiz_sum = per_user(select(func.coalesce(func.sum(LearningRecord.score), 0)).filter(*quiz_filter),
+                        LearningRecord.user_id)
+    quiz_count = per_user(select(func.count(LearningRecord.score)).filter(*quiz_filter), LearningRecord.user_id)
+    last_analysis = per_user(select(func.max(LearningRecord.id)).filter(
+        LearningRecord.event_type == "ai_analysis"
+    ), LearningRecord.user_id)
+
+    # 重算后 data_version 从 1 开始，之前缓存的分析报告随之失效
+    users = select(User.id, logins, questions + archived_questions, quiz_sum, quiz_count, literal(1), last_analysis, func.now())
+    clear = delete(UserStats)
+    if user_id is not None:
+        users = users.filter(User.id == user_id)
+        clear = clear.filter(UserStats.user_id == user_id)
+
+    db.execute(clear)
+    result = db.execute(UserStats.__table__.insert().from_select(
+        ["user_id", *COUNTERS, "last_analysis_id", "updated_at"], users
+    ))
+    db.commit()
+    logger.info(f"Rebuilt user_stats for {result.rowcount} user(s)")
+    return result.rowcount
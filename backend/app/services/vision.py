@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from ..config import settings
+from .metrics import vision_frames_total, vision_inference_seconds
+
+logger = logging.getLogger(__name__)
+
+VISION_DISABLED = "disabled"
+VISION_LOADING = "loading"
+VISION_ENABLED = "enabled"
+
+
+class VisionStack:
+    """
+    手势识别的延迟加载
+
+    gesture_recognition 模块会导入 cv2 / mediapipe (连带 matplotlib 等) 并构建 Hands 模型，耗时数秒。
+    这里在后台线程中完成导入和构建，不阻塞应用启动和事件循环：
+    - VISION_PRELOAD: lifespan 启动后立即在后台加载
+    - 否则第一次视频通话 (WebSocket 连接) 时开始加载
+    加载完成前收到的视频帧直接忽略，status 用于 WebSocket 的 system_status 消息。
+    """
+
+    def __init__(self):
+        self._recognizer = None
+        self._task: Optional[asyncio.Task] = None
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def status(self) -> str:
+        if self._recognizer is not None and self._recognizer.is_ready:
+            return VISION_ENABLED
+        if self._task is not None and not self._task.done():
+            return VISION_LOADING
+        return VISION_DISABLED
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status == VISION_ENABLED
+
+    def start(self):
+        """开始后台加载 (可重复调用)"""
+        if not settings.VISION_ENABLED or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._load())
+
+    async def _load(self):
+        started = time.monotonic()
+        try:
+            self._recognizer = await asyncio.to_thread(_build_recognizer)
+        except Exception as e:
+            logger.error(f"Vision stack failed to load: {e}")
+        self.load_seconds = time.monotonic() - started
+        logger.info(f"Vision stack {self.status} after {self.load_seconds:.1f}s")
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        if self._task is not None:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        return self.is_ready
+
+    async def process_frame(self, base64_image: str) -> Optional[List[str]]:
+        """识别一帧中的手势 (在线程池中执行)，未就绪时丢弃并返回 None"""
+        if not self.is_ready:
+            vision_frames_total.labels("dropped").inc()
+            return None
+        started = time.perf_counter()
+        gestures = await asyncio.to_thread(self._recognizer.process_frame, base64_image)
+        vision_inference_seconds.observe(time.perf_counter() - started)
+        vision_frames_total.labels("processed").inc()
+        return gestures
+
+
+def _build_recognizer():
+    from .gesture_recognition import GestureRecognizer
+    return GestureRecognizer()
+
+
+vision_stack = VisionStack()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+冷数据归档：把长期不活跃的会话压缩存入 chat_archives
+
+归档后 /api/messages 仍可透明读取 (解压)，会话继续对话时自动恢复到 chat_messages。
+本脚本报告压缩前后的字节数和归档 / 恢复吞吐。
+
+运行:
+    python archive_sessions.py [--days 90] [--limit 1000] [--codec zlib|zstd] [--vacuum]
+    python archive_sessions.py --restore <session_id>
+"""
+import argparse
+import os
+import sys
+import time
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import SessionLocal, engine, is_sqlite
+from app.services.session_archiver import archive_inactive_sessions, restore_session
+from app.services.session_purger import sqlite_free_bytes
+
+
+def throughput(amount: float, seconds: float) -> float:
+    return amount / seconds if seconds > 0 else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive inactive chat sessions into compressed blobs")
+    parser.add_argument("--days", type=int, default=settings.ARCHIVE_AFTER_DAYS, help="inactive for more than N days")
+    parser.add_argument("--limit", type=int, default=None, help="archive at most N sessions")
+    parser.add_argument("--codec", default=None, help="zlib or zstd (default: ARCHIVE_CODEC)")
+    parser.add_argument("--restore", metavar="SESSION_ID", help="move one archived session back to chat_messages")
+    parser.add_argument("--vacuum", action="store_true", help="SQLite only: VACUUM afterwards to shrink the file")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.restore:
+            started = time.perf_counter()
+            count = restore_session(db, args.restore)
+            seconds = time.perf_counter() - started
+            print(f"✅ Restored {count} message(s) in {seconds:.3f}s "
+                  f"({throughput(count, seconds):.0f} msg/s)")
+            return 0
+
+        report = archive_inactive_sessions(db, args.days, args.limit, args.codec)
+        raw, packed, seconds = report["raw_bytes"], report["compressed_bytes"], report["seconds"]
+        print(f"✅ Archived {report['sessions']} session(s), {report['messages']} message(s) in {seconds:.3f}s")
+        if raw:
+            print(f"   Size: {raw} -> {packed} byte(s), saved {raw - packed} ({1 - packed / raw:.1%})")
+            print(f"   Throughput: {throughput(report['sessions'], seconds):.1f} session/s, "
+                  f"{throughput(raw, seconds) / 1024 / 1024:.2f} MiB/s uncompressed")
+        if is_sqlite(settings.DATABASE_URL):
+            print(f"   SQLite free pages: {sqlite_free_bytes(db)} byte(s)")
+    finally:
+        db.close()
+
+    if args.vacuum and is_sqlite(settings.DATABASE_URL):
+        path = engine.url.database
+        before = os.path.getsize(path)
+        # VACUUM 不能在事务中执行，并且会重写整个文件，期间阻塞写入
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+            # WAL 模式下 VACUUM 先写入 WAL，检查点之后主文件才会收缩
+            conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        print(f"   VACUUM: {before} -> {os.path.getsize(path)} byte(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+登录风暴下的对话首字延迟 (TTFT) 压测 - 对比密码哈希的三种计算方式
+
+- inline: 在事件循环中同步计算 (优化前的行为，PASSWORD_HASH_INLINE=true)
+- thread: 在线程池中计算 (PASSWORD_HASH_WORKERS=0)，仍与事件循环争抢 GIL
+- pool: 在独立的哈希进程池中计算
+
+每种配置单独启动一个 uvicorn 进程 (单 worker，Mock LLM 上游，临时 SQLite 库)，
+一组任务持续登录 (pbkdf2_sha256 校验)，同时另一个用户逐条发起流式对话，
+统计对话从发出请求到收到第一段回答的时间。
+
+进程池的收益取决于空闲 CPU 核数：单核机器上哈希进程与事件循环仍然共享同一个核，两组结果接近。
+
+运行: python bench_login_ttft.py [--seconds 5] [--logins 8] [--workers 2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from test_llm_failover import MockLLMServer
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+
+
+def start_server(db_path: str, llm_url: str, workers: int, inline: bool = False):
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        LLM_BASE_URL=llm_url,
+        LLM_API_KEY="bench",
+        PASSWORD_HASH_WORKERS=str(workers),
+        PASSWORD_HASH_INLINE=str(inline).lower(),
+        # 压测只关心延迟，放开按 IP 的对话限流
+        RATE_LIMIT_PER_MINUTE=str(10 ** 9),
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(base_url + "/", timeout=1)
+            return proc, base_url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("server did not start")
+
+
+async def chat_ttft(client: httpx.AsyncClient, headers: dict) -> float:
+    start = time.perf_counter()
+    ttft = None
+    async with client.stream("POST", "/api/chat", headers=headers,
+                             json={"message": "hello", "mode": "casual"}) as response:
+        # 读完整个流，让会话落库也计入本轮
+        async for line in response.aiter_lines():
+            if ttft is None and line.startswith("data:") and "answer" in json.loads(line[5:]):
+                ttft = time.perf_counter() - start
+    if ttft is None:
+        raise RuntimeError(f"stream ended without an answer: {response.status_code}")
+    return ttft
+
+
+async def run_workload(base_url: str, seconds: float, logins: int) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        for username in ["bench_chat"] + [f"bench_{i}" for i in range(logins)]:
+            await client.post("/auth/register", json={
+                "username": username, "email": f"{username}@bench", "password": "pw"
+            })
+        token = (await client.post("/auth/login", data={"username": "bench_chat", "password": "pw"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        # 空载时的首字延迟
+        idle = [await chat_ttft(client, headers) for _ in range(10)]
+
+        counts = {"logins": 0, "login_errors": 0}
+        deadline = time.monotonic() + seconds
+
+        async def login_loop(i: int):
+            while time.monotonic() < deadline:
+                response = await client.post("/auth/login", data={"username": f"bench_{i}", "password": "pw"})
+                counts["logins" if response.status_code == 200 else "login_errors"] += 1
+
+        async def chat_loop():
+            latencies = []
+            while time.monotonic() < deadline:
+                latencies.append(await chat_ttft(client, headers))
+            return latencies
+
+        results = await asyncio.gather(chat_loop(), *[login_loop(i) for i in range(logins)])
+
+    loaded = results[0]
+    return {
+        "idle_p50_ms": percentile(idle, 0.5),
+        "ttft_p50_ms": percentile(loaded, 0.5),
+        "ttft_p95_ms": percentile(loaded, 0.95),
+        "chats": len(loaded),
+        "logins_per_sec": round(counts["logins"] / seconds, 1),
+        "login_errors": counts["login_errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat TTFT under a login burst")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--logins", type=int, default=8, help="并发登录任务数")
+    parser.add_argument("--workers", type=int, default=2, help="哈希进程池大小")
+    args = parser.parse_args()
+
+    mock = MockLLMServer("bench")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        profiles = (("inline", 0, True), ("thread", 0, False), (f"pool x{args.workers}", args.workers, False))
+        for name, workers, inline in profiles:
+            proc, base_url = start_server(os.path.join(tmp, f"{name.split()[0]}.db"), mock.base_url, workers, inline)
+            try:
+                results[name] = asyncio.run(run_workload(base_url, args.seconds, args.logins))
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    print(f"\n{'='*80}")
+    print(f"{args.logins} concurrent login loops, {args.seconds:.0f}s per profile, {os.cpu_count()} CPU(s)")
+    print(f"{'='*80}")
+    print(f"{'hashing':<12}{'idle p50':>10}{'ttft p50':>10}{'ttft p95':>10}{'chats':>8}{'logins/s':>10}{'login err':>11}")
+    for name, r in results.items():
+        print(f"{name:<12}{r['idle_p50_ms']:>10}{r['ttft_p50_ms']:>10}{r['ttft_p95_ms']:>10}"
+              f"{r['chats']:>8}{r['logins_per_sec']:>10}{r['login_errors']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+限流器微基准 - 对比旧的时间戳列表实现与两桶滑动窗口计数器
+
+- hot: 少量客户端反复请求，每个键都保持在限额附近 (旧实现每次检查都要重建长度约为限额的列表)
+- spread: 大量不同 IP 各请求一次，统计检查耗时和结束时仍保留的键数量
+时间由基准自己推进 (模拟时钟)，不依赖真实等待。
+
+运行: python bench_rate_limiter.py [--limit 30] [--checks 200000] [--clients 100000]
+"""
+import argparse
+import time
+from collections import defaultdict
+
+from app.middleware.simple_rate_limit import SimpleRateLimiter
+
+
+class ListRateLimiter:
+    """旧实现：每个键一个时间戳列表，每次检查先过滤掉窗口外的时间戳"""
+
+    def __init__(self, rate_limit: int, time_window: float = 60):
+        self.requests = defaultdict(list)
+        self.rate_limit = rate_limit
+        self.time_window = time_window
+
+    def is_allowed(self, key: str, now: float) -> bool:
+        self.requests[key] = [t for t in self.requests[key] if now - t < self.time_window]
+        if len(self.requests[key]) >= self.rate_limit:
+            return False
+        self.requests[key].append(now)
+        return True
+
+
+def run_hot(limiter, checks: int, keys: int) -> dict:
+    # 每个键每秒约 1 次请求，限额 30/分钟时大约一半被拒绝
+    step = 1.0 / keys
+    allowed = 0
+    start = time.perf_counter()
+    for i in range(checks):
+        allowed += limiter.is_allowed(f"ip:{i % keys}", i * step)
+    elapsed = time.perf_counter() - start
+    return {"ns_per_check": elapsed / checks * 1e9, "allowed": allowed, "keys": len(limiter.requests)}
+
+
+def run_spread(limiter, clients: int) -> dict:
+    # 每秒 100 个新客户端，覆盖远超两个窗口的时长
+    start = time.perf_counter()
+    for i in range(clients):
+        limiter.is_allowed(f"ip:{i}", i / 100)
+    elapsed = time.perf_counter() - start
+    return {"ns_per_check": elapsed / clients * 1e9, "allowed": clients, "keys": len(limiter.requests)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate limiter microbenchmark")
+    parser.add_argument("--limit", type=int, default=30)
+    parser.add_argument("--checks", type=int, default=200000)
+    parser.add_argument("--hot-keys", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=100000)
+    args = parser.parse_args()
+
+    rows = []
+    for name, cls in (("list", ListRateLimiter), ("sliding", SimpleRateLimiter)):
+        rows.append((name, "hot", run_hot(cls(args.limit, 60), args.checks, args.hot_keys)))
+        rows.append((name, "spread", run_spread(cls(args.limit, 60), args.clients)))
+
+    print(f"\n{'='*64}")
+    print(f"limit {args.limit}/min, {args.checks} hot checks over {args.hot_keys} keys, {args.clients} distinct clients")
+    print(f"{'='*64}")
+    print(f"{'limiter':<10}{'workload':<10}{'ns/check':>12}{'allowed':>10}{'keys kept':>12}")
+    for name, workload, r in rows:
+        print(f"{name:<10}{workload:<10}{r['ns_per_check']:>12.0f}{r['allowed']:>10}{r['keys']:>12}")
+
+
+if __name__ == "__main__":
+    main()
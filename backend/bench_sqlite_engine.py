@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+SQLite 引擎参数基准测试 - 对比默认参数与 WAL + 读写分离连接池下的并发读写吞吐
+
+写任务模拟聊天消息落库 (逐条插入并提交)，读任务模拟看板统计查询，
+两组任务在同一时间窗口内并发运行，统计各自完成的操作数和出错次数。
+
+运行: python bench_sqlite_engine.py [--seconds 5] [--writers 4] [--readers 8] [--seed-rows 20000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, func, insert, select
+
+from app.database import Base, create_async_engines
+from app.models import LearningRecord
+
+
+def seed_database(path: str, rows: int):
+    # 用普通同步引擎建表，不设置任何 PRAGMA，数据库文件保持默认的回滚日志模式
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(LearningRecord), [
+            {"user_id": random.randint(1, 50), "event_type": random.choice(["login", "question_asked", "quiz_result"]),
+             "content": "seed", "score": random.randint(0, 100)}
+            for _ in range(rows)
+        ])
+    engine.dispose()
+
+
+async def run_workload(path: str, profile: bool, seconds: float, writers: int, readers: int) -> dict:
+    writer_engine, reader_engine = create_async_engines(f"sqlite:///{path}", profile=profile)
+    counts = {"writes": 0, "reads": 0, "write_errors": 0, "read_errors": 0}
+    read_latencies = []
+    deadline = time.monotonic() + seconds
+
+    async def writer():
+        while time.monotonic() < deadline:
+            try:
+                async with writer_engine.begin() as conn:
+                    await conn.execute(insert(LearningRecord).values(
+                        user_id=random.randint(1, 50), event_type="question_asked", content="bench"
+                    ))
+                counts["writes"] += 1
+            except Exception:
+                counts["write_errors"] += 1
+
+    async def reader():
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            try:
+                async with reader_engine.connect() as conn:
+                    await conn.execute(select(func.count(LearningRecord.id)).filter(
+                        LearningRecord.user_id == random.randint(1, 50),
+                        LearningRecord.event_type == "question_asked"
+                    ))
+                    await conn.execute(select(func.avg(LearningRecord.score)).filter(
+                        LearningRecord.event_type == "quiz_result"
+                    ))
+                counts["reads"] += 1
+                read_latencies.append(time.monotonic() - start)
+            except Exception:
+                counts["read_errors"] += 1
+
+    try:
+        await asyncio.gather(*[writer() for _ in range(writers)], *[reader() for _ in range(readers)])
+    finally:
+        await writer_engine.dispose()
+        if reader_engine is not writer_engine:
+            await reader_engine.dispose()
+
+    read_latencies.sort()
+    counts["writes_per_sec"] = round(counts["writes"] / seconds, 1)
+    counts["reads_per_sec"] = round(counts["reads"] / seconds, 1)
+    counts["read_p95_ms"] = round(read_latencies[int(len(read_latencies) * 0.95)] * 1000, 1) if read_latencies else None
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite engine profile benchmark")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seed-rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for name, profile in (("default", False), ("wal+pools", True)):
+            path = os.path.join(tmp, f"{name}.db")
+            seed_database(path, args.seed_rows)
+            results[name] = asyncio.run(run_workload(path, profile, args.seconds, args.writers, args.readers))
+
+    print(f"\n{'='*72}")
+    print(f"{args.writers} writers / {args.readers} readers, {args.seconds:.0f}s, {args.seed_rows} seed rows")
+    print(f"{'='*72}")
+    print(f"{'profile':<12}{'writes/s':>10}{'reads/s':>10}{'read p95 ms':>14}{'write err':>11}{'read err':>10}")
+    for name, r in results.items():
+        print(f"{name:<12}{r['writes_per_sec']:>10}{r['reads_per_sec']:>10}{str(r['read_p95_ms']):>14}"
+              f"{r['write_errors']:>11}{r['read_errors']:>10}")
+
+
+if __name__ == "__main__":
+    main()
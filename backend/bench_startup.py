@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准 - 记录每个模块在全新解释器中的冷导入时间，以及后台加载视觉模块的耗时
+
+每个模块单独启动一个 `python -X importtime -c "import 模块"` 子进程，取该模块的累计导入时间 (含其依赖)；
+"app startup" 为导入 app.main 并执行 lifespan 启动的时间，"vision ready" 为其后手势识别在后台就绪的时间。
+
+运行: python bench_startup.py [--repeat 3] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+MODULES = [
+    "fastapi",
+    "sqlalchemy",
+    "openai",
+    "aliyunsdkcore.client",
+    "cv2",
+    "mediapipe",
+    "app.config",
+    "app.database",
+    "app.services.llm_router",
+    "app.services.aliyun_tts",
+    "app.services.gesture_recognition",
+    "app.api.chat",
+    "app.main",
+]
+
+# 在子进程中执行：导入应用并跑完 lifespan 启动，然后等待视觉模块加载完成
+STARTUP_SCRIPT = """
+import asyncio, json, time
+started = time.perf_counter()
+from app.main import app
+from app.services.vision import vision_stack
+
+async def main():
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        await vision_stack.wait_ready(timeout=120)
+        vision = time.perf_counter()
+    print(json.dumps({"startup": ready - started, "vision": vision - ready, "status": vision_stack.status}))
+
+asyncio.run(main())
+"""
+
+
+def import_time_ms(module: str) -> float:
+    """模块的累计导入时间 (毫秒)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1]}")
+    for line in reversed(result.stderr.splitlines()):
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            return int(cumulative) / 1000
+    raise RuntimeError(f"no import time recorded for {module}")
+
+
+def startup_time(db_path: str) -> dict:
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}")
+    result = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT], capture_output=True, text=True, env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"app startup failed: {result.stderr.strip().splitlines()[-1]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="每个模块测量次数 (取中位数)")
+    parser.add_argument("--output", help="把结果写入 JSON 文件，便于对比不同版本")
+    args = parser.parse_args()
+
+    results = {}
+    for module in MODULES:
+        try:
+            results[module] = round(statistics.median(import_time_ms(module) for _ in range(args.repeat)), 1)
+        except RuntimeError as e:
+            print(f"skip {module}: {e}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = [startup_time(os.path.join(tmp, f"{i}.db")) for i in range(args.repeat)]
+    results["app startup"] = round(statistics.median(r["startup"] for r in runs) * 1000, 1)
+    results["vision ready"] = round(statistics.median(r["vision"] for r in runs) * 1000, 1)
+
+    print(f"\n{'='*56}")
+    print(f"cold import / startup time, median of {args.repeat} (vision: {runs[-1]['status']})")
+    print(f"{'='*56}")
+    for name, ms in results.items():
+        print(f"{name:<40}{ms:>12.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results_ms": results}, f, indent=2)
+        print(f"\nwritten to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
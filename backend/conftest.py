@@ -0,0 +1,70 @@
+"""
+测试共用的临时数据库夹具
+
+backend/test_*.py 既用 pytest 运行，也可以直接 python test_xxx.py 运行：
+pytest 通过 db_url / empty_db_url 夹具注入临时 SQLite 文件，
+脚本方式由 run_tests() 按测试函数的参数名创建同样的临时库。
+"""
+import inspect
+import os
+import tempfile
+
+import pytest
+
+from app.database import run_migrations
+
+
+def temp_db_url(migrate: bool = True) -> str:
+    """新建一个临时 SQLite 文件 (不影响开发数据库)，默认已迁移到最新版本"""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.remove(path)
+    url = f"sqlite:///{path}"
+    if migrate:
+        run_migrations(url)
+    return url
+
+
+def remove_db(url: str):
+    path = url[len("sqlite:///"):]
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+@pytest.fixture
+def db_url():
+    """已迁移的空库"""
+    url = temp_db_url()
+    yield url
+    remove_db(url)
+
+
+@pytest.fixture
+def empty_db_url():
+    """未迁移的空库 (迁移测试自己建表)"""
+    url = temp_db_url(migrate=False)
+    yield url
+    remove_db(url)
+
+
+_SCRIPT_FIXTURES = {
+    "db_url": temp_db_url,
+    "empty_db_url": lambda: temp_db_url(migrate=False),
+}
+
+
+def run_tests(tests) -> int:
+    """脚本方式运行测试，按参数名准备临时库；返回失败的测试数"""
+    failed = 0
+    for test in tests:
+        urls = {name: _SCRIPT_FIXTURES[name]() for name in inspect.signature(test).parameters}
+        try:
+            test(**urls)
+        except AssertionError:
+            failed += 1
+        finally:
+            for url in urls.values():
+                remove_db(url)
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    return failed
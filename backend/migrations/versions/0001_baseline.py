@@ -0,0 +1,95 @@
+"""baseline schema
+
+接管迁移之前的数据库有三种来源：全新空库、lifespan 里 create_all 建的库、
+以及更早的缺少 chat_sessions.mode / summary 列的库 (原来靠 upgrade_db.py 补列)。
+这里对已存在的表和列逐一跳过，三种情况都能直接 upgrade head。
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if "users" not in tables:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("username", sa.String(50)),
+            sa.Column("email", sa.String(100)),
+            sa.Column("hashed_password", sa.String(255)),
+            sa.Column("is_active", sa.Boolean()),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    if "chat_sessions" not in tables:
+        op.create_table(
+            "chat_sessions",
+            sa.Column("id", sa.String(36), primary_key=True),
+            sa.Column("user_id", sa.Integer()),
+            sa.Column("title", sa.String(255)),
+            sa.Column("mode", sa.String(20)),
+            sa.Column("summary", sa.Text(), nullable=True),
+            sa.Column("summary_message_id", sa.Integer()),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("updated_at", sa.DateTime()),
+        )
+        op.create_index("ix_chat_sessions_user_id", "chat_sessions", ["user_id"])
+    else:
+        # 早期版本的 chat_sessions 缺少这些列
+        columns = {c["name"] for c in inspector.get_columns("chat_sessions")}
+        new_columns = [
+            sa.Column("mode", sa.String(20), server_default="casual"),
+            sa.Column("summary", sa.Text(), nullable=True),
+            sa.Column("summary_message_id", sa.Integer(), server_default="0"),
+        ]
+        for column in new_columns:
+            if column.name not in columns:
+                op.add_column("chat_sessions", column)
+
+    if "chat_messages" not in tables:
+        op.create_table(
+            "chat_messages",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("session_id", sa.String(36)),
+            sa.Column("role", sa.String(20)),
+            sa.Column("content", sa.Text()),
+            sa.Column("tokens", sa.Integer()),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_chat_messages_id", "chat_messages", ["id"])
+        op.create_index("ix_chat_messages_session_id", "chat_messages", ["session_id"])
+
+    if "learning_records" not in tables:
+        op.create_table(
+            "learning_records",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer()),
+            sa.Column("event_type", sa.String(50)),
+            sa.Column("content", sa.Text(), nullable=True),
+            sa.Column("score", sa.Integer(), nullable=True),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_learning_records_id", "learning_records", ["id"])
+        op.create_index("ix_learning_records_user_id", "learning_records", ["user_id"])
+
+
+def downgrade():
+    op.drop_table("learning_records")
+    op.drop_table("chat_messages")
+    op.drop_table("chat_sessions")
+    op.drop_table("users")
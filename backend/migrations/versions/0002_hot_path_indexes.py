@@ -0,0 +1,37 @@
+"""composite indexes for hot queries
+
+- learning_records (user_id, event_type, created_at): 看板统计、最近活动
+- chat_messages (session_id, created_at): 历史消息、上下文窗口
+- chat_sessions (user_id, mode, updated_at): 会话列表
+
+Revision ID: 0002_hot_path_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002_hot_path_indexes"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_learning_records_user_event_created", "learning_records", ["user_id", "event_type", "created_at"]),
+    ("ix_chat_messages_session_created", "chat_messages", ["session_id", "created_at"]),
+    ("ix_chat_sessions_user_mode_updated", "chat_sessions", ["user_id", "mode", "updated_at"]),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        # 由 create_all 建出的新库已经带有这些索引
+        if name not in {ix["name"] for ix in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in INDEXES:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,53 @@
+"""user_stats rollup table
+
+看板统计的汇总表，建表后立即从明细表回填一次。
+
+Revision ID: 0003_user_stats
+Revises: 0002_hot_path_indexes
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003_user_stats"
+down_revision = "0002_hot_path_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if "user_stats" not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            "user_stats",
+            sa.Column("user_id", sa.Integer(), primary_key=True),
+            sa.Column("login_count", sa.Integer(), server_default="0", nullable=False),
+            sa.Column("question_count", sa.Integer(), server_default="0", nullable=False),
+            sa.Column("quiz_sum", sa.Integer(), server_default="0", nullable=False),
+            sa.Column("quiz_count", sa.Integer(), server_default="0", nullable=False),
+            sa.Column("last_analysis_id", sa.Integer(), nullable=True),
+            sa.Column("updated_at", sa.DateTime()),
+        )
+
+    # 回填 (与 app/services/user_stats.py 中 rebuild_user_stats 的口径一致)
+    op.execute("DELETE FROM user_stats")
+    op.execute("""
+        INSERT INTO user_stats (user_id, login_count, question_count, quiz_sum, quiz_count, last_analysis_id, updated_at)
+        SELECT u.id,
+               (SELECT COUNT(*) FROM learning_records r
+                 WHERE r.user_id = u.id AND r.event_type = 'login'),
+               (SELECT COUNT(*) FROM chat_messages m JOIN chat_sessions s ON m.session_id = s.id
+                 WHERE s.user_id = u.id AND m.role = 'user'),
+               (SELECT COALESCE(SUM(r.score), 0) FROM learning_records r
+                 WHERE r.user_id = u.id AND r.event_type = 'quiz_result' AND r.score IS NOT NULL),
+               (SELECT COUNT(r.score) FROM learning_records r
+                 WHERE r.user_id = u.id AND r.event_type = 'quiz_result'),
+               (SELECT MAX(r.id) FROM learning_records r
+                 WHERE r.user_id = u.id AND r.event_type = 'ai_analysis'),
+               CURRENT_TIMESTAMP
+        FROM users u
+    """)
+
+
+def downgrade():
+    op.drop_table("user_stats")
@@ -0,0 +1,31 @@
+"""user_stats data / analysis versions
+
+data_version 随学习数据变化递增，analysis_version 记录最新分析对应的版本，
+用于判断缓存的 AI 分析报告是否仍然有效。
+
+Revision ID: 0004_user_stats_versions
+Revises: 0003_user_stats
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004_user_stats_versions"
+down_revision = "0003_user_stats"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {c["name"] for c in sa.inspect(op.get_bind()).get_columns("user_stats")}
+    with op.batch_alter_table("user_stats") as batch:
+        for name in ("data_version", "analysis_version"):
+            if name not in columns:
+                batch.add_column(sa.Column(name, sa.Integer(), server_default="0", nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table("user_stats") as batch:
+        batch.drop_column("analysis_version")
+        batch.drop_column("data_version")
@@ -0,0 +1,31 @@
+"""client event id for learning record dedup
+
+批量上报接口允许客户端带上事件 ID，网络重试时同一事件只会入库一次。
+
+Revision ID: 0005_learning_event_dedup
+Revises: 0004_user_stats_versions
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005_learning_event_dedup"
+down_revision = "0004_user_stats_versions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if "client_event_id" not in {c["name"] for c in inspector.get_columns("learning_records")}:
+        op.add_column("learning_records", sa.Column("client_event_id", sa.String(64), nullable=True))
+    if "ux_learning_records_user_client_event" not in {ix["name"] for ix in inspector.get_indexes("learning_records")}:
+        op.create_index("ux_learning_records_user_client_event", "learning_records",
+                        ["user_id", "client_event_id"], unique=True)
+
+
+def downgrade():
+    op.drop_index("ux_learning_records_user_client_event", table_name="learning_records")
+    with op.batch_alter_table("learning_records") as batch:
+        batch.drop_column("client_event_id")
@@ -0,0 +1,90 @@
+"""activity rollup tables
+
+learning_records 增加 category 列；新建小时桶 / 天桶两张活动汇总表，并从现有明细回填。
+
+Revision ID: 0006_activity_rollups
+Revises: 0005_learning_event_dedup
+Create Date: 2026-10-18
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+
+revision = "0006_activity_rollups"
+down_revision = "0005_learning_event_dedup"
+branch_labels = None
+depends_on = None
+
+ROLLUP_TABLES = ("activity_hourly", "activity_daily")
+
+
+def _create_rollup_table(name):
+    return op.create_table(
+        name,
+        sa.Column("user_id", sa.Integer(), primary_key=True),
+        sa.Column("bucket", sa.DateTime(), primary_key=True),
+        sa.Column("event_type", sa.String(50), primary_key=True),
+        sa.Column("category", sa.String(50), primary_key=True),
+        sa.Column("event_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("score_sum", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("score_count", sa.Integer(), server_default="0", nullable=False),
+    )
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "category" not in {c["name"] for c in inspector.get_columns("learning_records")}:
+        op.add_column("learning_records", sa.Column("category", sa.String(50), nullable=True))
+
+    tables = {}
+    existing = set(inspector.get_table_names())
+    for name in ROLLUP_TABLES:
+        if name in existing:
+            tables[name] = sa.Table(name, sa.MetaData(), autoload_with=bind)
+            op.execute(tables[name].delete())
+        else:
+            tables[name] = _create_rollup_table(name)
+
+    # 回填：小时桶为 UTC 整点，天桶为配置时区的自然日
+    offset = timedelta(minutes=settings.ANALYTICS_TZ_OFFSET_MINUTES)
+    buckets = {name: defaultdict(lambda: [0, 0, 0]) for name in ROLLUP_TABLES}
+    records = sa.table(
+        "learning_records",
+        sa.column("user_id", sa.Integer()),
+        sa.column("event_type", sa.String()),
+        sa.column("category", sa.String()),
+        sa.column("score", sa.Integer()),
+        sa.column("created_at", sa.DateTime()),
+    )
+    rows = bind.execute(sa.select(records).where(records.c.created_at.isnot(None)))
+    for user_id, event_type, category, score, created_at in rows:
+        hour = created_at.replace(minute=0, second=0, microsecond=0)
+        day = (created_at + offset).replace(hour=0, minute=0, second=0, microsecond=0)
+        for name, bucket in (("activity_hourly", hour), ("activity_daily", day)):
+            counter = buckets[name][(user_id, bucket, event_type, category or "")]
+            counter[0] += 1
+            if score is not None:
+                counter[1] += score
+                counter[2] += 1
+
+    for name, table in tables.items():
+        data = [
+            {"user_id": k[0], "bucket": k[1], "event_type": k[2], "category": k[3],
+             "event_count": v[0], "score_sum": v[1], "score_count": v[2]}
+            for k, v in buckets[name].items()
+        ]
+        if data:
+            op.bulk_insert(table, data)
+
+
+def downgrade():
+    for name in ROLLUP_TABLES:
+        op.drop_table(name)
+    with op.batch_alter_table("learning_records") as batch:
+        batch.drop_column("category")
@@ -0,0 +1,40 @@
+"""keyset pagination for chat sessions
+
+- 回填旧数据中为 NULL 的 chat_sessions.mode / updated_at，游标条件和索引范围扫描都不再需要处理 NULL
+- 会话列表索引追加 id 列，(updated_at, id) 排序完全由索引提供
+
+Revision ID: 0007_session_keyset_pagination
+Revises: 0006_activity_rollups
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007_session_keyset_pagination"
+down_revision = "0006_activity_rollups"
+branch_labels = None
+depends_on = None
+
+INDEX = "ix_chat_sessions_user_mode_updated"
+
+
+def _replace_index(columns):
+    existing = {ix["name"]: ix["column_names"] for ix in sa.inspect(op.get_bind()).get_indexes("chat_sessions")}
+    if existing.get(INDEX) == columns:
+        return
+    if INDEX in existing:
+        op.drop_index(INDEX, table_name="chat_sessions")
+    op.create_index(INDEX, "chat_sessions", columns)
+
+
+def upgrade():
+    op.execute("UPDATE chat_sessions SET mode = 'casual' WHERE mode IS NULL")
+    op.execute(
+        "UPDATE chat_sessions SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE updated_at IS NULL"
+    )
+    _replace_index(["user_id", "mode", "updated_at", "id"])
+
+
+def downgrade():
+    _replace_index(["user_id", "mode", "updated_at"])
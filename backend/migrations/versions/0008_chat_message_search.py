@@ -0,0 +1,82 @@
+"""full-text search index over chat messages
+
+- SQLite: 外部内容 FTS5 表 chat_messages_fts (trigram 分词，中文无需分词器)，由触发器与 chat_messages 同步
+- PostgreSQL: pg_trgm GIN 索引，加速 ILIKE 子串匹配并提供 similarity() 排序
+- 其他数据库不建索引，搜索退化为 LIKE
+
+base64 图片 (data: 开头) 不进入索引；插入 / 删除 / 更新触发器使用同一个条件，外部内容表的 delete 命令才能对上。
+
+Revision ID: 0008_chat_message_search
+Revises: 0007_session_keyset_pagination
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0008_chat_message_search"
+down_revision = "0007_session_keyset_pagination"
+branch_labels = None
+depends_on = None
+
+INDEXED = "{row}.content IS NOT NULL AND {row}.content NOT LIKE 'data:%'"
+
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5("
+    "content, content='chat_messages', content_rowid='id', tokenize='trigram')",
+    f"""CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ai AFTER INSERT ON chat_messages
+        WHEN {INDEXED.format(row="new")} BEGIN
+          INSERT INTO chat_messages_fts(rowid, content) VALUES (new.id, new.content);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS chat_messages_fts_ad AFTER DELETE ON chat_messages
+        WHEN {INDEXED.format(row="old")} BEGIN
+          INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END""",
+    # 先删旧内容再写新内容，必须在同一个触发器里 (多个触发器的执行顺序不保证)
+    f"""CREATE TRIGGER IF NOT EXISTS chat_messages_fts_au AFTER UPDATE OF content ON chat_messages BEGIN
+          INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content)
+            SELECT 'delete', old.id, old.content WHERE {INDEXED.format(row="old")};
+          INSERT INTO chat_messages_fts(rowid, content)
+            SELECT new.id, new.content WHERE {INDEXED.format(row="new")};
+        END""",
+    # 回填已有消息 (不用 'rebuild'：它会把 data: 图片也写进索引)
+    "DELETE FROM chat_messages_fts",
+    f"INSERT INTO chat_messages_fts(rowid, content) SELECT id, content FROM chat_messages m "
+    f"WHERE {INDEXED.format(row='m')}",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS chat_messages_fts_ai",
+    "DROP TRIGGER IF EXISTS chat_messages_fts_ad",
+    "DROP TRIGGER IF EXISTS chat_messages_fts_au",
+    "DROP TABLE IF EXISTS chat_messages_fts",
+]
+
+POSTGRES_UPGRADE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_chat_messages_content_trgm ON chat_messages USING gin (content gin_trgm_ops)",
+]
+
+POSTGRES_DOWNGRADE = [
+    "DROP INDEX IF EXISTS ix_chat_messages_content_trgm",
+]
+
+
+def _run(statements):
+    for sql in statements:
+        op.execute(sql)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _run(SQLITE_UPGRADE)
+    elif dialect == "postgresql":
+        _run(POSTGRES_UPGRADE)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _run(SQLITE_DOWNGRADE)
+    elif dialect == "postgresql":
+        _run(POSTGRES_DOWNGRADE)
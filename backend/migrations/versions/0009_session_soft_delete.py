@@ -0,0 +1,31 @@
+"""soft delete for chat sessions
+
+删除会话改为设置 deleted_at，由后台任务分批清理消息 (app/services/session_purger.py)。
+
+Revision ID: 0009_session_soft_delete
+Revises: 0008_chat_message_search
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009_session_soft_delete"
+down_revision = "0008_chat_message_search"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if "deleted_at" not in {c["name"] for c in inspector.get_columns("chat_sessions")}:
+        with op.batch_alter_table("chat_sessions") as batch:
+            batch.add_column(sa.Column("deleted_at", sa.DateTime(), nullable=True))
+    if "ix_chat_sessions_deleted_at" not in {ix["name"] for ix in inspector.get_indexes("chat_sessions")}:
+        op.create_index("ix_chat_sessions_deleted_at", "chat_sessions", ["deleted_at"])
+
+
+def downgrade():
+    op.drop_index("ix_chat_sessions_deleted_at", table_name="chat_sessions")
+    with op.batch_alter_table("chat_sessions") as batch:
+        batch.drop_column("deleted_at")
@@ -0,0 +1,39 @@
+"""compressed archive for inactive chat sessions
+
+Revision ID: 0010_chat_archives
+Revises: 0009_session_soft_delete
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0010_chat_archives"
+down_revision = "0009_session_soft_delete"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if "archived_at" not in {c["name"] for c in inspector.get_columns("chat_sessions")}:
+        with op.batch_alter_table("chat_sessions") as batch:
+            batch.add_column(sa.Column("archived_at", sa.DateTime(), nullable=True))
+    if "chat_archives" not in inspector.get_table_names():
+        op.create_table(
+            "chat_archives",
+            sa.Column("session_id", sa.String(36), primary_key=True),
+            sa.Column("codec", sa.String(10), nullable=False),
+            sa.Column("message_count", sa.Integer(), nullable=False),
+            sa.Column("question_count", sa.Integer(), nullable=False),
+            sa.Column("raw_bytes", sa.Integer(), nullable=False),
+            sa.Column("compressed_bytes", sa.Integer(), nullable=False),
+            sa.Column("payload", sa.LargeBinary(), nullable=False),
+            sa.Column("archived_at", sa.DateTime()),
+        )
+
+
+def downgrade():
+    op.drop_table("chat_archives")
+    with op.batch_alter_table("chat_sessions") as batch:
+        batch.drop_column("archived_at")
@@ -0,0 +1,30 @@
+"""hourly usage buckets for token / TTS quotas
+
+Revision ID: 0011_usage_quotas
+Revises: 0010_chat_archives
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0011_usage_quotas"
+down_revision = "0010_chat_archives"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if "usage_hourly" not in inspector.get_table_names():
+        op.create_table(
+            "usage_hourly",
+            sa.Column("user_id", sa.Integer(), primary_key=True),
+            sa.Column("bucket", sa.DateTime(), primary_key=True),
+            sa.Column("tokens", sa.Integer(), server_default="0", nullable=False),
+            sa.Column("tts_chars", sa.Integer(), server_default="0", nullable=False),
+        )
+
+
+def downgrade():
+    op.drop_table("usage_hourly")
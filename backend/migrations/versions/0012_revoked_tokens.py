@@ -0,0 +1,30 @@
+"""revoked JWTs shared by all workers
+
+Revision ID: 0012_revoked_tokens
+Revises: 0011_usage_quotas
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0012_revoked_tokens"
+down_revision = "0011_usage_quotas"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if "revoked_tokens" not in inspector.get_table_names():
+        op.create_table(
+            "revoked_tokens",
+            sa.Column("digest", sa.String(64), primary_key=True),
+            sa.Column("expires_at", sa.DateTime(), nullable=True),
+        )
+        op.create_index("ix_revoked_tokens_expires_at", "revoked_tokens", ["expires_at"])
+
+
+def downgrade():
+    op.drop_index("ix_revoked_tokens_expires_at", table_name="revoked_tokens")
+    op.drop_table("revoked_tokens")
@@ -0,0 +1,61 @@
+"""hourly activity buckets in the analytics time zone
+
+小时桶原先按 UTC 整点划分，天桶按 ANALYTICS_TZ_OFFSET_MINUTES 时区划分；改为两者使用同一时区，
+从明细表重新回填 activity_hourly (天桶不变)。
+
+Revision ID: 0013_local_hourly_buckets
+Revises: 0012_revoked_tokens
+Create Date: 2026-10-19
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+
+revision = "0013_local_hourly_buckets"
+down_revision = "0012_revoked_tokens"
+branch_labels = None
+depends_on = None
+
+
+def _rebucket(offset: timedelta):
+    bind = op.get_bind()
+    hourly = sa.Table("activity_hourly", sa.MetaData(), autoload_with=bind)
+    records = sa.table(
+        "learning_records",
+        sa.column("user_id", sa.Integer()),
+        sa.column("event_type", sa.String()),
+        sa.column("category", sa.String()),
+        sa.column("score", sa.Integer()),
+        sa.column("created_at", sa.DateTime()),
+    )
+    buckets = defaultdict(lambda: [0, 0, 0])
+    rows = bind.execute(sa.select(records).where(records.c.created_at.isnot(None)))
+    for user_id, event_type, category, score, created_at in rows:
+        hour = (created_at + offset).replace(minute=0, second=0, microsecond=0)
+        counter = buckets[(user_id, hour, event_type, category or "")]
+        counter[0] += 1
+        if score is not None:
+            counter[1] += score
+            counter[2] += 1
+
+    op.execute(hourly.delete())
+    data = [
+        {"user_id": k[0], "bucket": k[1], "event_type": k[2], "category": k[3],
+         "event_count": v[0], "score_sum": v[1], "score_count": v[2]}
+        for k, v in buckets.items()
+    ]
+    if data:
+        op.bulk_insert(hourly, data)
+
+
+def upgrade():
+    _rebucket(timedelta(minutes=settings.ANALYTICS_TZ_OFFSET_MINUTES))
+
+
+def downgrade():
+    _rebucket(timedelta(0))
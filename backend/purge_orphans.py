@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+一次性清理孤儿消息 (会话行已不存在的 chat_messages)
+
+早期版本删除会话时只删除会话行，消息一直留在表中。现在删除会话改由后台任务清理，
+本脚本用于清理升级前遗留的孤儿消息，并报告清理的行数和字节数。
+
+运行: python purge_orphans.py [--dry-run] [--vacuum] [--batch-size 1000]
+"""
+import argparse
+import os
+import sys
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import SessionLocal, engine, is_sqlite
+from app.services.session_purger import sqlite_free_bytes, sweep_orphan_messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete chat messages whose session no longer exists")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    parser.add_argument("--vacuum", action="store_true", help="SQLite only: VACUUM afterwards to shrink the file")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = sweep_orphan_messages(db, batch_size=args.batch_size, dry_run=args.dry_run)
+        action = "Would delete" if args.dry_run else "Deleted"
+        print(f"✅ {action} {report['messages']} orphan message(s), {report['bytes']} content byte(s)")
+        if is_sqlite(settings.DATABASE_URL) and not args.dry_run:
+            print(f"   SQLite free pages: {sqlite_free_bytes(db)} byte(s)")
+    finally:
+        db.close()
+
+    if args.vacuum and not args.dry_run and is_sqlite(settings.DATABASE_URL):
+        path = engine.url.database
+        before = os.path.getsize(path)
+        # VACUUM 不能在事务中执行，并且会重写整个文件，期间阻塞写入
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+            # WAL 模式下 VACUUM 先写入 WAL，检查点之后主文件才会收缩
+            conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        print(f"   VACUUM: {before} -> {os.path.getsize(path)} byte(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+从明细表重算看板统计 (user_stats 以及小时 / 天活动汇总表)
+
+这些表都随事件增量更新；修改 ANALYTICS_TZ_OFFSET_MINUTES 后、手工改过数据库、或怀疑统计有偏差时运行本脚本回填。
+
+运行: python rebuild_user_stats.py [--user-id 1]
+"""
+import argparse
+import sys
+
+from app.database import SessionLocal
+from app.services.activity_rollups import rebuild_activity_rollups
+from app.services.user_stats import rebuild_user_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild user_stats and activity rollups from raw events")
+    parser.add_argument("--user-id", type=int, default=None, help="only rebuild this user (default: all users)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        count = rebuild_user_stats(db, args.user_id)
+        rollup_count = rebuild_activity_rollups(db, args.user_id)
+    finally:
+        db.close()
+    print(f"✅ Rebuilt user_stats for {count} user(s), activity rollups for {rollup_count} user(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
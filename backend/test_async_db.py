@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+异步数据库层测试 - 使用临时 SQLite 文件
+
+1. 同步驱动的 URL 转换为对应的异步驱动
+2. 慢查询在驱动线程中执行，事件循环期间仍能正常调度其他任务
+3. 聊天的保存 / 读取历史走异步会话：一轮对话一次提交，提问同时记录学习事件和看板计数
+
+运行: python test_async_db.py (或 python -m pytest test_async_db.py)
+"""
+import asyncio
+import sys
+import time
+
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api import chat
+from app.database import create_async_engines, to_async_url
+from app.models import ChatMessage, ChatSession, LearningRecord, UserStats
+from conftest import run_tests
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+def test_async_urls():
+    """驱动替换只改 scheme，路径、认证信息和查询参数保持不变；未知数据库原样返回"""
+    print_test_header("Async Driver URLs")
+    cases = {
+        "sqlite:///./ai_chat.db": "sqlite+aiosqlite:///./ai_chat.db",
+        "sqlite:////data/ai_chat.db": "sqlite+aiosqlite:////data/ai_chat.db",
+        "postgresql://u:p@db:5432/kk?sslmode=require": "postgresql+asyncpg://u:p@db:5432/kk?sslmode=require",
+        "postgresql+psycopg2://u:p@db/kk": "postgresql+asyncpg://u:p@db/kk",
+        "mysql+pymysql://u:p@db/kk?charset=utf8mb4": "mysql+aiomysql://u:p@db/kk?charset=utf8mb4",
+        "mssql+pyodbc://u:p@db/kk": "mssql+pyodbc://u:p@db/kk",
+    }
+    wrong = {url: to_async_url(url) for url, expected in cases.items() if to_async_url(url) != expected}
+    ok = not wrong
+    print_result(ok, f"{len(cases)} URLs converted", f"wrong={wrong}" if wrong else "")
+    assert ok
+
+
+def test_slow_query_does_not_block_loop(db_url):
+    """一条约数百毫秒的查询执行期间，心跳任务的间隔保持在几十毫秒以内"""
+    print_test_header("Slow Query Does Not Block Loop")
+
+    async def run():
+        writer, reader = create_async_engines(db_url)
+        gaps = []
+        stop = asyncio.Event()
+
+        async def heartbeat():
+            last = time.monotonic()
+            while not stop.is_set():
+                await asyncio.sleep(0.01)
+                now = time.monotonic()
+                gaps.append(now - last)
+                last = now
+
+        beat = asyncio.create_task(heartbeat())
+        try:
+            await asyncio.sleep(0.05)
+            started = time.monotonic()
+            async with AsyncSession(reader) as db:
+                total = await db.scalar(text(
+                    "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 1000000) "
+                    "SELECT SUM(i) FROM n"
+                ))
+            elapsed = time.monotonic() - started
+        finally:
+            stop.set()
+            await beat
+            await writer.dispose()
+            await reader.dispose()
+        return total, elapsed, max(gaps)
+
+    total, elapsed, max_gap = asyncio.run(run())
+    ok = total == 1000000 * 1000001 // 2 and elapsed > 0.1 and max_gap < min(0.1, elapsed / 2)
+    print_result(ok, "Heartbeat kept running during the query",
+                 f"query={elapsed * 1000:.0f}ms, max heartbeat gap={max_gap * 1000:.0f}ms")
+    assert ok
+
+
+def test_chat_turn_round_trip(db_url):
+    """保存提问和回复后，读取的历史按时间正序；提问记一条学习事件，看板提问数 +1"""
+    print_test_header("Chat Turn Round Trip")
+
+    async def run():
+        writer, reader = create_async_engines(db_url)
+        saved = chat.AsyncSessionLocal, chat.AsyncReadSessionLocal
+        chat.AsyncSessionLocal = async_sessionmaker(writer, expire_on_commit=False)
+        chat.AsyncReadSessionLocal = async_sessionmaker(reader, expire_on_commit=False)
+        try:
+            await chat.save_session_and_message("s1", 1, "梯度下降", "梯度下降是什么？", "user", "professional")
+            await chat.save_session_and_message("s1", 1, "梯度下降", "沿负梯度方向更新参数。", "assistant", "professional")
+            await chat.save_session_and_message("s1", 1, "梯度下降", "学习率怎么选？", "user", "casual")
+            return await chat.load_history_and_summary("s1")
+        finally:
+            chat.AsyncSessionLocal, chat.AsyncReadSessionLocal = saved
+            await writer.dispose()
+            await reader.dispose()
+
+    summary, history = asyncio.run(run())
+    with create_engine(db_url).connect() as conn:
+        session = conn.execute(select(ChatSession.title, ChatSession.mode)).one()
+        events = conn.execute(select(LearningRecord.event_type, LearningRecord.category)).all()
+        questions = conn.scalar(select(UserStats.question_count).filter(UserStats.user_id == 1))
+        messages = conn.scalar(select(ChatMessage.id).order_by(ChatMessage.id.desc()))
+    ok = (
+        summary is None
+        and [m["content"] for m in history] == ["梯度下降是什么？", "沿负梯度方向更新参数。", "学习率怎么选？"]
+        # 复用会话时不修改 mode，提问按会话模式分类
+        and tuple(session) == ("梯度下降", "professional")
+        and [tuple(e) for e in events] == [("question_asked", "professional")] * 2
+        and questions == 2 and messages == 3
+    )
+    print_result(ok, "Messages, learning events and stats written per turn", f"history={history}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_async_urls,
+        test_slow_query_does_not_block_loop,
+        test_chat_turn_round_trip,
+    ]
+    sys.exit(1 if run_tests(tests) else 0)
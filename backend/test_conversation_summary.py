@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+会话滚动摘要测试 - 使用临时 SQLite 文件，LLM 由记录 Prompt 的假客户端代替
+
+1. 移出历史窗口的消息按批增量合并进摘要，摘要进度 (summary_message_id) 持久化
+2. 历史不足一个窗口时不调用 LLM；摘要进度被其他任务推进后不覆盖
+3. 注入摘要后的 Prompt 大小有上界，与会话长度无关
+
+运行: python test_conversation_summary.py (或 python -m pytest test_conversation_summary.py)
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.api import chat
+from app.api.chat import build_context_messages, load_history_and_summary, with_summary
+from app.config import settings
+from app.database import create_async_engines
+from app.models import ChatMessage, ChatSession
+from app.services import conversation_summary
+from app.services.conversation_summary import ConversationSummarizer, _save_summary
+from conftest import run_tests
+
+BASE = datetime(2026, 10, 1, 12, 0, 0)
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+class FakeLLM:
+    """记录每次摘要请求的 Prompt，返回 "摘要N" (可指定超长回复)"""
+
+    def __init__(self, reply_chars: int = 0):
+        self.prompts = []
+        self.reply_chars = reply_chars
+
+    async def complete(self, messages, model=None, **kwargs):
+        self.prompts.append(messages[0]["content"])
+        content = "长" * self.reply_chars if self.reply_chars else f"摘要{len(self.prompts)}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def seed(url: str, messages: int) -> str:
+    with create_engine(url).begin() as conn:
+        conn.execute(insert(ChatSession), {"id": "s1", "user_id": 1, "title": "long", "mode": "casual",
+                                           "created_at": BASE, "updated_at": BASE})
+        conn.execute(insert(ChatMessage), [
+            {"id": i, "session_id": "s1", "role": "user" if i % 2 else "assistant",
+             "content": f"第 {i} 条", "created_at": BASE + timedelta(seconds=i)}
+            for i in range(1, messages + 1)
+        ])
+    return url
+
+
+def session_row(url: str) -> tuple:
+    with create_engine(url).connect() as conn:
+        return tuple(conn.execute(select(ChatSession.summary, ChatSession.summary_message_id, ChatSession.updated_at)).one())
+
+
+async def summarize(url: str, llm: FakeLLM):
+    """把摘要模块的数据库会话和 LLM 指向测试对象，跑完一次 schedule() 触发的后台任务"""
+    writer, reader = create_async_engines(url)
+    saved = conversation_summary.AsyncSessionLocal, conversation_summary.AsyncReadSessionLocal, conversation_summary.llm_router
+    conversation_summary.AsyncSessionLocal = async_sessionmaker(writer)
+    conversation_summary.AsyncReadSessionLocal = async_sessionmaker(reader)
+    conversation_summary.llm_router = llm
+    summarizer = ConversationSummarizer()
+    try:
+        summarizer.schedule("s1")
+        task = summarizer._tasks.get("s1")
+        if task:
+            await task
+    finally:
+        conversation_summary.AsyncSessionLocal, conversation_summary.AsyncReadSessionLocal, conversation_summary.llm_router = saved
+        await writer.dispose()
+        await reader.dispose()
+
+
+def test_incremental_batches(db_url):
+    """窗口外的 20 条消息按每批 8 条合并，后一批的 Prompt 带上前一批的摘要"""
+    print_test_header("Incremental Summary Batches")
+    url = seed(db_url, messages=settings.HISTORY_WINDOW + 20)
+    saved = settings.SUMMARY_BATCH_MESSAGES
+    settings.SUMMARY_BATCH_MESSAGES = 8
+    llm = FakeLLM()
+    try:
+        asyncio.run(summarize(url, llm))
+    finally:
+        settings.SUMMARY_BATCH_MESSAGES = saved
+    summary, upto_id, updated_at = session_row(url)
+    ok = (
+        len(llm.prompts) == 3
+        and "第 1 条" in llm.prompts[0] and "第 9 条" not in llm.prompts[0]
+        and "摘要1" in llm.prompts[1] and "第 9 条" in llm.prompts[1]
+        # 窗口内的消息 (21~30) 不进入摘要
+        and "第 20 条" in llm.prompts[2] and "第 21 条" not in llm.prompts[2]
+        and (summary, upto_id) == ("摘要3", 20)
+        and updated_at == BASE
+    )
+    print_result(ok, "Summary advanced to the window boundary", f"calls={len(llm.prompts)}, upto={upto_id}")
+    assert ok
+
+
+def test_short_session_and_stale_save(db_url):
+    """历史不足一个窗口时不调用 LLM；摘要进度已被推进时写入失败"""
+    print_test_header("Short Session and Stale Save")
+    url = seed(db_url, messages=settings.HISTORY_WINDOW)
+    llm = FakeLLM()
+    asyncio.run(summarize(url, llm))
+
+    async def stale():
+        writer, _ = create_async_engines(url)
+        saved = conversation_summary.AsyncSessionLocal
+        conversation_summary.AsyncSessionLocal = async_sessionmaker(writer)
+        try:
+            first = await _save_summary("s1", 0, "A", 5)
+            # 另一个任务基于旧进度 0 算出的摘要不能覆盖
+            second = await _save_summary("s1", 0, "B", 3)
+            return first, second
+        finally:
+            conversation_summary.AsyncSessionLocal = saved
+            await writer.dispose()
+
+    first, second = asyncio.run(stale())
+    ok = llm.prompts == [] and (first, second) == (True, False) and session_row(url)[:2] == ("A", 5)
+    print_result(ok, "No LLM call for short sessions, stale summary rejected", f"saves={first, second}")
+    assert ok
+
+
+def test_prompt_size_bounded(db_url):
+    """超长回复被截断；无论会话多长，摘要 + 历史窗口的大小都有固定上界"""
+    print_test_header("Prompt Size Bounded")
+    url = seed(db_url, messages=settings.HISTORY_WINDOW + 5)
+    asyncio.run(summarize(url, FakeLLM(reply_chars=settings.SUMMARY_MAX_CHARS * 3)))
+    summary = session_row(url)[0]
+
+    long_text = "x" * (settings.HISTORY_MESSAGE_MAX_CHARS * 2)
+    sizes = []
+    for length in (50, 500):
+        history = [{"role": "user" if i % 2 else "assistant", "content": long_text} for i in range(length)]
+        context = build_context_messages(history, "hi")
+        system = with_summary("你是助手", summary)
+        sizes.append(len(system) + sum(len(m["content"]) for m in context))
+    bound = settings.HISTORY_WINDOW * (settings.HISTORY_MESSAGE_MAX_CHARS + 2) + settings.SUMMARY_MAX_CHARS + 200
+    ok = len(summary) == settings.SUMMARY_MAX_CHARS and sizes[0] == sizes[1] <= bound
+    print_result(ok, "Prompt size independent of session length", f"sizes={sizes}, bound={bound}")
+    assert ok
+
+
+def test_window_edge_matches_summary(db_url):
+    """窗口边缘的消息时间戳早于前面的消息时，仍在历史窗口内，窗口与摘要之间没有缺口"""
+    print_test_header("Window Edge Matches Summary Boundary")
+    url = seed(db_url, messages=settings.HISTORY_WINDOW + 5)
+    edge_id = 6  # 窗口 (HISTORY_WINDOW 条) 内最早的一条，摘要只覆盖到它之前
+    with create_engine(url).begin() as conn:
+        conn.execute(update(ChatMessage).filter(ChatMessage.id == edge_id).values(created_at=BASE - timedelta(hours=1)))
+    asyncio.run(summarize(url, FakeLLM()))
+    upto_id = session_row(url)[1]
+
+    async def load():
+        _, reader = create_async_engines(url)
+        saved = chat.AsyncReadSessionLocal
+        chat.AsyncReadSessionLocal = async_sessionmaker(reader)
+        try:
+            return await load_history_and_summary("s1")
+        finally:
+            chat.AsyncReadSessionLocal = saved
+            await reader.dispose()
+
+    _, history = asyncio.run(load())
+    contents = [m["content"] for m in history]
+    expected = [f"第 {i} 条" for i in range(edge_id - 1, settings.HISTORY_WINDOW + 6)]
+    ok = upto_id == edge_id - 1 and contents == expected
+    print_result(ok, "Edge message kept in the history window", f"upto={upto_id}, history={contents[:3]}...")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_incremental_batches,
+        test_short_session_and_stale_save,
+        test_prompt_size_bounded,
+        test_window_edge_matches_summary,
+    ]
+    sys.exit(1 if run_tests(tests) else 0)
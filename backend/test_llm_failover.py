@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+多上游 LLM 路由故障转移测试 - 使用本地 Mock 服务器，无需真实 API Key
+
+运行: python test_llm_failover.py (或 python -m pytest test_llm_failover.py)
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.config import settings
+from app.services.llm_router import LLMBackend, LLMRouter
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+class MockLLMServer:
+    """
+    OpenAI 兼容的 Mock 上游
+
+    behavior: "ok" 正常流式返回 / "fail" 返回 500 / "slow" 延迟 delay 秒后才返回
+    """
+
+    def __init__(self, name: str, behavior: str = "ok", delay: float = 0.0):
+        self.name = name
+        self.behavior = behavior
+        self.delay = delay
+        self.hits = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                try:
+                    self._respond()
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端因超时主动断开
+                    pass
+
+            def _respond(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                server.hits += 1
+
+                if server.behavior == "fail":
+                    self.send_response(500)
+                    self.send_header("Content-Type", "application/json")
+                    self.end_headers()
+                    self.wfile.write(b'{"error": {"message": "mock failure"}}')
+                    return
+                if server.behavior == "slow":
+                    time.sleep(server.delay)
+
+                if body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    for piece in [f"hello from {server.name}", "!"]:
+                        chunk = {
+                            "id": "mock", "object": "chat.completion.chunk", "created": 0, "model": body.get("model"),
+                            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                        }
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                        self.wfile.flush()
+                    if (body.get("stream_options") or {}).get("include_usage"):
+                        usage = {
+                            "id": "mock", "object": "chat.completion.chunk", "created": 0, "model": body.get("model"),
+                            "choices": [], "usage": {"prompt_tokens": 20, "completion_tokens": 5, "total_tokens": 25},
+                        }
+                        self.wfile.write(f"data: {json.dumps(usage)}\n\n".encode())
+                    self.wfile.write(b"data: [DONE]\n\n")
+                else:
+                    completion = {
+                        "id": "mock", "object": "chat.completion", "created": 0, "model": body.get("model"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": f"hello from {server.name}"}}],
+                    }
+                    payload = json.dumps(completion).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def backend(self, weight: float = 1.0) -> LLMBackend:
+        return LLMBackend(self.name, self.base_url, "mock-key", "mock-model", weight=weight)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+async def collect(router: LLMRouter) -> str:
+    text = ""
+    async for chunk in router.stream([{"role": "user", "content": "hi"}]):
+        if chunk.choices and chunk.choices[0].delta.content:
+            text += chunk.choices[0].delta.content
+    return text
+
+
+def test_failover_before_first_token():
+    """第一个上游返回 500 时，自动切换到第二个上游"""
+    print_test_header("Failover Before First Token")
+    bad, good = MockLLMServer("bad", "fail"), MockLLMServer("good")
+    try:
+        router = LLMRouter([bad.backend(weight=1000), good.backend(weight=0.001)])
+        text = asyncio.run(collect(router))
+        ok = text == "hello from good!" and bad.hits == 1
+        print_result(ok, "Request served by healthy backend", f"text={text!r}, bad_hits={bad.hits}")
+        assert ok
+        assert router.backends[0].consecutive_failures == 1
+    finally:
+        bad.close()
+        good.close()
+
+
+def test_ejection_after_consecutive_failures():
+    """连续失败达到阈值后上游被摘除，后续请求不再发往该上游"""
+    print_test_header("Health Ejection")
+    bad, good = MockLLMServer("bad", "fail"), MockLLMServer("good")
+    old_failures = settings.LLM_EJECT_FAILURES
+    settings.LLM_EJECT_FAILURES = 2
+    try:
+        router = LLMRouter([bad.backend(weight=1000), good.backend(weight=0.001)])
+
+        async def run():
+            for _ in range(5):
+                assert await collect(router) == "hello from good!"
+
+        asyncio.run(run())
+        ok = bad.hits == 2 and not router.backends[0].is_healthy(time.monotonic())
+        print_result(ok, "Failing backend ejected", f"bad_hits={bad.hits}, good_hits={good.hits}")
+        assert ok
+    finally:
+        settings.LLM_EJECT_FAILURES = old_failures
+        bad.close()
+        good.close()
+
+
+def test_first_token_timeout():
+    """上游迟迟不返回首个 Token 时视为失败，切换上游"""
+    print_test_header("First Token Timeout")
+    slow, fast = MockLLMServer("slow", "slow", delay=2.0), MockLLMServer("fast")
+    old_timeout = settings.LLM_FIRST_TOKEN_TIMEOUT
+    settings.LLM_FIRST_TOKEN_TIMEOUT = 0.5
+    try:
+        router = LLMRouter([slow.backend(weight=1000), fast.backend(weight=0.001)])
+        start = time.monotonic()
+        text = asyncio.run(collect(router))
+        elapsed = time.monotonic() - start
+        ok = text == "hello from fast!" and elapsed < 1.5
+        print_result(ok, "Slow backend skipped", f"elapsed={elapsed:.2f}s")
+        assert ok
+    finally:
+        settings.LLM_FIRST_TOKEN_TIMEOUT = old_timeout
+        slow.close()
+        fast.close()
+
+
+def test_latency_aware_routing():
+    """同等权重下，延迟更低的上游获得更多流量"""
+    print_test_header("Latency-Aware Routing")
+    slow, fast = MockLLMServer("slow", "slow", delay=0.2), MockLLMServer("fast")
+    try:
+        router = LLMRouter([slow.backend(), fast.backend()])
+
+        async def run():
+            for _ in range(30):
+                await collect(router)
+
+        asyncio.run(run())
+        ok = fast.hits > slow.hits
+        print_result(ok, "Faster backend preferred", f"fast_hits={fast.hits}, slow_hits={slow.hits}")
+        assert ok
+    finally:
+        slow.close()
+        fast.close()
+
+
+def test_non_stream_failover():
+    """非流式调用同样支持故障转移"""
+    print_test_header("Non-Stream Failover")
+    bad, good = MockLLMServer("bad", "fail"), MockLLMServer("good")
+    try:
+        router = LLMRouter([bad.backend(weight=1000), good.backend(weight=0.001)])
+        response = asyncio.run(router.complete([{"role": "user", "content": "hi"}]))
+        content = response.choices[0].message.content
+        ok = content == "hello from good"
+        print_result(ok, "Completion served by healthy backend", f"content={content!r}")
+        assert ok
+    finally:
+        bad.close()
+        good.close()
+
+
+if __name__ == "__main__":
+    tests = [
+        test_failover_before_first_token,
+        test_ejection_after_consecutive_failures,
+        test_first_token_timeout,
+        test_latency_aware_routing,
+        test_non_stream_failover,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except AssertionError:
+            failed += 1
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
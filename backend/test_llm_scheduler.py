@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+LLM 准入控制与优先级调度测试 - 只测调度器本身，不调用上游
+
+1. 全局并发上限：空出的名额按优先级 (语音 > 聊天 > 分析 > 后台) 分配，同优先级先到先得
+2. 单用户并发上限：同一用户超出上限时排队，不影响其他用户
+3. 队列已满 / 排队超时返回 503 + Retry-After；排队中断开的请求不占名额
+
+运行: python test_llm_scheduler.py (或 python -m pytest test_llm_scheduler.py)
+"""
+import asyncio
+import sys
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.services import llm_scheduler as scheduler_module
+from app.services.llm_scheduler import (
+    LLMScheduler, PRIORITY_ANALYSIS, PRIORITY_BACKGROUND, PRIORITY_CHAT, PRIORITY_VOICE, acquire_llm_slot
+)
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+class override_settings:
+    """临时修改调度相关配置"""
+
+    def __init__(self, **values):
+        self.values = values
+        self.saved = {}
+
+    def __enter__(self):
+        for name, value in self.values.items():
+            self.saved[name] = getattr(settings, name)
+            setattr(settings, name, value)
+
+    def __exit__(self, *exc):
+        for name, value in self.saved.items():
+            setattr(settings, name, value)
+        return False
+
+
+def test_priority_order():
+    """名额空出后先给语音，再给聊天、分析、后台；同优先级按到达顺序"""
+    print_test_header("Priority Order")
+
+    async def run():
+        scheduler = LLMScheduler()
+        holder = await scheduler.acquire(None, PRIORITY_CHAT)
+        order = []
+
+        async def waiter(name, priority):
+            slot = await scheduler.acquire(None, priority)
+            order.append(name)
+            slot.release()
+
+        tasks = [asyncio.create_task(waiter(name, priority)) for name, priority in [
+            ("background", PRIORITY_BACKGROUND), ("analysis", PRIORITY_ANALYSIS),
+            ("chat-1", PRIORITY_CHAT), ("voice", PRIORITY_VOICE), ("chat-2", PRIORITY_CHAT),
+        ]]
+        await asyncio.sleep(0.01)
+        queued = scheduler.stats()["queued"]
+        holder.release()
+        await asyncio.gather(*tasks)
+        return order, queued, scheduler.stats()
+
+    with override_settings(LLM_MAX_CONCURRENCY=1, LLM_MAX_CONCURRENCY_PER_USER=1):
+        order, queued, stats = asyncio.run(run())
+    ok = (
+        queued == 5
+        and order == ["voice", "chat-1", "chat-2", "analysis", "background"]
+        and stats["active"] == 0 and stats["queued"] == 0
+        and stats["priorities"]["chat"]["admitted"] == 3
+    )
+    print_result(ok, "Slots granted by priority, FIFO within a priority", f"order={order}")
+    assert ok
+
+
+def test_per_user_cap():
+    """用户 1 已占满自己的名额时继续排队，用户 2 不受影响"""
+    print_test_header("Per-User Cap")
+
+    async def run():
+        scheduler = LLMScheduler()
+        first = [await scheduler.acquire(1, PRIORITY_CHAT) for _ in range(2)]
+        blocked = asyncio.create_task(scheduler.acquire(1, PRIORITY_CHAT))
+        other = await asyncio.wait_for(scheduler.acquire(2, PRIORITY_CHAT), timeout=1)
+        await asyncio.sleep(0.01)
+        waiting = not blocked.done()
+        first[0].release()
+        # release 可重复调用，不会多归还名额
+        first[0].release()
+        third = await asyncio.wait_for(blocked, timeout=1)
+        active = scheduler.stats()["active"]
+        for slot in (first[1], other, third):
+            slot.release()
+        return waiting, active, scheduler.stats()["active"]
+
+    with override_settings(LLM_MAX_CONCURRENCY=10, LLM_MAX_CONCURRENCY_PER_USER=2):
+        waiting, active, final = asyncio.run(run())
+    ok = waiting and active == 3 and final == 0
+    print_result(ok, "Per-user cap queues only that user", f"active={active}, final={final}")
+    assert ok
+
+
+def test_saturation_returns_503():
+    """队列已满立即 503；排队超时 503；排队中取消的请求不会拿走名额"""
+    print_test_header("Saturation Returns 503")
+
+    async def run():
+        saved = scheduler_module.llm_scheduler
+        scheduler = scheduler_module.llm_scheduler = LLMScheduler()
+        errors = []
+        try:
+            holder = await acquire_llm_slot(None, PRIORITY_CHAT)
+            cancelled = asyncio.create_task(acquire_llm_slot(None, PRIORITY_BACKGROUND))
+            await asyncio.sleep(0.01)
+            # 队列已满 (LLM_MAX_QUEUE=1)
+            try:
+                await acquire_llm_slot(None, PRIORITY_CHAT)
+            except HTTPException as e:
+                errors.append((e.status_code, "Retry-After" in e.headers))
+            cancelled.cancel()
+            await asyncio.gather(cancelled, return_exceptions=True)
+            # 队列空出后可以排队，但名额一直被占用，语音的排队截止时间到了返回 503
+            try:
+                await acquire_llm_slot(None, PRIORITY_VOICE)
+            except HTTPException as e:
+                errors.append((e.status_code, int(e.headers["Retry-After"]) >= 1))
+            holder.release()
+            stats = scheduler.stats()
+        finally:
+            scheduler_module.llm_scheduler = saved
+        return errors, stats
+
+    with override_settings(LLM_MAX_CONCURRENCY=1, LLM_MAX_QUEUE=1, LLM_QUEUE_TIMEOUT_VOICE=0.05):
+        errors, stats = asyncio.run(run())
+    ok = (
+        errors == [(503, True), (503, True)]
+        and stats["active"] == 0 and stats["queued"] == 0
+        and stats["priorities"]["chat"]["rejected"] == 1 and stats["priorities"]["voice"]["rejected"] == 1
+    )
+    print_result(ok, "Queue full and queue timeout rejected with Retry-After", f"errors={errors}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_priority_order,
+        test_per_user_cap,
+        test_saturation_returns_503,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except AssertionError:
+            failed += 1
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
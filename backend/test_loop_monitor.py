@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+事件循环延迟监控测试
+
+- 同步阻塞 (time.sleep) 被看门狗发现，调用栈指向阻塞的函数，阻塞结束后补上持续时长
+- 只有 await 的正常代码不产生阻塞记录，延迟直方图持续有数据
+- 回归检查：TTS Token 刷新 (阿里云 SDK 同步请求) 不再阻塞事件循环，刷新锁可在多个事件循环中使用
+
+运行: python test_loop_monitor.py (或 python -m pytest test_loop_monitor.py)
+"""
+import asyncio
+import sys
+import time
+
+from app.services.aliyun_tts import AliyunTTSService
+from app.services.loop_monitor import LoopLagMonitor, event_loop_lag_seconds
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+async def monitored(coro_factory, threshold: float = 0.15) -> LoopLagMonitor:
+    """在监控下运行一段代码，返回监控器 (含阻塞记录)"""
+    monitor = LoopLagMonitor(interval=0.02, threshold=threshold, history=10)
+    monitor.start()
+    try:
+        # 先让心跳跑几轮
+        await asyncio.sleep(0.1)
+        await coro_factory()
+        await asyncio.sleep(0.1)
+    finally:
+        await monitor.stop()
+    return monitor
+
+
+def blocking_handler():
+    time.sleep(0.4)
+
+
+def test_detects_blocking_call():
+    print_test_header("Blocking call detected with its stack")
+
+    async def work():
+        blocking_handler()
+
+    monitor = asyncio.run(monitored(work))
+    blocks = list(monitor.blocks)
+    stack = "".join(blocks[0].stack) if blocks else ""
+    duration = blocks[0].duration if blocks else None
+    success = (len(blocks) == 1 and "blocking_handler" in stack and "time.sleep" in stack
+               and duration is not None and 0.3 < duration < 1.0 and monitor.max_lag > 0.3)
+    print_result(success, "one block, stack points at time.sleep",
+                 f"blocks={len(blocks)}, duration={duration}, max_lag={monitor.max_lag:.3f}s")
+    assert success
+
+
+def test_no_false_positive():
+    print_test_header("Awaiting code is not reported")
+    before = event_loop_lag_seconds.labels().counts[:]
+
+    async def work():
+        for _ in range(20):
+            await asyncio.sleep(0.01)
+            sum(range(10000))
+
+    monitor = asyncio.run(monitored(work))
+    beats = sum(event_loop_lag_seconds.labels().counts) - sum(before)
+    success = len(monitor.blocks) == 0 and beats >= 10
+    print_result(success, "no blocks, lag histogram populated", f"beats={beats}, max_lag={monitor.max_lag * 1000:.1f}ms")
+    assert success
+
+
+def test_tts_token_refresh_does_not_block():
+    print_test_header("TTS token refresh runs off the event loop")
+    calls = []
+
+    def slow_get_token():
+        # 模拟阿里云 SDK 的同步 HTTP 请求
+        calls.append(1)
+        time.sleep(0.4)
+        return None
+
+    original = AliyunTTSService.get_token
+    AliyunTTSService.get_token = staticmethod(slow_get_token)
+    AliyunTTSService._token = None
+    try:
+        monitor = asyncio.run(monitored(lambda: AliyunTTSService.synthesize("你好")))
+    finally:
+        AliyunTTSService.get_token = original
+    success = len(calls) == 1 and len(monitor.blocks) == 0
+    print_result(success, "token fetched in a worker thread, loop never blocked",
+                 f"blocks={len(monitor.blocks)}, max_lag={monitor.max_lag * 1000:.1f}ms")
+    assert success
+
+
+def test_tts_refresh_lock_per_loop():
+    print_test_header("TTS token refresh lock works across event loops")
+    calls = []
+
+    def slow_get_token():
+        calls.append(1)
+        time.sleep(0.05)
+        return None
+
+    async def concurrent_refresh():
+        # 并发刷新让后来者在锁上等待，锁因此绑定到当前事件循环
+        return await asyncio.gather(*(AliyunTTSService.get_token_async() for _ in range(3)))
+
+    original = AliyunTTSService.get_token
+    AliyunTTSService.get_token = staticmethod(slow_get_token)
+    AliyunTTSService._token = None
+    errors = []
+    try:
+        for _ in range(2):
+            try:
+                asyncio.run(concurrent_refresh())
+            except RuntimeError as e:
+                errors.append(str(e))
+    finally:
+        AliyunTTSService.get_token = original
+    success = not errors and len(calls) == 6
+    print_result(success, "each asyncio.run gets its own refresh lock", f"calls={len(calls)}, errors={errors}")
+    assert success
+
+
+if __name__ == "__main__":
+    tests = [
+        test_detects_blocking_call,
+        test_no_false_positive,
+        test_tts_token_refresh_does_not_block,
+        test_tts_refresh_lock_per_loop,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except AssertionError:
+            failed += 1
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
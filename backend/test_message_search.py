@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+聊天记录全文搜索测试 - 使用临时 SQLite 文件 (FTS5 trigram 索引)
+
+运行: python test_message_search.py (或 python -m pytest test_message_search.py)
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, delete, insert, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import create_async_engines
+from app.models import ChatMessage, ChatSession
+from app.services.message_search import search_messages
+from conftest import run_tests
+
+BASE = datetime(2026, 10, 1, 12, 0, 0)
+MESSAGES = [
+    # (id, session_id, content)
+    (1, "s1", "我今天在学习机器学习算法，梯度下降总是不收敛"),
+    (2, "s1", "梯度下降不收敛通常是学习率太大"),
+    (3, "s2", "How do I fix a Python ImportError?"),
+    (4, "s2", "data:image/png;base64,机器学习机器学习"),
+    (5, "s2", "100% 的把握？用 LIKE 搜 _ 和 % 要转义"),
+    (6, "s3", "别人的会话：机器学习入门"),
+]
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+def seed(url: str) -> str:
+    """用户 1 拥有 s1 / s2，s3 属于用户 2"""
+    # 迁移之后写入的消息由触发器同步到全文索引
+    with create_engine(url).begin() as conn:
+        conn.execute(insert(ChatSession), [
+            {"id": "s1", "user_id": 1, "title": "机器学习", "mode": "professional"},
+            {"id": "s2", "user_id": 1, "title": "Python", "mode": "casual"},
+            {"id": "s3", "user_id": 2, "title": "other", "mode": "casual"},
+        ])
+        conn.execute(insert(ChatMessage), [
+            {"id": i, "session_id": sid, "role": "user", "content": content, "created_at": BASE + timedelta(minutes=i)}
+            for i, sid, content in MESSAGES
+        ])
+    return url
+
+
+def search(url: str, query: str, limit: int = 20, offset: int = 0):
+    async def run():
+        _, reader = create_async_engines(url)
+        try:
+            async with AsyncSession(reader) as db:
+                return await search_messages(db, 1, query, limit, offset)
+        finally:
+            await reader.dispose()
+    return asyncio.run(run())
+
+
+def ids(result) -> list:
+    return [item["message_id"] for item in result[0]]
+
+
+def test_search_matches_own_messages(db_url):
+    """中英文子串都能搜到，只返回自己会话中的消息，不搜 base64 图片"""
+    print_test_header("Search Own Messages")
+    url = seed(db_url)
+    results = {
+        "机器学习": ids(search(url, "机器学习")),
+        "importerror": ids(search(url, "importerror")),
+        "梯度下降 收敛": sorted(ids(search(url, "梯度下降 收敛"))),
+        # 两个字的词低于 trigram 最小长度，走 LIKE
+        "学习": sorted(ids(search(url, "学习"))),
+        "% _": ids(search(url, "% _")),
+        'AND "OR': ids(search(url, 'AND "OR')),
+    }
+    ok = results == {
+        "机器学习": [1],
+        "importerror": [3],
+        "梯度下降 收敛": [1, 2],
+        "学习": [1, 2],
+        "% _": [5],
+        'AND "OR': [],
+    }
+    print_result(ok, "Matches limited to the user's sessions", f"results={results}")
+    assert ok
+
+
+def test_index_follows_writes(db_url):
+    """触发器随消息的新增、修改、删除同步索引"""
+    print_test_header("FTS Index Follows Writes")
+    url = seed(db_url)
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(insert(ChatMessage), {"id": 7, "session_id": "s2", "role": "user", "content": "新增的强化学习问题"})
+        conn.execute(update(ChatMessage).filter(ChatMessage.id == 3).values(content="How do I fix a KeyError?"))
+        conn.execute(delete(ChatMessage).filter(ChatMessage.id == 2))
+        conn.execute(delete(ChatMessage).filter(ChatMessage.id == 4))
+    with engine.begin() as conn:
+        # 索引内部结构损坏时报错 (rank = 0 表示不与 chat_messages 逐行比对，data: 图片本就不在索引中)
+        conn.execute(text("INSERT INTO chat_messages_fts(chat_messages_fts, rank) VALUES ('integrity-check', 0)"))
+    results = {
+        "强化学习": ids(search(url, "强化学习")),
+        "importerror": ids(search(url, "importerror")),
+        "keyerror": ids(search(url, "keyerror")),
+        "学习率": ids(search(url, "学习率")),
+    }
+    ok = results == {"强化学习": [7], "importerror": [], "keyerror": [3], "学习率": []}
+    print_result(ok, "Inserts, updates and deletes reflected", f"results={results}")
+    assert ok
+
+
+def test_search_pages(db_url):
+    """结果分页：翻完所有页不重复、不遗漏"""
+    print_test_header("Search Pages")
+    url = seed(db_url)
+    with create_engine(url).begin() as conn:
+        conn.execute(insert(ChatMessage), [
+            {"session_id": "s1", "role": "assistant", "content": f"第 {i} 条关于神经网络的回答"} for i in range(25)
+        ])
+    pages, offset, has_more = [], 0, True
+    while has_more:
+        items, has_more = search(url, "神经网络", limit=10, offset=offset)
+        pages.append([item["message_id"] for item in items])
+        offset += 10
+    walked = [i for page in pages for i in page]
+    ok = [len(p) for p in pages] == [10, 10, 5] and len(set(walked)) == 25
+    print_result(ok, "25 hits over 3 pages", f"sizes={[len(p) for p in pages]}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_search_matches_own_messages,
+        test_index_follows_writes,
+        test_search_pages,
+    ]
+    sys.exit(1 if run_tests(tests) else 0)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+/metrics 指标测试
+
+- 直方图按 Prometheus 约定输出累计桶 (le 含边界)、_sum 和 _count；标签值转义；无标签指标从 0 开始输出
+- RouteTimer 记录首 Token 延迟和生成速度：优先使用上游返回的 completion_tokens，没有时按内容 Chunk 数
+- 缓存命中率在抓取时读取各缓存自己的计数
+- 出错的语句不影响之后语句的计时；提交耗时只记录应用自己的会话，重复注册不重复计数
+- /metrics 返回 Prometheus 文本格式，METRICS_ENABLED = False 时返回 404
+
+运行: python test_metrics.py (或 python -m pytest test_metrics.py)
+"""
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+
+import httpx
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import AppSession
+from app.services import metrics as metrics_module
+from app.services.metrics import MetricsRegistry
+from app.services.model_routing import ModelRouteStats, RouteDecision
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+def sample(text: str, line_prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"missing sample {line_prefix}")
+
+
+def test_text_format():
+    print_test_header("Prometheus text format")
+    registry = MetricsRegistry(prefix="t_")
+    latency = registry.histogram("latency_seconds", "Latency", ["route"], buckets=(0.1, 0.5, 1.0))
+    for value in (0.05, 0.1, 0.3, 2.0):
+        latency.labels("fast").observe(value)
+    registry.counter("errors_total", "Errors", ["reason"]).labels('bad "quote"\n').inc(3)
+    registry.gauge("streams_active", "Open streams")
+    text = registry.render()
+    print(text)
+
+    success = (
+        sample(text, 't_latency_seconds_bucket{route="fast",le="0.1"}') == 2
+        and sample(text, 't_latency_seconds_bucket{route="fast",le="0.5"}') == 3
+        and sample(text, 't_latency_seconds_bucket{route="fast",le="1.0"}') == 3
+        and sample(text, 't_latency_seconds_bucket{route="fast",le="+Inf"}') == 4
+        and abs(sample(text, 't_latency_seconds_sum{route="fast"}') - 2.45) < 1e-9
+        and sample(text, 't_latency_seconds_count{route="fast"}') == 4
+        and sample(text, 't_errors_total{reason="bad \\"quote\\"\\n"}') == 3
+        and sample(text, "t_streams_active") == 0
+        and "# TYPE t_latency_seconds histogram" in text
+    )
+    print_result(success, "cumulative buckets, escaped labels, zero-valued gauge")
+    assert success
+
+
+def test_route_timer():
+    print_test_header("RouteTimer records TTFT and tokens/sec")
+    stats = ModelRouteStats()
+    route = RouteDecision("metrics_test", "m", "test")
+
+    timer = stats.timer(route)
+    time.sleep(0.05)
+    for _ in range(5):
+        timer.first_token()
+    time.sleep(0.1)
+    # 上游返回的 completion_tokens 优先于 Chunk 数
+    timer.finish(usage=SimpleNamespace(completion_tokens=21))
+
+    failed = stats.timer(route)
+    failed.finish(ok=False)
+
+    ttft = metrics_module.llm_ttft_seconds.labels("metrics_test")
+    speed = metrics_module.llm_tokens_per_second.labels("metrics_test")
+    ok = metrics_module.llm_requests_total.labels("metrics_test", "ok").value
+    errors = metrics_module.llm_requests_total.labels("metrics_test", "error").value
+    rate = speed.sum
+    success = (sum(ttft.counts) == 1 and 0.04 < ttft.sum < 0.5
+               and sum(speed.counts) == 1 and 100 < rate < 220
+               and timer.chunks == 5 and ok == 1 and errors == 1)
+    print_result(success, "one TTFT sample, tokens/sec from usage, error counted",
+                 f"ttft={ttft.sum:.3f}s, rate={rate:.0f} tok/s, ok={ok}, errors={errors}")
+    assert success
+
+
+def test_cache_hit_ratio():
+    print_test_header("Cache hit ratio read at scrape time")
+    cache = SimpleNamespace(hits=3, misses=1)
+    metrics_module.register_cache("metrics_test", cache)
+    try:
+        text = metrics_module.metrics.render()
+        cache.hits = 7
+        later = metrics_module.metrics.render()
+    finally:
+        metrics_module._caches.pop("metrics_test", None)
+    success = (sample(text, 'kkchat_cache_hit_ratio{cache="metrics_test"}') == 0.75
+               and sample(text, 'kkchat_cache_requests_total{cache="metrics_test",result="miss"}') == 1
+               and sample(later, 'kkchat_cache_hit_ratio{cache="metrics_test"}') == 0.875)
+    print_result(success, "ratio follows the cache's own counters")
+    assert success
+
+
+def test_db_instrumentation():
+    print_test_header("Statement and commit timing")
+    engine = create_engine("sqlite://")
+    metrics_module.instrument_engine(engine, "metrics_test")
+    selects = metrics_module.db_query_seconds.labels("metrics_test", "select")
+    commits = metrics_module.db_commit_seconds.labels()
+
+    with engine.connect() as conn:
+        # 出错的语句不触发 after_cursor_execute，不能在连接上留下开始时间
+        for _ in range(3):
+            try:
+                conn.execute(text("SELECT * FROM missing_table"))
+            except OperationalError:
+                pass
+        conn.execute(text("SELECT 1"))
+        leftovers = {k: v for k, v in conn.info.items() if k.startswith("metrics")}
+
+    # 计时事件在应用启动 (lifespan) 时注册，重复注册不会重复计数
+    for _ in range(2):
+        metrics_module.instrument_sessions(AppSession)
+    before = sum(commits.counts)
+    for session_class in (Session, AppSession):
+        with session_class(bind=engine) as db:
+            db.execute(text("SELECT 1"))
+            db.commit()
+    # 只有应用自己的 Session 子类记录提交耗时
+    commit_samples = sum(commits.counts) - before
+
+    success = sum(selects.counts) == 3 and not leftovers and commit_samples == 1
+    print_result(success, "failed statements leave nothing behind, commits timed on AppSession only",
+                 f"selects={sum(selects.counts)}, leftovers={leftovers}, commits={commit_samples}")
+    assert success
+
+
+def test_metrics_endpoint():
+    print_test_header("GET /metrics")
+    from app.main import app
+
+    async def fetch():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            enabled = await client.get("/metrics")
+            settings.METRICS_ENABLED = False
+            try:
+                disabled = await client.get("/metrics")
+            finally:
+                settings.METRICS_ENABLED = True
+            return enabled, disabled
+
+    enabled, disabled = asyncio.run(fetch())
+    success = (enabled.status_code == 200
+               and enabled.headers["content-type"].startswith("text/plain; version=0.0.4")
+               and "# TYPE kkchat_llm_ttft_seconds histogram" in enabled.text
+               and "kkchat_websocket_connections_active 0" in enabled.text
+               and disabled.status_code == 404)
+    print_result(success, "Prometheus exposition, 404 when disabled",
+                 f"status={enabled.status_code}/{disabled.status_code}, {len(enabled.text)} bytes")
+    assert success
+
+
+if __name__ == "__main__":
+    tests = [
+        test_text_format,
+        test_route_timer,
+        test_cache_hit_ratio,
+        test_db_instrumentation,
+        test_metrics_endpoint,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except AssertionError:
+            failed += 1
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
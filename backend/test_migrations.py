@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+数据库迁移与索引测试 - 使用临时 SQLite 文件，不影响开发数据库
+
+1. 空库 / create_all 建出的库 / 缺列的旧库都能直接 upgrade head
+2. 各热点接口的查询在 EXPLAIN QUERY PLAN 中都走索引 (没有全表扫描)
+
+运行: python test_migrations.py (或 python -m pytest test_migrations.py)
+"""
+import os
+from datetime import datetime
+import sqlite3
+import sys
+
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, func, inspect, select, text
+
+from app.database import Base, keyset_before, run_migrations
+from app.models import ActivityDaily, ChatMessage, ChatSession, LearningRecord, User, UserStats
+from conftest import run_tests
+
+HOT_INDEXES = {
+    "learning_records": "ix_learning_records_user_event_created",
+    "chat_messages": "ix_chat_messages_session_created",
+    "chat_sessions": "ix_chat_sessions_user_mode_updated",
+}
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+def missing_indexes(url: str) -> list:
+    inspector = inspect(create_engine(url))
+    return [
+        name for table, name in HOT_INDEXES.items()
+        if name not in {ix["name"] for ix in inspector.get_indexes(table)}
+    ]
+
+
+def current_revision(url: str) -> str:
+    with create_engine(url).connect() as conn:
+        return conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+
+
+def head_revision() -> str:
+    return ScriptDirectory.from_config(Config(os.path.join(os.path.dirname(__file__), "alembic.ini"))).get_current_head()
+
+
+def test_upgrade_empty_database(empty_db_url):
+    """全新空库：建出全部表和复合索引"""
+    print_test_header("Upgrade Empty Database")
+    run_migrations(empty_db_url)
+    tables = set(inspect(create_engine(empty_db_url)).get_table_names())
+    missing = missing_indexes(empty_db_url)
+    ok = {"users", "chat_sessions", "chat_messages", "learning_records"} <= tables and not missing
+    print_result(ok, "Tables and indexes created", f"revision={current_revision(empty_db_url)}, missing={missing}")
+    assert ok
+
+
+def test_upgrade_create_all_database(empty_db_url):
+    """之前由 create_all 建出的库：迁移可以直接接管，不会重复建表"""
+    print_test_header("Upgrade create_all Database")
+    Base.metadata.create_all(bind=create_engine(empty_db_url))
+    run_migrations(empty_db_url)
+    ok = current_revision(empty_db_url) == head_revision() and not missing_indexes(empty_db_url)
+    print_result(ok, "create_all database adopted")
+    assert ok
+
+
+def test_upgrade_legacy_database(empty_db_url):
+    """更早的旧库：chat_sessions 缺少 mode / summary 列，也没有复合索引"""
+    print_test_header("Upgrade Legacy Database")
+    conn = sqlite3.connect(empty_db_url[len("sqlite:///"):])
+    conn.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(50), email VARCHAR(100),
+                            hashed_password VARCHAR(255), is_active BOOLEAN, created_at DATETIME);
+        CREATE TABLE chat_sessions (id VARCHAR(36) PRIMARY KEY, user_id INTEGER, title VARCHAR(255),
+                                    created_at DATETIME, updated_at DATETIME);
+        CREATE TABLE chat_messages (id INTEGER PRIMARY KEY, session_id VARCHAR(36), role VARCHAR(20),
+                                    content TEXT, tokens INTEGER, created_at DATETIME);
+        CREATE TABLE learning_records (id INTEGER PRIMARY KEY, user_id INTEGER, event_type VARCHAR(50),
+                                       content TEXT, score INTEGER, created_at DATETIME);
+        INSERT INTO chat_sessions (id, user_id, title) VALUES ('s1', 1, 'old session');
+    """)
+    conn.commit()
+    conn.close()
+
+    run_migrations(empty_db_url)
+    with create_engine(empty_db_url).connect() as c:
+        row = c.execute(text("SELECT mode, summary_message_id FROM chat_sessions WHERE id = 's1'")).one()
+        null_keys = c.execute(text("SELECT COUNT(*) FROM chat_sessions WHERE updated_at IS NULL")).scalar()
+    ok = tuple(row) == ("casual", 0) and null_keys == 0 and not missing_indexes(empty_db_url)
+    print_result(ok, "Missing columns added with defaults", f"row={tuple(row)}")
+    assert ok
+
+
+def hot_queries():
+    """各接口实际执行的查询 (与 app/api 中的写法保持一致)"""
+    user_id, session_id = 1, "00000000-0000-0000-0000-000000000000"
+    return {
+        # /auth/login
+        "login": select(User).filter(User.username == "alice").limit(1),
+        # /api/sessions (第二页)
+        "session_list": select(ChatSession.id, ChatSession.title, ChatSession.updated_at).filter(
+            ChatSession.user_id == user_id,
+            ChatSession.mode == "casual",
+            ChatSession.deleted_at.is_(None),
+            keyset_before(ChatSession.updated_at, ChatSession.id, (datetime(2026, 1, 1), "s"))
+        ).order_by(ChatSession.updated_at.desc(), ChatSession.id.desc()).limit(51),
+        # /api/messages/{session_id} (第二页)
+        "session_messages": select(ChatMessage.id, ChatMessage.role, ChatMessage.content).filter(
+            ChatMessage.session_id == session_id,
+            keyset_before(ChatMessage.created_at, ChatMessage.id, (datetime(2026, 1, 1), 100))
+        ).order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(51),
+        # /api/chat 上下文窗口
+        "history_window": select(ChatMessage.role, ChatMessage.content).filter(
+            ChatMessage.session_id == session_id
+        ).order_by(ChatMessage.created_at.desc()).limit(11),
+        # /api/learning/dashboard
+        "dashboard_stats": select(UserStats, LearningRecord.content).outerjoin(
+            LearningRecord, LearningRecord.id == UserStats.last_analysis_id
+        ).filter(UserStats.user_id == user_id),
+        "dashboard_recent": select(LearningRecord).filter(
+            LearningRecord.user_id == user_id
+        ).order_by(LearningRecord.created_at.desc()).limit(10),
+        # DELETE /api/sessions/{session_id} 扣减提问数
+        "delete_session_questions": select(func.count(ChatMessage.id)).filter(
+            ChatMessage.session_id == session_id,
+            ChatMessage.role == "user"
+        ),
+        # 已删除会话清理任务
+        "purge_next_session": select(ChatSession.id).filter(
+            ChatSession.deleted_at.isnot(None)
+        ).order_by(ChatSession.deleted_at).limit(1),
+        "purge_message_batch": select(ChatMessage.id).filter(ChatMessage.session_id == session_id).limit(500),
+        # /api/learning/analytics/*
+        "analytics_daily": select(ActivityDaily.bucket, ActivityDaily.event_type, func.sum(ActivityDaily.event_count)).filter(
+            ActivityDaily.user_id == user_id,
+            ActivityDaily.bucket >= "2026-01-01"
+        ).group_by(ActivityDaily.bucket, ActivityDaily.event_type),
+        # /api/learning/analyze
+        "analyze_questions": select(ChatMessage.content).join(
+            ChatSession, ChatMessage.session_id == ChatSession.id
+        ).filter(
+            ChatSession.user_id == user_id,
+            ChatMessage.role == "user"
+        ).order_by(ChatMessage.created_at.desc()).limit(20),
+    }
+
+
+def query_plan(engine, statement) -> list:
+    sql = str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+
+def full_scans(engine, statement) -> list:
+    """返回 EXPLAIN QUERY PLAN 中没有使用索引的表扫描"""
+    return [step for step in query_plan(engine, statement) if step.startswith("SCAN") and "INDEX" not in step]
+
+
+def test_hot_queries_use_indexes(db_url):
+    """热点查询都不做全表扫描"""
+    print_test_header("Hot Queries Use Indexes")
+    engine = create_engine(db_url)
+    failures = {}
+    for name, statement in hot_queries().items():
+        scans = full_scans(engine, statement)
+        if scans:
+            failures[name] = scans
+    ok = not failures
+    print_result(ok, f"{len(hot_queries())} queries checked", f"full scans: {failures}" if failures else "")
+    assert ok
+
+
+def test_keyset_pages_use_index_order(db_url):
+    """分页查询的排序由索引提供，不需要临时排序 (否则每一页都要先排完整个会话)"""
+    print_test_header("Keyset Pages Use Index Order")
+    engine = create_engine(db_url)
+    queries = hot_queries()
+    sorts = {name: [step for step in query_plan(engine, queries[name]) if "TEMP B-TREE" in step]
+             for name in ("session_list", "session_messages")}
+    ok = not any(sorts.values())
+    print_result(ok, "No temp b-tree for paginated queries", f"sorts={sorts}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_upgrade_empty_database,
+        test_upgrade_create_all_database,
+        test_upgrade_legacy_database,
+        test_hot_queries_use_indexes,
+        test_keyset_pages_use_index_order,
+    ]
+    sys.exit(1 if run_tests(tests) else 0)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+按请求形态选择模型的测试 - 上游客户端由记录请求参数的假客户端代替
+
+1. 路由矩阵：模式 × 是否带图片 × Prompt 长度 -> 路由类别
+2. 每个上游按自己的配置把路由类别解析成模型名，没有配置的类别使用该上游的 model
+3. 故障转移到备用上游时，发给备用上游的是它自己的模型名
+
+运行: python test_model_routing.py (或 python -m pytest test_model_routing.py)
+"""
+import asyncio
+import sys
+from types import SimpleNamespace
+
+from app.config import settings
+from app.services.llm_router import LLMBackend, LLMRouter, load_backends
+from app.services.model_routing import ROUTE_FAST, ROUTE_TEXT, ROUTE_VISION, choose_model
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+class FakeClient:
+    """记录收到的 model 参数；fail=True 时模拟上游连接失败"""
+
+    def __init__(self, fail: bool = False):
+        self.models = []
+        self.fail = fail
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, **kwargs):
+        self.models.append(model)
+        if self.fail:
+            raise ConnectionError("upstream unreachable")
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=model))])
+
+
+def fake_backend(name: str, model: str, models=None, fail: bool = False) -> LLMBackend:
+    backend = LLMBackend(name, "http://unused", "key", model, models=models)
+    backend._client = FakeClient(fail)
+    return backend
+
+
+def test_routing_matrix():
+    """图片优先；语音 / 摘要走快速模型；长 Prompt、专业模式、分析走文本模型；其余闲聊走快速模型"""
+    print_test_header("Routing Matrix")
+    long_prompt = settings.MODEL_ROUTING_LONG_PROMPT_CHARS + 1
+    cases = [
+        (("casual", True, 0), ROUTE_VISION),
+        (("voice", True, long_prompt), ROUTE_VISION),
+        (("voice", False, long_prompt), ROUTE_FAST),
+        (("summary", False, long_prompt), ROUTE_FAST),
+        (("casual", False, long_prompt), ROUTE_TEXT),
+        (("professional", False, 10), ROUTE_TEXT),
+        (("analysis", False, 10), ROUTE_TEXT),
+        (("casual", False, 10), ROUTE_FAST),
+        ((None, False, 10), ROUTE_FAST),
+    ]
+    wrong = {}
+    for (mode, has_images, chars), expected in cases:
+        decision = choose_model(mode, has_images=has_images, prompt_chars=chars)
+        if decision.route != expected:
+            wrong[(mode, has_images, chars)] = decision.route
+
+    saved = settings.MODEL_ROUTING_ENABLED
+    settings.MODEL_ROUTING_ENABLED = False
+    try:
+        disabled = choose_model("casual", prompt_chars=10)
+    finally:
+        settings.MODEL_ROUTING_ENABLED = saved
+    ok = not wrong and disabled.model == settings.LLM_MODEL_NAME
+    print_result(ok, f"{len(cases)} request shapes routed", f"wrong={wrong}" if wrong else "")
+    assert ok
+
+
+def test_backend_resolves_route_classes():
+    """默认上游取 LLM_*_MODEL_NAME；配置了 models 的上游按类别映射；未配置的类别用该上游自己的 model"""
+    print_test_header("Backend Resolves Route Classes")
+    saved = settings.LLM_BACKENDS, settings.MODEL_ROUTING_ENABLED
+    try:
+        settings.LLM_BACKENDS = ""
+        default = load_backends()[0]
+        settings.LLM_BACKENDS = (
+            '[{"name": "openai", "base_url": "http://a", "model": "gpt-4o", "models": {"fast": "gpt-4o-mini"}},'
+            ' {"name": "local", "base_url": "http://b", "model": "llama3"}]'
+        )
+        mapped, bare = load_backends()
+        resolved = {
+            backend.name: [backend.resolve_model(route) for route in (ROUTE_FAST, ROUTE_TEXT, ROUTE_VISION, None)]
+            for backend in (default, mapped, bare)
+        }
+        settings.MODEL_ROUTING_ENABLED = False
+        disabled = [backend.resolve_model(ROUTE_FAST) for backend in (default, mapped, bare)]
+    finally:
+        settings.LLM_BACKENDS, settings.MODEL_ROUTING_ENABLED = saved
+    ok = (
+        resolved["default"] == [
+            settings.LLM_FAST_MODEL_NAME or settings.LLM_MODEL_NAME,
+            settings.LLM_TEXT_MODEL_NAME or settings.LLM_MODEL_NAME,
+            settings.LLM_VISION_MODEL_NAME or settings.LLM_MODEL_NAME,
+            settings.LLM_MODEL_NAME,
+        ]
+        and resolved["openai"] == ["gpt-4o-mini", "gpt-4o", "gpt-4o", "gpt-4o"]
+        and resolved["local"] == ["llama3"] * 4
+        and disabled == [settings.LLM_MODEL_NAME, "gpt-4o", "llama3"]
+    )
+    print_result(ok, "Each backend uses its own model names", f"resolved={resolved}")
+    assert ok
+
+
+def test_failover_uses_backend_model():
+    """主上游失败后切到备用上游，备用上游收到的是自己的模型名而不是 DashScope 的 qwen-*"""
+    print_test_header("Failover Uses Backend Model")
+    primary = fake_backend("dashscope", "qwen-vl-max", {"fast": "qwen-turbo", "text": "qwen-plus"}, fail=True)
+    secondary = fake_backend("openai", "gpt-4o", {"fast": "gpt-4o-mini"})
+    router = LLMRouter([primary, secondary])
+    router._candidates = lambda: [primary, secondary]
+
+    async def run():
+        fast = await router.complete([{"role": "user", "content": "hi"}], route=choose_model("voice").route)
+        text = await router.complete([{"role": "user", "content": "hi"}], route=choose_model("professional").route)
+        return fast.choices[0].message.content, text.choices[0].message.content
+
+    answers = asyncio.run(run())
+    ok = (
+        primary._client.models == ["qwen-turbo", "qwen-plus"]
+        and secondary._client.models == ["gpt-4o-mini", "gpt-4o"]
+        and answers == ("gpt-4o-mini", "gpt-4o")
+    )
+    print_result(ok, "Secondary backend received its own model names",
+                 f"primary={primary._client.models}, secondary={secondary._client.models}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_routing_matrix,
+        test_backend_resolves_route_classes,
+        test_failover_uses_backend_model,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except AssertionError:
+            failed += 1
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
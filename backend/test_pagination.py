@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+会话列表 / 历史消息游标分页测试 - 使用临时 SQLite 文件
+
+逐页翻完的结果必须与一次性排序查询的结果完全一致 (包括时间戳相同的行)，不重复、不遗漏。
+
+运行: python test_pagination.py (或 python -m pytest test_pagination.py)
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.chat import get_messages, get_sessions
+from app.database import create_async_engines
+from app.models import ChatMessage, ChatSession
+from conftest import run_tests
+
+TOKEN = {"sub": "1"}
+BASE = datetime(2026, 10, 1, 12, 0, 0)
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+def seed(url: str) -> str:
+    """用户 1：11 个 casual 会话 + 1 个 professional 会话；会话 s00 有 23 条消息，每 4 条共用一个时间戳"""
+    with create_engine(url).begin() as conn:
+        conn.execute(insert(ChatSession), [
+            {"id": f"s{i:02d}", "user_id": 1, "title": f"session {i}", "mode": "casual",
+             "summary": "x" * 1000, "created_at": BASE, "updated_at": BASE + timedelta(minutes=i // 3)}
+            for i in range(11)
+        ] + [
+            {"id": "p00", "user_id": 1, "title": "pro", "mode": "professional", "summary": None, "created_at": BASE, "updated_at": BASE},
+            {"id": "o00", "user_id": 2, "title": "other user", "mode": "casual", "summary": None, "created_at": BASE, "updated_at": BASE},
+        ])
+        conn.execute(insert(ChatMessage), [
+            {"session_id": "s00", "role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}",
+             "created_at": BASE + timedelta(seconds=i // 4)}
+            for i in range(23)
+        ])
+    return url
+
+
+async def walk(fetch, limit: int) -> tuple:
+    """按 next_cursor 翻完全部页，返回 (页列表, 请求次数)"""
+    pages, cursor = [], None
+    while True:
+        page = await fetch(limit=limit, cursor=cursor)
+        pages.append(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages, len(pages)
+
+
+def test_session_pages(db_url):
+    """会话列表：最近活跃在前，逐页拼接等于完整列表，只返回列表需要的列"""
+    print_test_header("Session Keyset Pages")
+    url = seed(db_url)
+
+    async def run():
+        _, reader = create_async_engines(url)
+        try:
+            async with AsyncSession(reader) as db:
+                fetch = lambda limit, cursor: get_sessions(mode="casual", limit=limit, cursor=cursor, token=TOKEN, db=db)
+                pages, requests = await walk(fetch, 4)
+                everything = await fetch(limit=100, cursor=None)
+                return pages, requests, everything
+        finally:
+            await reader.dispose()
+
+    pages, requests, everything = asyncio.run(run())
+    walked = [s["id"] for page in pages for s in page]
+    expected = [f"s{i:02d}" for i in sorted(range(11), key=lambda i: (i // 3, f"s{i:02d}"), reverse=True)]
+    ok = (
+        walked == expected == [s["id"] for s in everything["items"]]
+        and requests == 3 and [len(p) for p in pages] == [4, 4, 3]
+        and everything["next_cursor"] is None
+        and set(everything["items"][0]) == {"id", "title", "mode", "created_at", "updated_at"}
+    )
+    print_result(ok, "Pages concatenate to the full ordered list", f"walked={walked}")
+    assert ok
+
+
+def test_message_pages(db_url):
+    """历史消息：第一页为最新消息，向前翻页；每页内时间正序"""
+    print_test_header("Message Keyset Pages")
+    url = seed(db_url)
+
+    async def run():
+        _, reader = create_async_engines(url)
+        try:
+            async with AsyncSession(reader) as db:
+                fetch = lambda limit, cursor: get_messages(session_id="s00", limit=limit, cursor=cursor, token=TOKEN, db=db)
+                return await walk(fetch, 5)
+        finally:
+            await reader.dispose()
+
+    pages, requests = asyncio.run(run())
+    # 页是从新到旧取的，反过来拼接得到完整的正序历史
+    history = [m["content"] for page in reversed(pages) for m in page]
+    ok = (
+        history == [f"m{i}" for i in range(23)]
+        and requests == 5 and [m["content"] for m in pages[0]] == ["m18", "m19", "m20", "m21", "m22"]
+    )
+    print_result(ok, "Pages cover the whole history once", f"first page={[m['content'] for m in pages[0]]}")
+    assert ok
+
+
+def test_page_boundaries(db_url):
+    """每种页大小都翻完：页边界落在同一时间戳的行中间时不重复不遗漏；最后一页恰好满页时不再多返回一个空页"""
+    print_test_header("Page Boundaries")
+    url = seed(db_url)
+
+    async def run():
+        _, reader = create_async_engines(url)
+        results = {}
+        try:
+            async with AsyncSession(reader) as db:
+                sessions = lambda limit, cursor: get_sessions(mode="casual", limit=limit, cursor=cursor, token=TOKEN, db=db)
+                messages = lambda limit, cursor: get_messages(session_id="s00", limit=limit, cursor=cursor, token=TOKEN, db=db)
+                for name, fetch, total in (("sessions", sessions, 11), ("messages", messages, 23)):
+                    for limit in range(1, total + 2):
+                        pages, _ = await walk(fetch, limit)
+                        results[(name, limit)] = pages
+        finally:
+            await reader.dispose()
+        return results
+
+    results = asyncio.run(run())
+    expected_sessions = [f"s{i:02d}" for i in sorted(range(11), key=lambda i: (i // 3, f"s{i:02d}"), reverse=True)]
+    wrong = []
+    for (name, limit), pages in results.items():
+        total = 11 if name == "sessions" else 23
+        if name == "sessions":
+            items = [s["id"] for page in pages for s in page]
+            expected = expected_sessions
+        else:
+            items = [m["content"] for page in reversed(pages) for m in page]
+            expected = [f"m{i}" for i in range(23)]
+        # 页数 = ceil(total / limit)，且只有最后一页可以不满
+        sizes = [len(page) for page in pages]
+        if items != expected or len(pages) != -(-total // limit) or any(size != limit for size in sizes[:-1]) \
+                or not 0 < sizes[-1] <= limit:
+            wrong.append((name, limit, sizes))
+    ok = not wrong
+    print_result(ok, f"{len(results)} page sizes walked without gaps or empty pages", f"wrong={wrong}" if wrong else "")
+    assert ok
+
+
+def test_invalid_cursor(db_url):
+    """无法解析或类型不符的游标返回 400"""
+    print_test_header("Invalid Cursor")
+    url = seed(db_url)
+
+    async def run():
+        _, reader = create_async_engines(url)
+        codes = []
+        try:
+            async with AsyncSession(reader) as db:
+                first = await get_sessions(mode="casual", limit=2, cursor=None, token=TOKEN, db=db)
+                for call in (
+                    get_sessions(mode="casual", limit=2, cursor="not-a-cursor", token=TOKEN, db=db),
+                    # 会话游标的 id 是字符串，不能用于消息分页
+                    get_messages(session_id="s00", limit=2, cursor=first["next_cursor"], token=TOKEN, db=db),
+                ):
+                    try:
+                        await call
+                        codes.append(200)
+                    except HTTPException as e:
+                        codes.append(e.status_code)
+        finally:
+            await reader.dispose()
+        return codes
+
+    codes = asyncio.run(run())
+    ok = codes == [400, 400]
+    print_result(ok, "Bad cursors rejected", f"codes={codes}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_session_pages,
+        test_message_pages,
+        test_page_boundaries,
+        test_invalid_cursor,
+    ]
+    sys.exit(1 if run_tests(tests) else 0)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+密码哈希进程池测试
+
+- 进程池中计算的哈希可以在主进程校验，反之亦然
+- 进行中的任务达到上限时立即拒绝 (HasherSaturated)，登录接口返回 503 + Retry-After
+- 工作进程崩溃后重建进程池重试一次，连续崩溃时返回 HasherSaturated
+- workers = 0 时在线程池中计算，不阻塞事件循环；inline (仅压测对比) 在事件循环线程中计算
+
+运行: python test_password_hasher.py (或 python -m pytest test_password_hasher.py)
+"""
+import asyncio
+import os
+import signal
+import sys
+import threading
+
+from fastapi import HTTPException
+
+from app.api import auth
+from app.services.password_hasher import (
+    HasherSaturated, PasswordHasher, hash_password, verify_password
+)
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+def test_pool_round_trip():
+    print_test_header("Hash / verify in the process pool")
+    hasher = PasswordHasher(workers=1, max_pending=4)
+
+    async def run():
+        hashed = await hasher.hash("secret")
+        return (
+            hashed,
+            await hasher.verify("secret", hashed),
+            await hasher.verify("wrong", hashed),
+            await hasher.verify("secret", hash_password("secret")),
+        )
+
+    hasher.start()
+    try:
+        hashed, ok, wrong, local = asyncio.run(run())
+    finally:
+        hasher.shutdown()
+    ok = ok and not wrong and local and verify_password("secret", hashed) and hasher.pending == 0
+    print_result(ok, "Pool hashes are interchangeable with in-process hashes", hashed[:30])
+    assert ok
+
+
+def test_saturation():
+    print_test_header("Queue limit rejects instead of queueing")
+    hasher = PasswordHasher(workers=1, max_pending=2)
+
+    async def run():
+        results = await asyncio.gather(*[hasher.hash("pw") for _ in range(5)], return_exceptions=True)
+        return [type(r).__name__ if isinstance(r, Exception) else "ok" for r in results]
+
+    hasher.start()
+    try:
+        outcomes = asyncio.run(run())
+    finally:
+        hasher.shutdown()
+    ok = outcomes == ["ok", "ok", "HasherSaturated", "HasherSaturated", "HasherSaturated"] and hasher.rejected == 3
+    print_result(ok, "Only max_pending hashes admitted", f"outcomes={outcomes}")
+    assert ok
+
+
+def test_saturated_login_returns_503():
+    print_test_header("Saturated hasher maps to 503")
+    original = auth.password_hasher
+
+    class Saturated:
+        async def verify(self, *args):
+            raise HasherSaturated(retry_after=2)
+
+    auth.password_hasher = Saturated()
+    try:
+        asyncio.run(auth.verify_password("pw", "hash"))
+        error = None
+    except HTTPException as e:
+        error = e
+    finally:
+        auth.password_hasher = original
+    ok = error is not None and error.status_code == 503 and error.headers == {"Retry-After": "2"}
+    print_result(ok, "503 with Retry-After", f"{error and error.status_code}")
+    assert ok
+
+
+def test_broken_pool_recovers():
+    print_test_header("Broken pool is recreated")
+    hasher = PasswordHasher(workers=1, max_pending=4)
+
+    async def run():
+        # 工作进程被外部杀掉 (如 OOM kill)：本次请求在重建的进程池中重试成功
+        await hasher.hash("warm-up")
+        os.kill(next(iter(hasher._executor._processes)), signal.SIGKILL)
+        await asyncio.sleep(0.2)
+        retried = await hasher.verify("pw", hash_password("pw"))
+        # os._exit 让工作进程直接退出：重建后的进程池同样崩溃，两次都失败后按繁忙处理
+        try:
+            await hasher._run(os._exit, 1)
+            crashed = None
+        except HasherSaturated:
+            crashed = "HasherSaturated"
+        hashed = await hasher.hash("pw")
+        return retried, crashed, hashed
+
+    hasher.start()
+    try:
+        retried, crashed, hashed = asyncio.run(run())
+    finally:
+        hasher.shutdown()
+    ok = retried and crashed == "HasherSaturated" and verify_password("pw", hashed) and hasher.pending == 0 and hasher.rejected == 1
+    print_result(ok, "Crash surfaced as HasherSaturated, next hash uses a fresh pool", f"crashed={crashed}")
+    assert ok
+
+
+def test_thread_and_inline():
+    print_test_header("workers = 0 hashes in a thread, inline on the loop")
+    threaded = PasswordHasher(workers=0)
+    inline = PasswordHasher(workers=2, inline=True)
+
+    async def run():
+        return (await threaded.hash("pw"), await threaded._run(threading.get_ident),
+                await inline._run(threading.get_ident))
+
+    hashed, thread_id, inline_id = asyncio.run(run())
+    ok = (
+        threaded._executor is None and inline._executor is None and verify_password("pw", hashed)
+        and thread_id != threading.get_ident() and inline_id == threading.get_ident()
+    )
+    print_result(ok, "No pool created; thread mode off the loop thread, inline mode on it")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_pool_round_trip,
+        test_saturation,
+        test_saturated_login_returns_503,
+        test_broken_pool_recovers,
+        test_thread_and_inline,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except AssertionError:
+            failed += 1
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
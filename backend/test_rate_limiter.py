@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+滑动窗口限流器测试 (模拟时钟)
+
+- 窗口内超过限额被拒绝，上一窗口的计数按剩余比例计入
+- 长时间未访问的键被淘汰
+- 携带有效 Token 时按用户限流，否则按 IP
+- Redis 后端：多个实例共享限额，Redis 不可用时降级为进程内限流
+
+Redis 测试默认使用进程内的 RESP 替身 (RedisStandIn，用 Python 实现与 Lua 脚本相同的计数)，
+设置 REDIS_TEST_URL 时改为连接真实 Redis 执行 Lua 脚本。
+
+运行: python test_rate_limiter.py (或 python -m pytest test_rate_limiter.py)
+"""
+import asyncio
+import hashlib
+import os
+import socket
+import socketserver
+import sys
+import threading
+import uuid
+
+from starlette.requests import Request
+
+from app.api.auth import create_access_token
+from app.middleware.rate_limit import SLIDING_WINDOW_LUA, RedisRateLimiter
+from app.middleware.simple_rate_limit import SimpleRateLimiter, rate_limit_key
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+class RedisStandIn:
+    """
+    最小的 RESP 服务端，支持 HELLO / SCRIPT LOAD / EVALSHA (仅限 SLIDING_WINDOW_LUA) / PING / CLIENT
+
+    EVALSHA 对未加载的脚本返回 NOSCRIPT，覆盖客户端先加载再执行的路径。
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.scripts = set()
+        self.evals = 0
+        standin = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    args = []
+                    for _ in range(int(line[1:])):
+                        length = int(self.rfile.readline()[1:])
+                        args.append(self.rfile.read(length + 2)[:-2].decode())
+                    self.wfile.write(standin.execute(args))
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"redis://127.0.0.1:{self.server.server_address[1]}/0"
+
+    def execute(self, args) -> bytes:
+        command = args[0].upper()
+        if command == "PING":
+            return b"+PONG\r\n"
+        if command == "CLIENT":
+            return b"+OK\r\n"
+        if command == "HELLO":
+            # 客户端连接时的协议握手，按 RESP3 回复服务端信息
+            return b"%3\r\n+server\r\n+redis\r\n+version\r\n+7.0.0\r\n+proto\r\n:3\r\n"
+        if command == "SCRIPT" and args[1].upper() == "LOAD":
+            sha = hashlib.sha1(args[2].encode()).hexdigest()
+            if args[2] == SLIDING_WINDOW_LUA:
+                self.scripts.add(sha)
+            return f"${len(sha)}\r\n{sha}\r\n".encode()
+        if command == "EVALSHA":
+            if args[1] not in self.scripts:
+                return b"-NOSCRIPT No matching script. Please use EVAL.\r\n"
+            self.evals += 1
+            current_key, previous_key, limit, window, weight = args[3:8]
+            current = self.counters.get(current_key, 0)
+            if self.counters.get(previous_key, 0) * float(weight) + current >= int(limit):
+                return b":0\r\n"
+            self.counters[current_key] = current + 1
+            return b":1\r\n"
+        return f"-ERR unknown command '{args[0]}'\r\n".encode()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def closed_port_url() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"redis://127.0.0.1:{s.getsockname()[1]}/0"
+
+
+def test_sliding_window():
+    print_test_header("Sliding window counts")
+    limiter = SimpleRateLimiter(rate_limit=10, time_window=60)
+    first = [limiter.is_allowed("a", 1.0 + i) for i in range(12)]
+    # 下一窗口过了一半：上一窗口的 10 次按 50% 计入，还能再放行 5 次
+    half = [limiter.is_allowed("a", 91.0) for _ in range(7)]
+    # 两个窗口以后计数清零
+    later = limiter.is_allowed("a", 400.0)
+    ok = first == [True] * 10 + [False] * 2 and half == [True] * 5 + [False] * 2 and later
+    print_result(ok, "Limit enforced with weighted previous window", f"half={half}")
+    assert ok
+
+
+def test_idle_keys_evicted():
+    print_test_header("Idle keys evicted")
+    limiter = SimpleRateLimiter(rate_limit=10, time_window=60)
+    for i in range(1000):
+        limiter.is_allowed(f"ip:{i}", 0.0)
+    limiter.is_allowed("ip:0", 100.0)
+    kept_mid = len(limiter.requests)
+    limiter.is_allowed("ip:new", 121.0)
+    ok = kept_mid == 1000 and set(limiter.requests) == {"ip:0", "ip:new"}
+    print_result(ok, "Keys idle for two windows dropped", f"kept={len(limiter.requests)}")
+    assert ok
+
+
+def make_request(authorization: str = None) -> Request:
+    headers = [(b"authorization", authorization.encode())] if authorization else []
+    return Request({"type": "http", "headers": headers, "client": ("10.0.0.1", 1234)})
+
+
+def test_key_by_user():
+    print_test_header("Key by user when authenticated")
+    token = create_access_token({"sub": "42"})
+    keys = [
+        rate_limit_key(make_request(f"Bearer {token}")),
+        rate_limit_key(make_request("Bearer not-a-jwt")),
+        rate_limit_key(make_request()),
+    ]
+    ok = keys == ["user:42", "ip:10.0.0.1", "ip:10.0.0.1"]
+    print_result(ok, "User id from token, IP otherwise", f"keys={keys}")
+    assert ok
+
+
+def test_redis_shared_limit():
+    print_test_header("Redis backend shares the limit across workers")
+    standin = None if os.environ.get("REDIS_TEST_URL") else RedisStandIn()
+    url = os.environ.get("REDIS_TEST_URL") or standin.url
+    prefix = f"ratelimit-test-{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        # 两个实例模拟两个 worker 进程
+        workers = [RedisRateLimiter(url, rate_limit=5, prefix=prefix) for _ in range(2)]
+        try:
+            results = [await workers[i % 2].allow("user:1") for i in range(8)]
+            other = await workers[1].allow("user:2")
+            degraded = any(w.degraded for w in workers)
+        finally:
+            for w in workers:
+                await w.close()
+        return results, other, degraded
+
+    try:
+        results, other, degraded = asyncio.run(run())
+    finally:
+        if standin:
+            standin.stop()
+    ok = results == [True] * 5 + [False] * 3 and other and not degraded
+    if standin:
+        ok = ok and standin.evals == 9
+    print_result(ok, "5 of 8 requests admitted across two instances", f"results={results}")
+    assert ok
+
+
+def test_redis_down_degrades():
+    print_test_header("Redis unavailable falls back to local limits")
+
+    async def run():
+        limiter = RedisRateLimiter(closed_port_url(), rate_limit=3)
+        try:
+            results = [await limiter.allow("user:1") for _ in range(5)]
+            return results, limiter.degraded
+        finally:
+            await limiter.close()
+
+    results, degraded = asyncio.run(run())
+    ok = results == [True] * 3 + [False] * 2 and degraded
+    print_result(ok, "Local limit enforced while Redis is down", f"results={results}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_sliding_window,
+        test_idle_keys_evicted,
+        test_key_by_user,
+        test_redis_shared_limit,
+        test_redis_down_degrades,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except AssertionError:
+            failed += 1
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+相同 LLM 请求合并 (single-flight) 测试 - 上游由可控的假流代替
+
+1. 同时到达的相同请求只调用一次上游，每个订阅者都收到完整结果
+2. 发起者中途断开时，上游名额由仍在进行的上游流持有，直到上游结束才归还调度器
+
+运行: python test_request_coalescer.py (或 python -m pytest test_request_coalescer.py)
+"""
+import asyncio
+import sys
+
+from app.config import settings
+from app.services.llm_scheduler import LLMScheduler
+from app.services.request_coalescer import RequestCoalescer
+
+MESSAGES = [{"role": "user", "content": "什么是梯度下降？"}]
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+class FakeUpstream:
+    """逐个放行片段的假上游：release() 一次放出一个片段"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.calls = 0
+        self.gate = asyncio.Semaphore(0)
+
+    def release(self, n: int = 1):
+        for _ in range(n):
+            self.gate.release()
+
+    async def __call__(self):
+        self.calls += 1
+        for chunk in self.chunks:
+            await self.gate.acquire()
+            yield chunk
+
+
+async def consume(stream) -> str:
+    return "".join([chunk async for chunk in stream])
+
+
+def test_fan_out():
+    """三个相同请求共享一次上游调用"""
+    print_test_header("Fan Out to Subscribers")
+
+    async def run():
+        coalescer = RequestCoalescer()
+        upstream = FakeUpstream(["梯度", "下降", "。"])
+        key = coalescer.make_key("professional", "m", MESSAGES)
+        tasks = [asyncio.create_task(consume(coalescer.stream(key, upstream))) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        upstream.release(3)
+        results = await asyncio.gather(*tasks)
+        return results, upstream.calls, (coalescer.hits, coalescer.misses)
+
+    results, calls, counts = asyncio.run(run())
+    ok = results == ["梯度下降。"] * 3 and calls == 1 and counts == (2, 1)
+    print_result(ok, "One upstream call, three full answers", f"calls={calls}, hits/misses={counts}")
+    assert ok
+
+
+def test_owner_disconnect_keeps_slot():
+    """发起者断开后上游流继续服务加入者，名额保持占用直到上游结束；命中缓存的请求立即归还名额"""
+    print_test_header("Owner Disconnect Keeps Slot")
+    saved = settings.LLM_MAX_CONCURRENCY, settings.LLM_COALESCE_CACHE_TTL
+    settings.LLM_MAX_CONCURRENCY, settings.LLM_COALESCE_CACHE_TTL = 2, 30
+
+    async def run():
+        scheduler = LLMScheduler()
+        coalescer = RequestCoalescer()
+        upstream = FakeUpstream(["a", "b", "c"])
+        key = coalescer.make_key("professional", "m", MESSAGES)
+
+        owner_slot = await scheduler.acquire("1")
+        owner = coalescer.stream(key, upstream, slot=owner_slot)
+        upstream.release()
+        first = await owner.__anext__()
+
+        joiner_slot = await scheduler.acquire("2")
+        joiner = asyncio.create_task(consume(coalescer.stream(key, upstream, slot=joiner_slot)))
+        await asyncio.sleep(0.01)
+        # 加入进行中的请求不占名额
+        after_join = scheduler._active
+
+        # 发起者断开：生成器关闭，chat.generate() 的 finally 仍会调用 release()
+        await owner.aclose()
+        owner_slot.release()
+        after_disconnect = scheduler._active
+
+        upstream.release(2)
+        joined = await joiner
+        await asyncio.sleep(0)
+        after_flight = scheduler._active
+
+        late_slot = await scheduler.acquire("3")
+        late = await consume(coalescer.stream(key, upstream, slot=late_slot))
+        return first, after_join, after_disconnect, joined, after_flight, late, scheduler._active, upstream.calls
+
+    try:
+        first, after_join, after_disconnect, joined, after_flight, late, after_cache, calls = asyncio.run(run())
+    finally:
+        settings.LLM_MAX_CONCURRENCY, settings.LLM_COALESCE_CACHE_TTL = saved
+    ok = (
+        first == "a" and joined == "abc" and late == "abc" and calls == 1
+        and (after_join, after_disconnect, after_flight, after_cache) == (1, 1, 0, 0)
+    )
+    print_result(ok, "Slot held by the flight until upstream finished",
+                 f"active after join/disconnect/flight/cache = {after_join, after_disconnect, after_flight, after_cache}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_fan_out,
+        test_owner_disconnect_keeps_slot,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except AssertionError:
+            failed += 1
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+请求耗时追踪测试
+
+- 同名阶段累加并记录次数；没有进行中的追踪时 record_span / trace_span 不做任何事
+- 中间件为 HTTP 响应加上 Server-Timing 头，包含接口和服务层记录的阶段
+- TRACE_LOG_ENABLED 时每个请求写一行 JSON 日志，低于 TRACE_LOG_MIN_MS 的请求不记录
+
+运行: python test_request_trace.py (或 python -m pytest test_request_trace.py)
+"""
+import asyncio
+import json
+import logging
+import sys
+
+import httpx
+from fastapi import FastAPI
+
+from app.config import settings
+from app.middleware.server_timing import ServerTimingMiddleware
+from app.services.request_trace import RequestTrace, current_trace, record_span, trace_span
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(ServerTimingMiddleware)
+
+    @app.get("/slow")
+    async def slow():
+        with trace_span("history"):
+            await asyncio.sleep(0.02)
+        record_span("db", 0.004)
+        record_span("db", 0.006)
+        return {"ok": True}
+
+    return app
+
+
+async def request(app: FastAPI, path: str) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.get(path)
+
+
+class CapturingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+
+def test_trace_aggregation():
+    print_test_header("Stages accumulate; no-op without a trace")
+    record_span("db", 1.0)
+    with trace_span("history"):
+        pass
+    outside = current_trace.get()
+
+    with RequestTrace("unit", session_id="s1") as trace:
+        record_span("tts", 0.1)
+        record_span("tts", 0.2)
+        with trace_span("history"):
+            pass
+    data = trace.to_dict()
+    header = trace.server_timing()
+    print(header)
+    success = (outside is None and current_trace.get() is None
+               and data["stages"]["tts"] == 300.0 and data["counts"] == {"tts": 2}
+               and data["session_id"] == "s1" and list(data["stages"]) == ["tts", "history"]
+               and header.startswith("tts;dur=300.0, history;dur=") and ", total;dur=" in header)
+    print_result(success, "tts summed over two calls, ordered by first use", json.dumps(data))
+    assert success
+
+
+def test_server_timing_header():
+    print_test_header("Server-Timing header")
+    app = build_app()
+    response = asyncio.run(request(app, "/slow"))
+    header = response.headers.get("server-timing", "")
+    stages = dict(part.split(";dur=") for part in header.split(", "))
+    success = (response.status_code == 200
+               and float(stages["history"]) >= 20 and float(stages["db"]) == 10.0
+               and float(stages["total"]) >= float(stages["history"])
+               and response.headers.get("timing-allow-origin") == "*")
+
+    settings.SERVER_TIMING_ENABLED = False
+    try:
+        disabled = asyncio.run(request(app, "/slow"))
+    finally:
+        settings.SERVER_TIMING_ENABLED = True
+    success = success and "server-timing" not in disabled.headers
+    print_result(success, "stages from the endpoint in the header, omitted when disabled", header)
+    assert success
+
+
+def test_trace_log():
+    print_test_header("JSON trace log")
+    handler = CapturingHandler()
+    trace_logger = logging.getLogger("app.trace")
+    trace_logger.addHandler(handler)
+    trace_logger.setLevel(logging.INFO)
+    saved = settings.TRACE_LOG_ENABLED, settings.TRACE_LOG_MIN_MS
+    app = build_app()
+    try:
+        settings.TRACE_LOG_ENABLED, settings.TRACE_LOG_MIN_MS = True, 0
+        asyncio.run(request(app, "/slow"))
+        settings.TRACE_LOG_MIN_MS = 10000
+        asyncio.run(request(app, "/slow"))
+    finally:
+        settings.TRACE_LOG_ENABLED, settings.TRACE_LOG_MIN_MS = saved
+        trace_logger.removeHandler(handler)
+    entries = [json.loads(message) for message in handler.records]
+    success = (len(entries) == 1 and entries[0]["trace"] == "GET /slow"
+               and entries[0]["counts"] == {"db": 2} and entries[0]["total_ms"] >= 20)
+    print_result(success, "one log line, fast request below threshold skipped", handler.records)
+    assert success
+
+
+if __name__ == "__main__":
+    tests = [
+        test_trace_aggregation,
+        test_server_timing_header,
+        test_trace_log,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except AssertionError:
+            failed += 1
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
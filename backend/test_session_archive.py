@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+冷数据归档测试 - 使用临时 SQLite 文件
+
+- 只归档超过期限未活跃的会话，压缩后的 payload 比原文小
+- 归档前后 /api/messages 的分页结果完全一致
+- 归档会话的消息仍能被全文搜索和学习分析读到
+- 恢复 (脚本 / 继续对话) 后消息 ID 不变；删除归档会话时提问数正确扣减
+
+运行: python test_session_archive.py (或 python -m pytest test_session_archive.py)
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from app.api.chat import delete_session, get_messages
+from app.database import create_async_engines
+from app.models import ChatArchive, ChatMessage, ChatSession, User, UserStats
+from app.services import analysis_jobs
+from app.services.message_search import search_messages
+from app.services.session_archiver import (
+    archive_inactive_sessions, archived_messages, rehydrate_session, restore_session
+)
+from app.services.user_stats import rebuild_user_stats
+from conftest import run_tests
+
+TOKEN = {"sub": "1"}
+OLD = datetime.utcnow() - timedelta(days=120)
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+def seed(url: str) -> str:
+    """用户 1：120 天前的会话 old (30 条消息，每 4 条共用时间戳) 和今天的会话 new"""
+    with create_engine(url).begin() as conn:
+        conn.execute(insert(User), {"id": 1, "username": "u1", "email": "u1@example.com"})
+        conn.execute(insert(ChatSession), [
+            {"id": "old", "user_id": 1, "title": "old", "mode": "casual", "created_at": OLD, "updated_at": OLD},
+            {"id": "new", "user_id": 1, "title": "new", "mode": "casual",
+             "created_at": datetime.utcnow(), "updated_at": datetime.utcnow()},
+        ])
+        conn.execute(insert(ChatMessage), [
+            {"session_id": "old", "role": "user" if i % 2 == 0 else "assistant", "tokens": i,
+             "content": f"第 {i} 条消息：梯度下降的学习率应该怎么选？" * 3,
+             "created_at": OLD + timedelta(seconds=i // 4)}
+            for i in range(30)
+        ] + [{"session_id": "new", "role": "user", "tokens": 0, "content": "hello", "created_at": datetime.utcnow()}])
+    db = sessionmaker(bind=create_engine(url))()
+    try:
+        rebuild_user_stats(db)
+    finally:
+        db.close()
+    return url
+
+
+async def all_pages(url: str, session_id: str, limit: int = 7) -> list:
+    """按 next_cursor 翻完全部页，返回每页的消息"""
+    _, reader = create_async_engines(url)
+    pages, cursor = [], None
+    try:
+        async with AsyncSession(reader) as db:
+            while True:
+                page = await get_messages(session_id=session_id, limit=limit, cursor=cursor, token=TOKEN, db=db)
+                pages.append(page["items"])
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    return pages
+    finally:
+        await reader.dispose()
+
+
+def message_rows(url: str, session_id: str) -> list:
+    with create_engine(url).connect() as conn:
+        return [tuple(r) for r in conn.execute(select(
+            ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.tokens, ChatMessage.created_at
+        ).filter(ChatMessage.session_id == session_id).order_by(ChatMessage.id))]
+
+
+async def archived_rows(url: str) -> list:
+    """解压归档中的消息 (id, role, content, tokens, created_at)"""
+    _, reader = create_async_engines(url)
+    try:
+        async with AsyncSession(reader) as db:
+            return [(m["id"], m["role"], m["content"], None, m["created_at"])
+                    for m in await archived_messages(db, "old")]
+    finally:
+        await reader.dispose()
+
+
+def archive(url: str) -> dict:
+    db = sessionmaker(bind=create_engine(url))()
+    try:
+        return archive_inactive_sessions(db, days=90)
+    finally:
+        db.close()
+
+
+def test_archive_and_transparent_reads(db_url):
+    """只归档旧会话；归档前后分页读取结果相同"""
+    print_test_header("Archive and Transparent Reads")
+    url = seed(db_url)
+    before = asyncio.run(all_pages(url, "old"))
+    report = archive(url)
+    after = asyncio.run(all_pages(url, "old"))
+    with create_engine(url).connect() as conn:
+        archived = conn.execute(select(ChatSession.id).filter(ChatSession.archived_at.isnot(None))).scalars().all()
+    ok = (
+        report["sessions"] == 1 and report["messages"] == 30
+        and report["compressed_bytes"] < report["raw_bytes"] / 2
+        and archived == ["old"]
+        and message_rows(url, "old") == [] and len(message_rows(url, "new")) == 1
+        and after == before and len(before) == 5
+    )
+    print_result(ok, "Old session archived, pages unchanged",
+                 f"report={ {k: v for k, v in report.items() if k != 'seconds'} }, pages={len(after)}")
+    assert ok
+
+
+def test_archived_messages_searchable(db_url):
+    """归档后的消息仍能被搜索到 (排在 chat_messages 的结果之后)，也仍会进入学习分析的提问列表"""
+    print_test_header("Archived Messages Searchable")
+    url = seed(db_url)
+    archive(url)
+    with create_engine(url).begin() as conn:
+        conn.execute(insert(ChatMessage), {"session_id": "new", "role": "user", "tokens": 0,
+                                           "content": "学习率太大会怎样？", "created_at": datetime.utcnow()})
+
+    async def run():
+        _, reader = create_async_engines(url)
+        saved = analysis_jobs.AsyncReadSessionLocal
+        analysis_jobs.AsyncReadSessionLocal = async_sessionmaker(reader, expire_on_commit=False)
+        try:
+            async with AsyncSession(reader) as db:
+                pages, offset = [], 0
+                while offset is not None:
+                    items, has_more = await search_messages(db, 1, "学习率", limit=4, offset=offset)
+                    pages.append(items)
+                    offset = offset + 4 if has_more else None
+                single = await search_messages(db, 1, "27", limit=20)
+            prompt = await analysis_jobs._build_prompt(1)
+        finally:
+            analysis_jobs.AsyncReadSessionLocal = saved
+            await reader.dispose()
+        return pages, single, prompt
+
+    pages, single, prompt = asyncio.run(run())
+    hits = [item for page in pages for item in page]
+    archived_ids = [row[0] for row in sorted(
+        ((m[0], m[4]) for m in asyncio.run(archived_rows(url))), key=lambda r: (r[1], r[0]), reverse=True
+    )]
+    ok = (
+        hits[0]["session_id"] == "new"
+        and [h["message_id"] for h in hits[1:]] == archived_ids and len(archived_ids) == 30
+        and [len(p) for p in pages] == [4] * 7 + [3]
+        and [(h["session_id"], h["session_title"], h["role"]) for h in single[0]] == [("old", "old", "assistant")] and not single[1]
+        and "学习率太大会怎样？" in prompt and "第 28 条消息" in prompt and "第 29 条消息" not in prompt
+    )
+    print_result(ok, "Archived session found by search and analysis",
+                 f"hits={len(hits)}, pages={[len(p) for p in pages]}")
+    assert ok
+
+
+def test_restore_keeps_ids(db_url):
+    """脚本恢复与继续对话时的恢复都保留原消息 ID 和内容"""
+    print_test_header("Restore Keeps Message IDs")
+    url = seed(db_url)
+    original = message_rows(url, "old")
+
+    archive(url)
+    db = sessionmaker(bind=create_engine(url))()
+    try:
+        restored = restore_session(db, "old")
+    finally:
+        db.close()
+    via_script = message_rows(url, "old")
+
+    archive(url)
+
+    async def rehydrate():
+        writer, _ = create_async_engines(url)
+        try:
+            async with AsyncSession(writer) as db:
+                await rehydrate_session(db, "old")
+                await db.commit()
+        finally:
+            await writer.dispose()
+
+    asyncio.run(rehydrate())
+    via_chat = message_rows(url, "old")
+    with create_engine(url).connect() as conn:
+        leftovers = conn.execute(select(func.count()).select_from(ChatArchive)).scalar()
+        archived_at = conn.execute(select(ChatSession.archived_at).filter(ChatSession.id == "old")).scalar()
+    ok = restored == 30 and via_script == original == via_chat and leftovers == 0 and archived_at is None
+    print_result(ok, "Messages restored with original ids", f"restored={restored}, archives left={leftovers}")
+    assert ok
+
+
+def test_delete_archived_session_stats(db_url):
+    """删除已归档会话时按归档行上的提问数扣减，与重算结果一致"""
+    print_test_header("Delete Archived Session Stats")
+    url = seed(db_url)
+    archive(url)
+
+    async def delete():
+        writer, _ = create_async_engines(url)
+        try:
+            async with AsyncSession(writer) as db:
+                await delete_session(session_id="old", token=TOKEN, db=db)
+        finally:
+            await writer.dispose()
+
+    asyncio.run(delete())
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        incremental = conn.execute(select(UserStats.question_count)).scalar()
+    db = sessionmaker(bind=engine)()
+    try:
+        rebuild_user_stats(db)
+    finally:
+        db.close()
+    with engine.connect() as conn:
+        rebuilt = conn.execute(select(UserStats.question_count)).scalar()
+    ok = incremental == rebuilt == 1
+    print_result(ok, "Question count matches rebuild", f"incremental={incremental}, rebuilt={rebuilt}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_archive_and_transparent_reads,
+        test_archived_messages_searchable,
+        test_restore_keeps_ids,
+        test_delete_archived_session_stats,
+    ]
+    sys.exit(1 if run_tests(tests) else 0)
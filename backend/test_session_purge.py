@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+会话软删除与后台清理测试 - 使用临时 SQLite 文件
+
+- 删除会话立即返回，会话和消息随即对用户不可见
+- 清理任务分批删除消息，最后删除会话行 (FTS 索引由触发器同步)
+- 一次性脚本清理早期遗留的孤儿消息并报告行数和字节数
+
+运行: python test_session_purge.py (或 python -m pytest test_session_purge.py)
+"""
+import asyncio
+import sys
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from app.api.chat import delete_session, get_messages, get_sessions
+from app.database import create_async_engines
+from app.models import ChatMessage, ChatSession, User
+from app.services.message_search import search_messages
+from app.services.session_purger import SessionPurger, sweep_orphan_messages
+from conftest import run_tests
+
+TOKEN = {"sub": "1"}
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+def seed(url: str) -> str:
+    """用户 1 的会话 s1 (12 条消息) 与 s2 (2 条消息)"""
+    with create_engine(url).begin() as conn:
+        conn.execute(insert(User), {"id": 1, "username": "u1", "email": "u1@example.com"})
+        conn.execute(insert(ChatSession), [
+            {"id": "s1", "user_id": 1, "title": "to delete", "mode": "casual"},
+            {"id": "s2", "user_id": 1, "title": "keep", "mode": "casual"},
+        ])
+        conn.execute(insert(ChatMessage), [
+            {"session_id": "s1", "role": "user" if i % 2 == 0 else "assistant", "content": f"机器学习问题 {i}"}
+            for i in range(12)
+        ] + [
+            {"session_id": "s2", "role": "user", "content": "机器学习保留"},
+            {"session_id": "s2", "role": "assistant", "content": "好的"},
+        ])
+    return url
+
+
+def message_counts(url: str) -> dict:
+    with create_engine(url).connect() as conn:
+        return dict(conn.execute(select(ChatMessage.session_id, func.count()).group_by(ChatMessage.session_id)).all())
+
+
+def test_delete_hides_then_purges(db_url):
+    """删除后立即不可见；清理任务按批删除消息并删除会话行"""
+    print_test_header("Soft Delete and Purge")
+    url = seed(db_url)
+
+    async def run():
+        writer, reader = create_async_engines(url)
+        purger = SessionPurger(async_sessionmaker(writer), batch_size=5)
+        try:
+            async with AsyncSession(writer) as db:
+                await delete_session(session_id="s1", token=TOKEN, db=db)
+                try:
+                    await delete_session(session_id="s1", token=TOKEN, db=db)
+                    second = 200
+                except HTTPException as e:
+                    second = e.status_code
+            pending = message_counts(url)
+            async with AsyncSession(reader) as db:
+                sessions = await get_sessions(mode="casual", limit=None, cursor=None, token=TOKEN, db=db)
+                messages = await get_messages(session_id="s1", limit=None, cursor=None, token=TOKEN, db=db)
+                hits, _ = await search_messages(db, 1, "机器学习", 20)
+            batches = await purger.purge_pending()
+            return second, pending, sessions, messages, hits, batches, purger
+        finally:
+            await writer.dispose()
+            await reader.dispose()
+
+    second, pending, sessions, messages, hits, batches, purger = asyncio.run(run())
+    with create_engine(url).begin() as conn:
+        remaining_sessions = [row[0] for row in conn.execute(select(ChatSession.id))]
+        conn.execute(text("INSERT INTO chat_messages_fts(chat_messages_fts, rank) VALUES ('integrity-check', 0)"))
+    ok = (
+        second == 404
+        and pending == {"s1": 12, "s2": 2}
+        and [s["id"] for s in sessions["items"]] == ["s2"]
+        and messages["items"] == []
+        and [h["session_id"] for h in hits] == ["s2"]
+        # 12 条消息分 3 批，再加删除会话行的一批
+        and batches == 4
+        and message_counts(url) == {"s2": 2}
+        and remaining_sessions == ["s2"]
+        and (purger.sessions, purger.messages) == (1, 12)
+        and purger.bytes == sum(len(f"机器学习问题 {i}".encode()) for i in range(12))
+    )
+    print_result(ok, "Deleted session hidden immediately and purged in batches",
+                 f"batches={batches}, purged=({purger.sessions}, {purger.messages}, {purger.bytes})")
+    assert ok
+
+
+def test_sweep_orphans(db_url):
+    """孤儿消息清理：dry-run 只报告，正式运行后只剩有会话的消息"""
+    print_test_header("Sweep Orphan Messages")
+    url = seed(db_url)
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(insert(ChatMessage), [
+            {"session_id": f"gone{i % 3}", "role": "user", "content": "x" * 100} for i in range(7)
+        ])
+    db = sessionmaker(bind=engine)()
+    try:
+        dry = sweep_orphan_messages(db, batch_size=3, dry_run=True)
+        after_dry = sum(message_counts(url).values())
+        report = sweep_orphan_messages(db, batch_size=3)
+    finally:
+        db.close()
+    ok = (
+        dry == report == {"messages": 7, "bytes": 700}
+        and after_dry == 21
+        and message_counts(url) == {"s1": 12, "s2": 2}
+    )
+    print_result(ok, "Orphans reported and removed", f"report={report}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_delete_hides_then_purges,
+        test_sweep_orphans,
+    ]
+    sys.exit(1 if run_tests(tests) else 0)
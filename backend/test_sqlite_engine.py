@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+SQLite 引擎配置测试 - 使用临时 SQLite 文件
+
+1. 写连接：WAL、synchronous、busy_timeout、cache_size、mmap_size 按配置设置
+2. 读连接池只读 (query_only)，误路由的写入直接报错
+3. 写引擎只有一个连接：并发写入在进程内排队，不会出现 database is locked；
+   写事务未提交时读连接池照常读取 (WAL 下读写互不阻塞)
+4. 内存库 / profile=False 读写共用一个引擎
+
+运行: python test_sqlite_engine.py (或 python -m pytest test_sqlite_engine.py)
+"""
+import asyncio
+import sys
+
+from sqlalchemy import insert, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import create_async_engines
+from app.models import LearningRecord
+from conftest import run_tests
+
+PRAGMAS = ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size", "query_only")
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+async def read_pragmas(engine) -> dict:
+    async with engine.connect() as conn:
+        return {name: (await conn.execute(text(f"PRAGMA {name}"))).scalar() for name in PRAGMAS}
+
+
+def test_connection_pragmas(db_url):
+    """写连接与读连接的 PRAGMA 与配置一致，读连接额外为 query_only"""
+    print_test_header("Connection Pragmas")
+
+    async def run():
+        writer, reader = create_async_engines(db_url)
+        try:
+            writer_pragmas, reader_pragmas = await read_pragmas(writer), await read_pragmas(reader)
+            try:
+                async with reader.begin() as conn:
+                    await conn.execute(insert(LearningRecord), {"user_id": 1, "event_type": "quiz_completed"})
+                rejected = False
+            except OperationalError as e:
+                rejected = "readonly" in str(e).lower()
+        finally:
+            await writer.dispose()
+            await reader.dispose()
+        return writer_pragmas, reader_pragmas, rejected
+
+    writer_pragmas, reader_pragmas, rejected = asyncio.run(run())
+    expected = {
+        "journal_mode": "wal",
+        "synchronous": 1,  # NORMAL
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "cache_size": -settings.SQLITE_CACHE_SIZE_KB,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+    }
+    ok = (
+        settings.SQLITE_SYNCHRONOUS == "NORMAL"
+        and writer_pragmas == {**expected, "query_only": 0}
+        and reader_pragmas == {**expected, "query_only": 1}
+        and rejected
+    )
+    print_result(ok, "Writer and reader pragmas applied", f"writer={writer_pragmas}, reader={reader_pragmas}")
+    assert ok
+
+
+def test_single_writer_and_concurrent_reads(db_url):
+    """20 个并发写事务全部成功；写事务持有写锁期间读连接池仍可读取已提交的数据"""
+    print_test_header("Single Writer, Concurrent Reads")
+
+    async def run():
+        writer, reader = create_async_engines(db_url)
+        try:
+            async def write(i):
+                async with AsyncSession(writer) as db:
+                    db.add(LearningRecord(user_id=1, event_type="quiz_completed", score=i))
+                    await asyncio.sleep(0.005)
+                    await db.commit()
+
+            await asyncio.gather(*[write(i) for i in range(20)])
+            pool_size = writer.sync_engine.pool.size()
+
+            async with writer.connect() as held:
+                await held.execute(text("BEGIN IMMEDIATE"))
+                await held.execute(insert(LearningRecord), {"user_id": 1, "event_type": "uncommitted"})
+                async with AsyncSession(reader) as db:
+                    during_write = await asyncio.wait_for(
+                        db.scalar(select(LearningRecord.id).filter(LearningRecord.user_id == 1).order_by(
+                            LearningRecord.id.desc()).limit(1)),
+                        timeout=1
+                    )
+                await held.rollback()
+        finally:
+            await writer.dispose()
+            await reader.dispose()
+        return pool_size, during_write
+
+    pool_size, during_write = asyncio.run(run())
+    ok = pool_size == 1 and during_write == 20
+    print_result(ok, "Writes serialized, reads not blocked by an open write", f"last committed id={during_write}")
+    assert ok
+
+
+def test_shared_engine_fallbacks(db_url):
+    """内存库和 profile=False 不拆分读写引擎"""
+    print_test_header("Shared Engine Fallbacks")
+
+    async def run():
+        pairs = [create_async_engines("sqlite://"), create_async_engines(db_url, profile=False)]
+        try:
+            return [writer is reader for writer, reader in pairs]
+        finally:
+            for writer, _ in pairs:
+                await writer.dispose()
+
+    shared = asyncio.run(run())
+    ok = shared == [True, True]
+    print_result(ok, "Memory and unprofiled engines shared", f"shared={shared}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_connection_pragmas,
+        test_single_writer_and_concurrent_reads,
+        test_shared_engine_fallbacks,
+    ]
+    sys.exit(1 if run_tests(tests) else 0)
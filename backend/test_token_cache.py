@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+已校验 JWT 缓存测试
+
+- 同一 token 第二次校验命中缓存，不再调用 jwt.decode
+- 缓存项在 exp 到期后失效，过期 token 被拒绝
+- 超出容量时淘汰最久未使用的项
+- 同步大量吊销记录时不重复扫描吊销列表；max_size=0 时不缓存
+- 登出 (吊销) 后 token 被拒绝，verify_token 返回 401
+- 吊销记录写入数据库，其他 worker 同步后同样拒绝该 token
+
+运行: python test_token_cache.py (或 python -m pytest test_token_cache.py)
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import JWTError
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api.auth import create_access_token, logout
+from app.middleware import auth as auth_middleware
+from app.services import token_cache as token_cache_module
+from app.database import create_async_engines
+from app.models import RevokedToken
+from app.services.token_cache import RevocationSync, TokenCache
+from conftest import run_tests
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+def test_cache_hit_skips_decode():
+    print_test_header("Repeat requests skip jwt.decode")
+    cache = TokenCache(max_size=10)
+    token = create_access_token({"sub": "1"})
+    calls = []
+    original = token_cache_module.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(1)
+        return original(*args, **kwargs)
+
+    token_cache_module.jwt.decode = counting_decode
+    try:
+        payloads = [cache.decode(token) for _ in range(5)]
+        # 调用方修改返回值不影响缓存
+        payloads[0]["sub"] = "2"
+        again = cache.decode(token)
+    finally:
+        token_cache_module.jwt.decode = original
+    ok = len(calls) == 1 and cache.hits == 5 and cache.misses == 1 and again["sub"] == "1"
+    print_result(ok, "One decode for six lookups", f"decode calls={len(calls)}, hits={cache.hits}")
+    assert ok
+
+
+def test_expiry_respected():
+    print_test_header("Cached tokens expire with their exp claim")
+    cache = TokenCache(max_size=10)
+    token = create_access_token({"sub": "1"}, expires_delta=timedelta(seconds=1))
+    first = cache.decode(token)["sub"]
+    # jose 按整秒比较 exp，需越过到期的那一秒
+    time.sleep(2.1)
+    try:
+        cache.decode(token)
+        expired = False
+    except JWTError:
+        expired = True
+    ok = first == "1" and expired and len(cache._cache) == 0
+    print_result(ok, "Expired token rejected after being cached")
+    assert ok
+
+
+def test_lru_eviction():
+    print_test_header("LRU eviction")
+    cache = TokenCache(max_size=2)
+    a, b, c = (create_access_token({"sub": str(i)}) for i in range(3))
+    cache.decode(a)
+    cache.decode(b)
+    cache.decode(a)  # a 最近使用，b 成为最久未使用
+    cache.decode(c)
+    keys = set(cache._cache)
+    ok = keys == {cache.digest(a), cache.digest(c)}
+    print_result(ok, "Least recently used token evicted", f"size={len(keys)}")
+    assert ok
+
+
+def test_large_revocation_sync():
+    print_test_header("Syncing many revocations stays linear")
+    cache = TokenCache(max_size=0)
+    now = time.time()
+    rows = [(f"{i:064x}", now + 60 + i) for i in range(20000)]
+    started = time.perf_counter()
+    # 每个同步周期都会重复拉到同一批记录
+    for _ in range(2):
+        for key, exp in rows:
+            cache.add_revoked(key, exp)
+    elapsed = time.perf_counter() - started
+
+    cache.add_revoked("a" * 64, now + 0.5)
+    time.sleep(0.6)
+    cache.add_revoked("b" * 64, now + 60)
+    token = create_access_token({"sub": "1"})
+    cache.decode(token)
+    ok = (
+        elapsed < 1 and len(cache._revoked) == 20001 and len(cache._revoked_expiry) == 20001
+        and "a" * 64 not in cache._revoked
+        # max_size=0 表示不缓存
+        and len(cache._cache) == 0 and cache.misses == 1
+    )
+    print_result(ok, "40k revocation inserts without rescanning the list", f"elapsed={elapsed * 1000:.0f}ms")
+    assert ok
+
+
+async def logout_with(url: str, credentials: HTTPAuthorizationCredentials) -> dict:
+    writer, _ = create_async_engines(url)
+    try:
+        async with AsyncSession(writer) as db:
+            return await logout(credentials, db=db)
+    finally:
+        await writer.dispose()
+
+
+def test_logout_revokes(db_url):
+    print_test_header("Logout revokes the token")
+    token = create_access_token({"sub": "7"})
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    before = asyncio.run(auth_middleware.verify_token(credentials))["sub"]
+    result = asyncio.run(logout_with(db_url, credentials))
+    try:
+        asyncio.run(auth_middleware.verify_token(credentials))
+        status_code = None
+    except HTTPException as e:
+        status_code = e.status_code
+    other = asyncio.run(auth_middleware.verify_token(HTTPAuthorizationCredentials(
+        scheme="Bearer", credentials=create_access_token({"sub": "8"})
+    )))["sub"]
+    ok = before == "7" and result == {"status": "success"} and status_code == 401 and other == "8"
+    print_result(ok, "Revoked token gets 401, other tokens unaffected", f"status={status_code}")
+    assert ok
+
+
+def test_revocation_reaches_other_workers(db_url):
+    print_test_header("Revocation shared through the database")
+    token = create_access_token({"sub": "9"})
+    expired = create_access_token({"sub": "10"}, expires_delta=timedelta(seconds=-10))
+    # 另一个 worker：独立的缓存和吊销列表，只通过数据库同步
+    worker = TokenCache(max_size=10)
+
+    async def run():
+        _, reader = create_async_engines(db_url)
+        sync = RevocationSync(worker, session_factory=async_sessionmaker(reader, expire_on_commit=False))
+        try:
+            cached = worker.decode(token)["sub"]
+            await logout_with(db_url, HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+            before_sync = worker.decode(token)["sub"]
+            pulled = await sync.pull()
+        finally:
+            await reader.dispose()
+        return cached, before_sync, pulled
+
+    # 已过期 token 的吊销记录在下一次登出时被清理
+    with create_engine(db_url).begin() as conn:
+        conn.execute(insert(RevokedToken), {"digest": worker.digest(expired), "expires_at": datetime(2020, 1, 1)})
+    cached, before_sync, pulled = asyncio.run(run())
+    try:
+        worker.decode(token)
+        rejected = False
+    except JWTError:
+        rejected = True
+    with create_engine(db_url).connect() as conn:
+        rows = conn.execute(select(RevokedToken.digest)).scalars().all()
+    ok = (
+        cached == before_sync == "9" and pulled == 1 and rejected
+        and rows == [worker.digest(token)] and len(worker._cache) == 0
+    )
+    print_result(ok, "Other worker rejects the token after one sync", f"pulled={pulled}, rows={len(rows)}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_cache_hit_skips_decode,
+        test_expiry_respected,
+        test_lru_eviction,
+        test_large_revocation_sync,
+        test_logout_revokes,
+        test_revocation_reaches_other_workers,
+    ]
+    sys.exit(1 if run_tests(tests) else 0)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Token / TTS 用量配额测试 - 使用临时 SQLite 文件
+
+- 记账只写内存，检查时计入尚未落库的增量；达到限额时拒绝 (接口返回 429)
+- 写入数据库进行中时重新加载快照，正在写入的用量只计一次
+- flush 后另一个账本实例 (模拟另一个 worker) 能看到已落库的用量
+- 滚动窗口：小时窗口按比例计入上一小时，天窗口只统计最近 24 小时
+- 优先使用上游返回的 usage，没有时按字符数估算
+
+运行: python test_usage_quota.py (或 python -m pytest test_usage_quota.py)
+"""
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import settings
+from app.database import create_async_engines
+from app.models import UsageHourly
+from app.services import usage_quota
+from app.services.usage_quota import (
+    QuotaExceeded, UsageLedger, TOKENS, TTS_CHARS, enforce_quota, estimate_tokens, hour_bucket, usage_tokens
+)
+from conftest import run_tests
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+def test_charge_check_and_flush(db_url):
+    """内存记账立即生效；flush 后其他实例也能看到"""
+    print_test_header("Charge, Check and Flush")
+    saved = settings.QUOTA_TOKENS_PER_HOUR, settings.QUOTA_TTS_CHARS_PER_HOUR
+    settings.QUOTA_TOKENS_PER_HOUR, settings.QUOTA_TTS_CHARS_PER_HOUR = 1000, 100
+
+    async def run():
+        writer, reader = create_async_engines(db_url)
+        factories = async_sessionmaker(writer), async_sessionmaker(reader)
+        worker_a, worker_b = UsageLedger(*factories), UsageLedger(*factories)
+        try:
+            await worker_a.check(1, TOKENS)
+            worker_a.charge(1, tokens=600)
+            worker_a.charge(1, tokens=500, tts_chars=40)
+            try:
+                await worker_a.check(1, TOKENS)
+                rejected = None
+            except QuotaExceeded as e:
+                rejected = e
+            # TTS 按本次字符数预先检查：40 + 60 不超过 100，40 + 61 超过
+            await worker_a.check(1, TTS_CHARS, cost=60)
+            try:
+                await worker_a.check(1, TTS_CHARS, cost=61)
+                tts_rejected = False
+            except QuotaExceeded:
+                tts_rejected = True
+            before_flush = await worker_b.usage(1)
+            written = await worker_a.flush()
+            # worker_b 的快照在 QUOTA_FLUSH_INTERVAL 内有效，丢弃后重新加载
+            worker_b._snapshots.clear()
+            after_flush = await worker_b.usage(1)
+            other_user = await worker_b.usage(2)
+            return rejected, tts_rejected, before_flush, written, after_flush, other_user
+        finally:
+            await writer.dispose()
+            await reader.dispose()
+
+    try:
+        rejected, tts_rejected, before_flush, written, after_flush, other_user = asyncio.run(run())
+    finally:
+        settings.QUOTA_TOKENS_PER_HOUR, settings.QUOTA_TTS_CHARS_PER_HOUR = saved
+    with create_engine(db_url).connect() as conn:
+        rows = conn.execute(select(UsageHourly.user_id, UsageHourly.tokens, UsageHourly.tts_chars)).all()
+    ok = (
+        rejected is not None and rejected.window == "hour" and rejected.used == 1100 and rejected.retry_after >= 1
+        and tts_rejected
+        and before_flush[TOKENS]["hour"] == 0
+        and written == 1 and rows == [(1, 1100, 40)]
+        and after_flush[TOKENS] == {"hour": 1100, "day": 1100} and after_flush[TTS_CHARS]["hour"] == 40
+        and other_user[TOKENS]["hour"] == 0
+    )
+    print_result(ok, "Over-quota rejected, flushed usage shared", f"rows={rows}, after={after_flush}")
+    assert ok
+
+
+def test_limit_boundary_and_inflight_flush(db_url):
+    """用量恰好等于限额时预检查拒绝；写入进行中重新加载快照时，这批用量不会被重复计算"""
+    print_test_header("Limit Boundary and In-Flight Flush")
+    saved = settings.QUOTA_TOKENS_PER_HOUR
+    settings.QUOTA_TOKENS_PER_HOUR = 1000
+
+    async def run():
+        writer, reader = create_async_engines(db_url)
+        committed, gate = asyncio.Event(), asyncio.Event()
+
+        @asynccontextmanager
+        async def paused_session():
+            # 提交后、flush 清空 _flushing 之前停住
+            async with async_sessionmaker(writer)() as db:
+                yield db
+            committed.set()
+            await gate.wait()
+
+        ledger = UsageLedger(paused_session, async_sessionmaker(reader))
+        try:
+            ledger.charge(1, tokens=1000)
+            try:
+                await ledger.check(1, TOKENS)
+                at_limit = None
+            except QuotaExceeded as e:
+                at_limit = e.used
+
+            flush = asyncio.create_task(ledger.flush())
+            await committed.wait()
+            ledger._snapshots.clear()
+            usage = asyncio.create_task(ledger.usage(1))
+            await asyncio.sleep(0.05)
+            waiting = not usage.done()
+            gate.set()
+            await flush
+            return at_limit, waiting, (await usage)[TOKENS]["hour"]
+        finally:
+            await writer.dispose()
+            await reader.dispose()
+
+    try:
+        at_limit, waiting, during_flush = asyncio.run(run())
+    finally:
+        settings.QUOTA_TOKENS_PER_HOUR = saved
+    ok = at_limit == 1000 and waiting and during_flush == 1000
+    print_result(ok, "At-limit rejected, in-flight rows counted once",
+                 f"at_limit={at_limit}, waited={waiting}, usage={during_flush}")
+    assert ok
+
+
+def test_rolling_windows(db_url):
+    """上一小时按比例计入小时窗口；超过 24 小时的桶不计入天窗口"""
+    print_test_header("Rolling Windows")
+    current = hour_bucket(datetime.utcnow())
+    with create_engine(db_url).begin() as conn:
+        conn.execute(insert(UsageHourly), [
+            {"user_id": 1, "bucket": current, "tokens": 100, "tts_chars": 0},
+            {"user_id": 1, "bucket": current - timedelta(hours=1), "tokens": 1000, "tts_chars": 0},
+            {"user_id": 1, "bucket": current - timedelta(hours=10), "tokens": 5000, "tts_chars": 0},
+            {"user_id": 1, "bucket": current - timedelta(hours=30), "tokens": 90000, "tts_chars": 0},
+        ])
+
+    async def run():
+        writer, reader = create_async_engines(db_url)
+        ledger = UsageLedger(async_sessionmaker(writer), async_sessionmaker(reader))
+        try:
+            return await ledger.usage(1)
+        finally:
+            await writer.dispose()
+            await reader.dispose()
+
+    now = datetime.utcnow()
+    weight = 1 - (now - hour_bucket(now)).total_seconds() / 3600
+    usage = asyncio.run(run())[TOKENS]
+    ok = abs(usage["hour"] - (100 + 1000 * weight)) <= 2 and usage["day"] == 6100
+    print_result(ok, "Hour window weighted, day window excludes 30h-old bucket", f"usage={usage}")
+    assert ok
+
+
+def test_enforce_quota_returns_429():
+    print_test_header("Quota exceeded maps to 429")
+    original = usage_quota.usage_ledger
+
+    class Exhausted:
+        async def check(self, user_id, resource, cost=0):
+            raise QuotaExceeded(resource, "day", 10, 5, retry_after=120)
+
+    usage_quota.usage_ledger = Exhausted()
+    try:
+        asyncio.run(enforce_quota(1, TOKENS))
+        error = None
+    except HTTPException as e:
+        error = e
+    finally:
+        usage_quota.usage_ledger = original
+    ok = error is not None and error.status_code == 429 and error.headers == {"Retry-After": "120"}
+    print_result(ok, "429 with Retry-After", f"{error and error.detail}")
+    assert ok
+
+
+def test_usage_tokens():
+    print_test_header("Actual usage preferred over estimate")
+    actual = usage_tokens(SimpleNamespace(total_tokens=321), 3000, 300)
+    estimated = usage_tokens(None, 3000, 300, images=1)
+    ok = actual == 321 and estimated == estimate_tokens(3000, 300) + settings.QUOTA_IMAGE_TOKENS
+    print_result(ok, "usage.total_tokens used when present", f"actual={actual}, estimated={estimated}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_charge_check_and_flush,
+        test_limit_boundary_and_inflight_flush,
+        test_rolling_windows,
+        test_enforce_quota_returns_429,
+        test_usage_tokens,
+    ]
+    sys.exit(1 if run_tests(tests) else 0)
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+看板统计汇总表 (user_stats) 测试 - 使用临时 SQLite 文件
+
+增量更新的结果必须与从明细表全量重算的结果一致。
+
+运行: python test_user_stats.py (或 python -m pytest test_user_stats.py)
+"""
+import asyncio
+import random
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, delete, event, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.api.learning import LearningEvent, track_learning_event
+from app.database import create_async_engines
+from app.models import ActivityDaily, ActivityHourly, ChatMessage, ChatSession, LearningRecord, User, UserStats
+from app.config import settings
+from app.services.activity_rollups import (
+    activity_histogram, aggregate, question_categories, quiz_trend, rebuild_activity_rollups
+)
+from app.services import user_stats
+from app.services.user_stats import (
+    bump_user_stats, get_user_stats, rebuild_user_stats, record_learning_event, record_learning_events
+)
+from conftest import run_tests
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+def add_users(url: str, users: int) -> str:
+    with create_engine(url).begin() as conn:
+        conn.execute(insert(User), [{"id": i, "username": f"u{i}", "email": f"u{i}@example.com"}
+                                    for i in range(1, users + 1)])
+    return url
+
+
+def snapshot(url: str) -> dict:
+    with create_engine(url).connect() as conn:
+        return {row.user_id: tuple(row[1:6]) for row in conn.execute(select(
+            UserStats.user_id, UserStats.login_count, UserStats.question_count,
+            UserStats.quiz_sum, UserStats.quiz_count, UserStats.last_analysis_id
+        ))}
+
+
+def rollup_snapshot(url: str) -> dict:
+    with create_engine(url).connect() as conn:
+        return {
+            model.__tablename__: sorted(tuple(row) for row in conn.execute(select(model.__table__)))
+            for model in (ActivityHourly, ActivityDaily)
+        }
+
+
+async def simulate(url: str, users: int, events: int):
+    """按 API 中的写法随机产生登录、测验、提问、分析、删除会话等事件"""
+    writer, _ = create_async_engines(url)
+    sessions = {uid: [] for uid in range(1, users + 1)}
+    rng = random.Random(42)
+    try:
+        for i in range(events):
+            uid = rng.randint(1, users)
+            kind = rng.choice(["login", "quiz", "quiz_no_score", "question", "analysis", "delete", "page_view"])
+            async with AsyncSession(writer, expire_on_commit=False) as db:
+                if kind in ("question", "delete"):
+                    # 与 save_session_and_message 一样，提问同时记录一条带分类的学习事件
+                    await record_learning_event(db, LearningRecord(user_id=uid, event_type="question_asked",
+                                                                   category=rng.choice(["casual", "professional"])))
+                if kind == "login":
+                    await record_learning_event(db, LearningRecord(user_id=uid, event_type="login"))
+                elif kind == "quiz":
+                    await record_learning_event(db, LearningRecord(user_id=uid, event_type="quiz_result",
+                                                                   score=rng.randint(0, 100)))
+                elif kind == "quiz_no_score":
+                    await record_learning_event(db, LearningRecord(user_id=uid, event_type="quiz_result"))
+                elif kind == "page_view":
+                    await record_learning_event(db, LearningRecord(user_id=uid, event_type="page_view"))
+                elif kind == "analysis":
+                    await record_learning_event(db, LearningRecord(user_id=uid, event_type="ai_analysis",
+                                                                   content=f"analysis {i}"))
+                elif kind == "question":
+                    if not sessions[uid] or rng.random() < 0.3:
+                        sess_id = f"s{i}"
+                        db.add(ChatSession(id=sess_id, user_id=uid, title="t"))
+                        sessions[uid].append(sess_id)
+                    sess_id = rng.choice(sessions[uid])
+                    db.add(ChatMessage(session_id=sess_id, role="user", content="q"))
+                    db.add(ChatMessage(session_id=sess_id, role="assistant", content="a"))
+                    await bump_user_stats(db, uid, questions=1)
+                elif kind == "delete" and sessions[uid]:
+                    sess_id = sessions[uid].pop(rng.randrange(len(sessions[uid])))
+                    count = len((await db.execute(select(ChatMessage.id).filter(
+                        ChatMessage.session_id == sess_id, ChatMessage.role == "user"
+                    ))).all())
+                    await bump_user_stats(db, uid, questions=-count)
+                    # 与 delete_session 一样只做标记，部分会话随后被清理任务删除
+                    sess = await db.get(ChatSession, sess_id)
+                    sess.deleted_at = datetime.utcnow()
+                    if rng.random() < 0.5:
+                        await db.execute(delete(ChatMessage).filter(ChatMessage.session_id == sess_id))
+                        await db.delete(sess)
+                await db.commit()
+    finally:
+        await writer.dispose()
+
+
+def test_incremental_matches_rebuild(db_url):
+    """随机事件序列后，增量维护的统计与全量重算完全一致"""
+    print_test_header("Incremental Stats Match Rebuild")
+    url = add_users(db_url, users=5)
+    asyncio.run(simulate(url, users=5, events=300))
+    incremental, incremental_rollups = snapshot(url), rollup_snapshot(url)
+
+    db = sessionmaker(bind=create_engine(url))()
+    try:
+        rebuild_user_stats(db)
+        rebuild_activity_rollups(db)
+    finally:
+        db.close()
+    rebuilt = snapshot(url)
+
+    ok = incremental == rebuilt and incremental_rollups == rollup_snapshot(url)
+    print_result(ok, "Incremental equals rebuild", f"incremental={incremental}\nrebuilt={rebuilt}" if not ok else "")
+    assert ok
+
+
+def test_rollup_rebuild_per_user(db_url):
+    """重算逐个用户读取事件；单用户重算不动其他用户，全量重算清掉没有事件的用户留下的桶"""
+    print_test_header("Rollup Rebuild Per User")
+    url = add_users(db_url, users=5)
+    asyncio.run(simulate(url, users=5, events=200))
+    expected = rollup_snapshot(url)
+
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(delete(ActivityHourly).filter(ActivityHourly.user_id.in_([1, 2])))
+        conn.execute(delete(ActivityDaily).filter(ActivityDaily.user_id.in_([1, 2])))
+        conn.execute(insert(ActivityDaily), {"user_id": 99, "bucket": datetime(2024, 1, 1), "event_type": "login",
+                                             "category": "", "event_count": 1, "score_sum": 0, "score_count": 0})
+
+    queries = []
+
+    def record(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    db = sessionmaker(bind=engine)()
+    try:
+        single = rebuild_activity_rollups(db, user_id=1)
+        after_single = rollup_snapshot(url)
+        event.listen(engine, "before_cursor_execute", record)
+        full = rebuild_activity_rollups(db)
+    finally:
+        db.close()
+        event.remove(engine, "before_cursor_execute", record)
+
+    def users(snap):
+        return sorted({row[0] for row in snap["activity_daily"]})
+
+    # 每个用户各有一条按 user_id 过滤的明细查询
+    per_user_reads = [q for q in queries if q.lstrip().startswith("SELECT") and "FROM learning_records" in q
+                      and "DISTINCT" not in q]
+    ok = (
+        single == 1
+        and users(after_single) == [1, 3, 4, 5, 99]
+        and full == 5 and len(per_user_reads) == 5
+        and rollup_snapshot(url) == expected
+    )
+    print_result(ok, "Rollups rebuilt user by user", f"single={single}, full={full}, reads={len(per_user_reads)}")
+    assert ok
+
+
+def test_dashboard_reads_single_row(db_url):
+    """看板读取：平均分、最新分析内容来自汇总表"""
+    print_test_header("Dashboard Stats Read")
+    url = add_users(db_url, users=2)
+
+    async def run():
+        writer, reader = create_async_engines(url)
+        try:
+            async with AsyncSession(writer) as db:
+                for score in (60, 90):
+                    await record_learning_event(db, LearningRecord(user_id=1, event_type="quiz_result", score=score))
+                await record_learning_event(db, LearningRecord(user_id=1, event_type="ai_analysis", content="old"))
+                await record_learning_event(db, LearningRecord(user_id=1, event_type="ai_analysis", content="new"))
+                await db.commit()
+            async with AsyncSession(reader) as db:
+                return await get_user_stats(db, 1), await get_user_stats(db, 2)
+        finally:
+            await writer.dispose()
+            await reader.dispose()
+
+    stats, empty = asyncio.run(run())
+    ok = stats["quiz_average"] == 75 and stats["analysis"] == "new" and empty["questions"] == 0
+    print_result(ok, "Stats read from user_stats", f"stats={stats}, empty={empty}")
+    assert ok
+
+
+def test_login_keeps_analysis_fresh(db_url):
+    """登录不进入分析 Prompt，不会让缓存的分析失效；新的测验结果会"""
+    print_test_header("Login Keeps Analysis Fresh")
+    url = add_users(db_url, users=1)
+
+    async def run():
+        writer, _ = create_async_engines(url)
+        fresh = []
+        try:
+            async with AsyncSession(writer) as db:
+                await bump_user_stats(db, 1, questions=1)
+                version = (await get_user_stats(db, 1))["data_version"]
+                await record_learning_event(db, LearningRecord(user_id=1, event_type="ai_analysis", content="report"),
+                                            analysis_version=version)
+                fresh.append((await get_user_stats(db, 1))["analysis_fresh"])
+                await record_learning_event(db, LearningRecord(user_id=1, event_type="login"))
+                await record_learning_events(db, 1, [{"event_type": "login"}, {"event_type": "page_view"}])
+                stats = await get_user_stats(db, 1)
+                fresh.append(stats["analysis_fresh"])
+                await record_learning_event(db, LearningRecord(user_id=1, event_type="quiz_result", score=70))
+                fresh.append((await get_user_stats(db, 1))["analysis_fresh"])
+                await db.commit()
+            return fresh, stats
+        finally:
+            await writer.dispose()
+
+    fresh, stats = asyncio.run(run())
+    ok = fresh == [True, True, False] and stats["logins"] == 2
+    print_result(ok, "Logins counted without invalidating the analysis", f"fresh={fresh}, logins={stats['logins']}")
+    assert ok
+
+
+def test_batch_ingestion_dedup(db_url):
+    """批量写入：批内和跨批的重复 client_event_id 只记录一次，统计与全量重算一致"""
+    print_test_header("Batch Ingestion Dedup")
+    url = add_users(db_url, users=1)
+    first = [
+        {"event_type": "page_view", "client_event_id": "a"},
+        {"event_type": "quiz_result", "score": 80, "client_event_id": "b"},
+        {"event_type": "quiz_result", "score": 80, "client_event_id": "b"},  # 批内重复
+        {"event_type": "login"},
+        {"event_type": "quiz_result", "score": 40},
+    ]
+    retry = [
+        {"event_type": "quiz_result", "score": 80, "client_event_id": "b"},  # 重试已入库的事件
+        {"event_type": "quiz_result", "score": 100, "client_event_id": "c"},
+    ]
+
+    async def run():
+        writer, _ = create_async_engines(url)
+        try:
+            results = []
+            for batch in (first, retry):
+                async with AsyncSession(writer) as db:
+                    results.append(await record_learning_events(db, 1, batch))
+                    await db.commit()
+            return results
+        finally:
+            await writer.dispose()
+
+    results = asyncio.run(run())
+    incremental = snapshot(url)
+    db = sessionmaker(bind=create_engine(url))()
+    try:
+        rebuild_user_stats(db)
+    finally:
+        db.close()
+
+    ok = results == [(4, 1), (1, 1)] and incremental == snapshot(url) and incremental[1][2:4] == (220, 3)
+    print_result(ok, "Duplicates skipped", f"results={results}, stats={incremental}")
+    assert ok
+
+
+async def racing(url: str, concurrent):
+    """
+    模拟两个 worker 的并发重试：本请求完成去重检查之后、INSERT 之前，
+    另一个 worker (独立的引擎) 先跑完 concurrent(db) 并提交
+    """
+    original = user_stats._insert_new_rows
+    other_writer, _ = create_async_engines(url)
+
+    async def insert_after_concurrent(db, rows):
+        user_stats._insert_new_rows = original
+        async with AsyncSession(other_writer) as other:
+            await concurrent(other)
+            await other.commit()
+        return await original(db, rows)
+
+    user_stats._insert_new_rows = insert_after_concurrent
+    return original, other_writer
+
+
+def test_concurrent_retry_counts_inserted_rows(db_url):
+    """并发重试被唯一索引跳过的事件不计入统计和活动汇总；/track 的并发重试返回已有记录而不是 500"""
+    print_test_header("Concurrent Retry Counts Inserted Rows")
+    url = add_users(db_url, users=1)
+    quiz = {"event_type": "quiz_result", "score": 80, "client_event_id": "q1"}
+
+    async def run():
+        writer, _ = create_async_engines(url)
+        results = {}
+        try:
+            original, other = await racing(url, lambda db: record_learning_events(db, 1, [quiz]))
+            try:
+                async with AsyncSession(writer) as db:
+                    results["batch"] = await record_learning_events(db, 1, [quiz, {"event_type": "login"}])
+                    await db.commit()
+            finally:
+                user_stats._insert_new_rows = original
+                await other.dispose()
+
+            event = LearningEvent(event_type="page_view", client_event_id="p1")
+            token = {"sub": "1"}
+
+            async def concurrent_track(db):
+                results["first"] = await track_learning_event(event, token=token, db=db)
+
+            original, other = await racing(url, concurrent_track)
+            try:
+                async with AsyncSession(writer) as db:
+                    results["retry"] = await track_learning_event(event, token=token, db=db)
+            finally:
+                user_stats._insert_new_rows = original
+                await other.dispose()
+        finally:
+            await writer.dispose()
+        return results
+
+    results = asyncio.run(run())
+    incremental, incremental_rollups = snapshot(url), rollup_snapshot(url)
+    db = sessionmaker(bind=create_engine(url))()
+    try:
+        rebuild_user_stats(db)
+        rebuild_activity_rollups(db)
+    finally:
+        db.close()
+    ok = (
+        results["batch"] == (1, 1)
+        # 测验只被另一个 worker 记录了一次 (登录次数, 测验总分, 测验次数)
+        and (incremental[1][0], *incremental[1][2:4]) == (1, 80, 1)
+        and incremental == snapshot(url) and incremental_rollups == rollup_snapshot(url)
+        and results["retry"] == {"status": "success", "id": results["first"]["id"], "duplicate": True}
+    )
+    print_result(ok, "Only inserted rows counted", f"results={results}, stats={incremental}")
+    assert ok
+
+
+def test_activity_analytics(db_url):
+    """图表接口：日 / 周直方图、测验趋势、提问分类都来自汇总表"""
+    print_test_header("Activity Analytics")
+    url = add_users(db_url, users=1)
+
+    async def run():
+        writer, reader = create_async_engines(url)
+        try:
+            async with AsyncSession(writer) as db:
+                await record_learning_events(db, 1, [
+                    {"event_type": "login"},
+                    {"event_type": "quiz_result", "score": 70},
+                    {"event_type": "quiz_result", "score": 90},
+                    {"event_type": "question_asked", "category": "professional"},
+                    {"event_type": "question_asked", "category": "professional"},
+                    {"event_type": "question_asked"},
+                ])
+                await db.commit()
+            async with AsyncSession(reader) as db:
+                return (
+                    await activity_histogram(db, 1, "day", 7),
+                    await activity_histogram(db, 1, "week", 14),
+                    await quiz_trend(db, 1, "day", 7),
+                    await question_categories(db, 1, 30),
+                )
+        finally:
+            await writer.dispose()
+            await reader.dispose()
+
+    days, weeks, trend, categories = asyncio.run(run())
+    ok = (
+        len(days) == 7 and days[-1]["counts"] == {"login": 1, "quiz_result": 2, "question_asked": 3}
+        and not any(d["counts"] for d in days[:-1])
+        and weeks[-1]["counts"]["question_asked"] == 3
+        and trend[-1] == {"start": trend[-1]["start"], "count": 2, "average": 80.0} and trend[0]["average"] is None
+        and categories == [{"category": "professional", "count": 2}, {"category": "other", "count": 1}]
+    )
+    print_result(ok, "Histograms served from rollups", f"today={days[-1]}, trend={trend[-1]}, categories={categories}")
+    assert ok
+
+
+def test_hourly_buckets_use_analytics_timezone(db_url):
+    """小时桶与天桶使用同一时区：非整点时差下小时桶和标签都是本地整点"""
+    print_test_header("Hourly Buckets Use Analytics Time Zone")
+    url = add_users(db_url, users=1)
+    original = settings.ANALYTICS_TZ_OFFSET_MINUTES
+    settings.ANALYTICS_TZ_OFFSET_MINUTES = 330
+
+    async def run():
+        writer, reader = create_async_engines(url)
+        try:
+            async with AsyncSession(writer) as db:
+                await record_learning_events(db, 1, [{"event_type": "login"}])
+                await db.commit()
+            async with AsyncSession(reader) as db:
+                return await activity_histogram(db, 1, "hour", 1)
+        finally:
+            await writer.dispose()
+            await reader.dispose()
+
+    try:
+        # 00:10 UTC 在 +05:30 下是 05:40，应落在本地 05:00 的小时桶和当天的天桶
+        hourly, daily = aggregate(1, [("login", None, None, datetime(2026, 1, 1, 0, 10))])
+        hours = asyncio.run(run())
+        local_now = datetime.utcnow() + timedelta(minutes=330)
+    finally:
+        settings.ANALYTICS_TZ_OFFSET_MINUTES = original
+
+    ok = (
+        hourly[0]["bucket"] == datetime(2026, 1, 1, 5) and daily[0]["bucket"] == datetime(2026, 1, 1)
+        and len(hours) == 24 and hours[-1]["counts"] == {"login": 1}
+        and hours[-1]["start"] == local_now.strftime("%Y-%m-%d %H:00")
+    )
+    print_result(ok, "Hourly bucket and label in local time", f"hourly={hourly}, last={hours[-1]}")
+    assert ok
+
+
+if __name__ == "__main__":
+    tests = [
+        test_incremental_matches_rebuild,
+        test_rollup_rebuild_per_user,
+        test_dashboard_reads_single_row,
+        test_login_keeps_analysis_fresh,
+        test_batch_ingestion_dedup,
+        test_concurrent_retry_counts_inserted_rows,
+        test_activity_analytics,
+        test_hourly_buckets_use_analytics_timezone,
+    ]
+    sys.exit(1 if run_tests(tests) else 0)
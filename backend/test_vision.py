@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+视觉模块延迟加载测试
+
+- 导入 app.main 不会导入 cv2 / mediapipe / aliyunsdkcore
+- 后台加载期间 status 为 loading，加载前收到的视频帧被忽略，加载完成后为 enabled
+- VISION_ENABLED = False 时不加载，status 为 disabled
+
+运行: python test_vision.py (或 python -m pytest test_vision.py)
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+
+from app.config import settings
+from app.services import vision as vision_module
+from app.services.vision import VISION_DISABLED, VISION_ENABLED, VISION_LOADING, VisionStack
+
+
+def print_test_header(test_name: str):
+    print(f"\n{'='*60}")
+    print(f"TEST: {test_name}")
+    print(f"{'='*60}")
+
+
+def print_result(success: bool, message: str, details: str = ""):
+    status = "✅ PASS" if success else "❌ FAIL"
+    print(f"{status}: {message}")
+    if details:
+        print(f"Details: {details}")
+
+
+class FakeRecognizer:
+    is_ready = True
+
+    def process_frame(self, base64_image):
+        return ["Thumb_Up"]
+
+
+def test_import_is_lightweight():
+    print_test_header("Importing the app does not load the vision stack")
+    script = ("import sys, app.main; "
+              "print(','.join(m for m in ('cv2', 'mediapipe', 'aliyunsdkcore') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    loaded = result.stdout.strip().splitlines()[-1] if result.stdout.strip() else ""
+    success = result.returncode == 0 and loaded == ""
+    print_result(success, "heavy modules not imported", f"loaded={loaded!r} rc={result.returncode}")
+    assert success, result.stderr
+
+
+def test_background_load():
+    print_test_header("Background load: loading -> enabled")
+    release = threading.Event()
+
+    def slow_build():
+        release.wait(5)
+        return FakeRecognizer()
+
+    original = vision_module._build_recognizer
+    vision_module._build_recognizer = slow_build
+
+    async def run():
+        stack = VisionStack()
+        assert stack.status == VISION_DISABLED
+        stack.start()
+        await asyncio.sleep(0.05)
+        loading = stack.status
+        early = await stack.process_frame("frame")
+        release.set()
+        ready = await stack.wait_ready(timeout=5)
+        gestures = await stack.process_frame("frame")
+        return loading, early, ready, stack.status, gestures
+
+    try:
+        loading, early, ready, status, gestures = asyncio.run(run())
+    finally:
+        vision_module._build_recognizer = original
+    success = (loading == VISION_LOADING and early is None and ready
+               and status == VISION_ENABLED and gestures == ["Thumb_Up"])
+    print_result(success, "frames ignored until ready", f"{loading} -> {status}, gestures={gestures}")
+    assert success
+
+
+def test_disabled():
+    print_test_header("VISION_ENABLED = False")
+    original = settings.VISION_ENABLED
+    settings.VISION_ENABLED = False
+
+    async def run():
+        stack = VisionStack()
+        stack.start()
+        return stack.status, await stack.wait_ready(timeout=1)
+
+    try:
+        status, ready = asyncio.run(run())
+    finally:
+        settings.VISION_ENABLED = original
+    success = status == VISION_DISABLED and not ready
+    print_result(success, "vision stack not loaded", f"status={status}")
+    assert success
+
+
+if __name__ == "__main__":
+    tests = [
+        test_import_is_lightweight,
+        test_background_load,
+        test_disabled,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except AssertionError:
+            failed += 1
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    sys.exit(1 if failed else 0)
@@ -57,6 +57,8 @@ export default {
     });
   },
   register: (userData) => api.post('/auth/register', userData),
+  // 服务端吊销当前 Token，调用方随后清除本地 Token
+  logout: () => api.post('/auth/logout'),
 
   // --- 聊天相关 ---
   sendMessage: (data) => api.post('/api/chat', data),
@@ -142,8 +144,14 @@ export default {
     }
   },
 
-  getSessions: (mode = 'casual') => api.get(`/api/sessions?mode=${mode}`),
-  getMessages: (sessionId) => api.get(`/api/messages/${sessionId}`),
+  // 列表接口为游标分页：返回 { items, next_cursor }，把 next_cursor 传回即可取下一页
+  getSessions: (mode = 'casual', cursor = null) =>
+    api.get('/api/sessions', { params: { mode, cursor: cursor || undefined } }),
+  // 第一页为最新的消息，next_cursor 指向更早的消息
+  getMessages: (sessionId, cursor = null) =>
+    api.get(`/api/messages/${sessionId}`, { params: { cursor: cursor || undefined } }),
+  // 搜索聊天记录：返回 { items, next_offset }
+  searchMessages: (q, offset = 0) => api.get('/api/search', { params: { q, offset } }),
   deleteSession: (sessionId) => api.delete(`/api/sessions/${sessionId}`),
   
   // --- 文件上传 ---
@@ -168,6 +176,66 @@ export default {
 
   // --- Learning Dashboard ---
   getDashboardData: () => api.get('/api/learning/dashboard'),
+  // 活动统计图表：granularity 为 hour / day / week
+  getActivity: (granularity = 'day', days = 30) =>
+    api.get('/api/learning/analytics/activity', { params: { granularity, days } }),
+  getQuizTrend: (granularity = 'week', days = 90) =>
+    api.get('/api/learning/analytics/quiz-trend', { params: { granularity, days } }),
+  getQuestionCategories: (days = 30) =>
+    api.get('/api/learning/analytics/questions', { params: { days } }),
+  // 提交分析任务：数据没变化时直接返回缓存的报告 { cached: true, analysis }，否则返回 { job_id, status }
   analyzeLearning: () => api.post('/api/learning/analyze'),
-  trackEvent: (data) => api.post('/api/learning/track', data)
+  getAnalysisJob: (jobId) => api.get(`/api/learning/analyze/${jobId}`),
+
+  /**
+   * 订阅分析任务的生成过程 (SSE，事件格式与 streamChat 相同)
+   */
+  streamAnalysis: async (jobId, onMessage, onDone, onError) => {
+    const token = localStorage.getItem('access_token');
+
+    try {
+      const response = await fetch(`${API_BASE_URL}/api/learning/analyze/${jobId}/stream`, {
+        headers: { 'Authorization': `Bearer ${token}` }
+      });
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n\n');
+        buffer = lines.pop();
+
+        for (const line of lines) {
+          if (!line.trim().startsWith('data:')) continue;
+          const jsonStr = line.substring(line.indexOf('data:') + 5).trim();
+          if (!jsonStr) continue;
+          try {
+            const eventData = JSON.parse(jsonStr);
+            if (eventData.event === 'message') {
+              onMessage(eventData.answer);
+            } else if (eventData.event === 'done') {
+              if (onDone) onDone();
+            } else if (eventData.event === 'error') {
+              if (onError) onError(eventData.message);
+            }
+          } catch (e) {
+            console.warn('Failed to parse SSE event:', e, line);
+          }
+        }
+      }
+    } catch (error) {
+      if (onError) onError(error);
+    }
+  },
+
+  trackEvent: (data) => api.post('/api/learning/track', data),
+  // 批量上报埋点事件；每个事件可带 client_event_id，重试时不会重复记录
+  trackEvents: (events) => api.post('/api/learning/track/batch', events)
 }
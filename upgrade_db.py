@@ -1,32 +1,19 @@
-import sqlite3
 import os
+import sys
+
+# 数据库结构已改由 Alembic 管理 (backend/migrations)，本脚本保留为快捷入口，
+# 等价于在 backend 目录执行: alembic upgrade head
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
 
-DB_FILE = "./backend/ai_chat.db"
 
 def upgrade_db():
-    if not os.path.exists(DB_FILE):
-        print("Database file not found. It will be created on first run.")
-        return
+    # DATABASE_URL 默认是相对路径 sqlite:///./ai_chat.db，需要在 backend 目录下执行
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+    from app.database import run_migrations
 
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Check if 'mode' column exists in chat_sessions
-    cursor.execute("PRAGMA table_info(chat_sessions)")
-    columns = [info[1] for info in cursor.fetchall()]
-    
-    if 'mode' not in columns:
-        print("Adding 'mode' column to chat_sessions...")
-        try:
-            cursor.execute("ALTER TABLE chat_sessions ADD COLUMN mode TEXT DEFAULT 'casual'")
-            conn.commit()
-            print("Column added successfully.")
-        except Exception as e:
-            print(f"Error adding column: {e}")
-    else:
-        print("'mode' column already exists.")
-        
-    conn.close()
+    run_migrations()
+    print("Database upgraded to the latest migration.")
 
 if __name__ == "__main__":
     upgrade_db()